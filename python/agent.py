@@ -0,0 +1,553 @@
+# agent.py
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import platform
+import datetime
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import psutil
+import job as job_module
+from job import Job
+from content_store import ContentStore
+from git_cache import git_cache
+from workspace_pool import workspace_pool
+
+
+def _log(message):
+    print(f"[{datetime.datetime.utcnow().isoformat()}] {message}", file=sys.stderr)
+
+
+class ServerError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        # HTTP status, None when the server could not be reached
+        self.status = status
+
+    @property
+    def transient(self):
+        return self.status is None or self.status >= 500
+
+
+class ServerClient:
+    """JSON requests to the build server, retried while it is unreachable."""
+
+    def __init__(self, url, token=None, timeout=60, retries=5):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.retries = retries
+
+    def request(self, method, path, body=None, query=None, upload=None, timeout=None):
+        """
+        One request; `body` is sent as JSON, `upload` is the path of a
+        file sent as is. Returns the decoded JSON reply, or None for an
+        empty one. Raises ServerError.
+        """
+        url = self.url + path
+        if query:
+            url += "?" + urllib.parse.urlencode(query)
+        headers = {}
+        if self.token:
+            headers["X-Agent-Token"] = self.token
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        elif upload is not None:
+            data = open(upload, "rb")
+            headers["Content-Type"] = "application/octet-stream"
+            headers["Content-Length"] = str(os.path.getsize(upload))
+        req = urllib.request.Request(url, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=timeout or self.timeout) as resp:
+                payload = resp.read()
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read())["error"]
+            except (ValueError, KeyError, TypeError):
+                message = e.reason
+            raise ServerError(f"{method} {path}: {message}", e.code)
+        except OSError as e:
+            raise ServerError(f"{method} {path}: {e}")
+        finally:
+            if upload is not None:
+                data.close()
+        return json.loads(payload) if payload else None
+
+    def call(self, method, path, **kwargs):
+        """`request`, retried with backoff on connection and server errors."""
+        delay = 1.0
+        for attempt in range(self.retries + 1):
+            try:
+                return self.request(method, path, **kwargs)
+            except ServerError as e:
+                if not e.transient or attempt == self.retries:
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+
+class RemoteTaskDB:
+    """
+    The task database calls a Job makes, forwarded to the server for
+    the job leased to this agent. Calls about a job the agent no longer
+    holds are dropped and the job is stopped.
+    """
+
+    def __init__(self, client, agent, store):
+        self.client = client
+        self.agent = agent
+        self.store = store
+
+    def _job_path(self, task_id):
+        return f"/agents/{self.agent.agent_id}/jobs/{task_id}"
+
+    def _forward(self, task_id, method, **kwargs):
+        try:
+            self.client.call(
+                "POST", self._job_path(task_id) + "/task",
+                body={"method": method, "kwargs": kwargs},
+            )
+        except ServerError as e:
+            if e.status not in (404, 409):
+                raise
+            self.agent.lost([task_id])
+
+    def update_task_status(self, task_id, status, started_at=None, finished_at=None):
+        if self.agent.handing_back(task_id):
+            # Stopped only to be queued again: the server sets its status
+            return
+        self._forward(
+            task_id, "update_task_status",
+            status=status, started_at=started_at, finished_at=finished_at,
+        )
+
+    def update_task_metadata(self, task_id, **fields):
+        self._forward(task_id, "update_task_metadata", **fields)
+
+    def set_task_resources(self, task_id, fields, interval, samples):
+        self._forward(
+            task_id, "set_task_resources",
+            fields=list(fields), interval=interval, samples=[list(s) for s in samples],
+        )
+
+    def set_task_artifact(self, task_id, digest, size, ingest_seconds=None,
+                          ingest_peak_rss=None):
+        """Upload the blob from the local store, unless the server has it already."""
+        path = self._job_path(task_id) + "/artifact"
+        query = {"digest": digest}
+        if ingest_seconds is not None:
+            query["ingest_seconds"] = ingest_seconds
+        if ingest_peak_rss is not None:
+            query["ingest_peak_rss"] = ingest_peak_rss
+        try:
+            if not self.client.call("POST", path, query=query)["stored"]:
+                self.client.call("PUT", path, query=query, upload=self.store.path(digest))
+        except ServerError as e:
+            if e.status not in (404, 409):
+                raise
+            self.agent.lost([task_id])
+        finally:
+            self.store.delete(digest)
+
+
+class RemoteLogWriter:
+    """
+    Log sink of the agent's jobs, used like db.log_writer.LogWriter:
+    lines are buffered and posted to the server in batches of up to
+    `batch_size` rows, at least every `flush_interval` seconds. A batch
+    the server cannot take is kept and sent again; past `max_pending`
+    buffered lines, add() blocks.
+    """
+
+    def __init__(self, client, agent, batch_size=1000, flush_interval=0.5,
+                 max_pending=100000):
+        self.client = client
+        self.agent = agent
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._buffer = []
+        self._cond = threading.Condition()
+        # Serializes swap + send so batches reach the server in order
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._failing = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, task_id, timestamp, line):
+        with self._cond:
+            while len(self._buffer) >= self.max_pending and not self._closed:
+                self._cond.wait()
+            self._buffer.append((task_id, timestamp, line))
+            depth = len(self._buffer)
+            if depth == 1 or depth >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self):
+        """
+        Send every line buffered so far before returning. Returns False
+        if the server could not take them; they stay buffered.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+                self._cond.notify_all()
+            for start in range(0, len(batch), self.batch_size):
+                if not self._send(batch[start:start + self.batch_size]):
+                    with self._cond:
+                        self._buffer[0:0] = batch[start:]
+                    return False
+        return True
+
+    def _send(self, rows):
+        try:
+            reply = self.client.request(
+                "POST", f"/agents/{self.agent.agent_id}/logs", body={"rows": rows}
+            )
+        except ServerError as e:
+            if e.status == 404:
+                # The server forgot this agent, and took its jobs back
+                self.agent.lost({row[0] for row in rows})
+                return True
+            if not self._failing:
+                _log(f"Sending logs failed, will retry: {e}")
+            self._failing = True
+            return False
+        self._failing = False
+        if reply["lost"]:
+            self.agent.lost(reply["lost"])
+        return True
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._closed and len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                break
+            if self._failing:
+                time.sleep(self.flush_interval)
+
+
+class _NoHub:
+    """Live log tails are kept by the server, fed from the posted lines."""
+
+    def open(self, task_id):
+        pass
+
+    def finish(self, task_id):
+        pass
+
+
+class WorkerAgent:
+    """
+    Runs jobs leased from the build server with the same Job code as the
+    server. Each of `workers` threads long-polls for a job while the
+    host is under the CPU, memory and disk limits (an idle agent always
+    asks); the server picks a job whose labels the agent has and whose
+    weight fits in `max_weight`. A heartbeat thread reports the running
+    jobs and stops those the server killed or took back. On shutdown,
+    running jobs are stopped and handed back to be queued again.
+    """
+
+    def __init__(self, client, name, labels=(), workers=1, max_weight=1.0, max_cpu=90.0,
+                 max_memory=90.0, max_disk=95.0, disk_path="/", lease_wait=20.0,
+                 admission_interval=5.0):
+        self.client = client
+        self.name = name
+        self.labels = sorted(set(labels) | {platform.machine()})
+        self.workers = max(1, workers)
+        self.max_weight = max_weight
+        self.max_cpu = max_cpu
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.disk_path = disk_path
+        self.lease_wait = lease_wait
+        self.admission_interval = admission_interval
+        self.agent_id = None
+        self.heartbeat_seconds = 5.0
+        self.jobs = {}
+        # Jobs stopped because the agent is stopping, to be handed back
+        self._returning = set()
+        self._stopping = set()
+        self._lock = threading.Lock()
+        self._register_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def capabilities(self):
+        return {
+            "max_weight": self.max_weight,
+            "workers": self.workers,
+            "cpus": psutil.cpu_count(),
+            "memory_bytes": psutil.virtual_memory().total,
+            "arch": platform.machine(),
+            "git_cache": git_cache is not None,
+            "workspace_pool": workspace_pool is not None,
+        }
+
+    def register(self, stale_id=None):
+        """
+        Register with the server, retrying until it answers. With
+        `stale_id`, only if no other thread re-registered since.
+        """
+        with self._register_lock:
+            if stale_id is not None and self.agent_id != stale_id:
+                return
+            delay = 1.0
+            while not self._stop.is_set():
+                try:
+                    reply = self.client.request(
+                        "POST", "/agents/register",
+                        body={
+                            "name": self.name,
+                            "labels": self.labels,
+                            "capabilities": self.capabilities(),
+                        },
+                    )
+                    break
+                except ServerError as e:
+                    _log(f"Registration failed, will retry: {e}")
+                self._stop.wait(delay)
+                delay = min(delay * 2, 30)
+            else:
+                return
+            self.agent_id = reply["agent_id"]
+            self.heartbeat_seconds = reply["heartbeat_seconds"]
+            _log(f"Registered as {self.name} ({self.agent_id}), labels {', '.join(self.labels)}")
+
+    def load(self):
+        return {
+            "cpu_percent": psutil.cpu_percent(),
+            "memory_percent": psutil.virtual_memory().percent,
+            "disk_percent": psutil.disk_usage(self.disk_path).percent,
+        }
+
+    def _pressure(self):
+        """The limit the host is over, or None; an idle agent is never over."""
+        if not self.jobs:
+            return None
+        load = self.load()
+        if load["cpu_percent"] >= self.max_cpu:
+            return "cpu"
+        if load["memory_percent"] >= self.max_memory:
+            return "memory"
+        if load["disk_percent"] >= self.max_disk:
+            return "disk"
+        return None
+
+    def handing_back(self, job_id):
+        """Whether the job is being stopped to be handed back to the server."""
+        with self._lock:
+            return job_id in self._returning
+
+    def _stop_job(self, job, reason):
+        with self._lock:
+            if job.id in self._stopping:
+                return
+            self._stopping.add(job.id)
+        job_module.log_writer.add(job.id, datetime.datetime.utcnow().isoformat(), reason)
+        try:
+            job.kill()
+        except (ProcessLookupError, ServerError) as e:
+            _log(f"Stopping job {job.id}: {e}")
+
+    def lost(self, job_ids):
+        """
+        Stop jobs the server no longer leases to this agent. Called from
+        the log writer and task calls, so the jobs are stopped on another
+        thread: killing a job flushes its log.
+        """
+        with self._lock:
+            jobs = [self.jobs[i] for i in job_ids if i in self.jobs]
+        for job in jobs:
+            if job.status == Job.STATUS_RUNNING and job.id not in self._stopping:
+                _log(f"Lease on job {job.id} lost, stopping it")
+                threading.Thread(
+                    target=self._stop_job,
+                    args=(job, "Job taken back by the server, stopping"),
+                    daemon=True,
+                ).start()
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            agent_id = self.agent_id
+            with self._lock:
+                running = list(self.jobs)
+            try:
+                reply = self.client.request(
+                    "POST", f"/agents/{agent_id}/heartbeat",
+                    body={"running": running, "load": self.load()},
+                )
+            except ServerError as e:
+                if e.status == 404:
+                    _log("Unknown to the server (restarted, or took this agent for lost)")
+                    self.lost(running)
+                    self.register(agent_id)
+                else:
+                    _log(f"Heartbeat failed: {e}")
+                continue
+            with self._lock:
+                cancel = [self.jobs[i] for i in reply["cancel"] if i in self.jobs]
+            for job in cancel:
+                if job.status == Job.STATUS_RUNNING:
+                    self._stop_job(job, "Kill requested on the server")
+
+    def _work(self):
+        while not self._stop.is_set():
+            limit = self._pressure()
+            if limit is not None:
+                self._stop.wait(self.admission_interval)
+                continue
+            agent_id = self.agent_id
+            try:
+                payload = self.client.request(
+                    "POST", f"/agents/{agent_id}/lease",
+                    body={"wait": self.lease_wait}, timeout=self.lease_wait + 30,
+                )
+            except ServerError as e:
+                if e.status == 404:
+                    self.register(agent_id)
+                else:
+                    _log(f"Lease request failed: {e}")
+                    self._stop.wait(self.admission_interval)
+                continue
+            if payload is not None:
+                self._run(payload)
+
+    def _run(self, payload):
+        job = Job(
+            payload["git_uri"],
+            weight=payload["weight"],
+            use_workspace=payload["use_workspace"],
+            commit=payload["commit"],
+            collapse_progress=payload["collapse_progress"],
+            priority=payload["priority"],
+            submitter=payload["submitter"],
+            labels=payload["labels"],
+            task_id=payload["id"],
+        )
+        job.created_at = payload["created_at"]
+        job.timeout = payload["timeout"]
+        with self._lock:
+            self.jobs[job.id] = job
+            if self._stop.is_set():
+                # Leased while stopping
+                self._returning.add(job.id)
+        _log(f"Running job {job.id} ({job.git_uri}), attempt {payload['attempt']}")
+        crashed = False
+        try:
+            if job.id not in self._returning:
+                job.run()
+        except Exception as e:
+            crashed = True
+            _log(f"Job {job.id} failed on the agent: {e}")
+        finally:
+            # Lines still buffered once the lease ends would be dropped
+            delay = 1.0
+            while not job_module.log_writer.flush() and delay <= 30:
+                time.sleep(delay)
+                delay *= 2
+            with self._lock:
+                del self.jobs[job.id]
+                returning = job.id in self._returning
+                self._returning.discard(job.id)
+                self._stopping.discard(job.id)
+            if returning:
+                status = Job.STATUS_QUEUED
+            elif crashed or job.status in (Job.STATUS_QUEUED, Job.STATUS_RUNNING):
+                status = Job.STATUS_FAILED
+            else:
+                status = job.status
+            try:
+                self.client.call(
+                    "POST", f"/agents/{self.agent_id}/jobs/{job.id}/done",
+                    body={"status": status, "finished_at": job.finished_at},
+                )
+            except ServerError as e:
+                if e.status not in (404, 409):
+                    _log(f"Reporting job {job.id} failed: {e}")
+            _log(f"Job {job.id} {status}")
+
+    def run(self):
+        self.register()
+        self._threads = [threading.Thread(target=self._heartbeat, daemon=True)] + [
+            threading.Thread(target=self._work, daemon=True, name=f"agent-worker-{i}")
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+        self._stop.wait()
+
+    def shutdown(self):
+        self._stop.set()
+        with self._lock:
+            # A job that already ended is reported as it ended
+            jobs = [
+                job for job in self.jobs.values()
+                if job.status in (Job.STATUS_QUEUED, Job.STATUS_RUNNING)
+            ]
+            self._returning.update(job.id for job in jobs)
+        for job in jobs:
+            self._stop_job(job, "Agent stopping, job handed back to the server")
+        for t in self._threads:
+            t.join()
+
+
+def main():
+    server = os.environ.get("AGENT_SERVER")
+    if not server:
+        print("AGENT_SERVER must be set to the build server URL", file=sys.stderr)
+        sys.exit(2)
+    client = ServerClient(server, token=os.environ.get("AGENT_TOKEN") or None)
+    agent = WorkerAgent(
+        client,
+        os.environ.get("AGENT_NAME") or socket.gethostname(),
+        labels=[
+            label.strip() for label in os.environ.get("AGENT_LABELS", "").split(",")
+            if label.strip()
+        ],
+        workers=int(os.environ.get("AGENT_WORKERS", "1")),
+        max_weight=float(os.environ.get("AGENT_MAX_WEIGHT", "1.0")),
+        max_cpu=float(os.environ.get("JOB_MAX_CPU", "90")),
+        max_memory=float(os.environ.get("JOB_MAX_MEMORY", "90")),
+        max_disk=float(os.environ.get("JOB_MAX_DISK", "95")),
+        disk_path=os.environ.get("JOB_DISK_PATH", "/"),
+    )
+    # Artifacts are spooled here until uploaded
+    store = ContentStore(os.path.join(os.environ.get("AGENT_DIR", "agent"), "artifacts"))
+    log_writer = RemoteLogWriter(client, agent)
+    job_module.bind(RemoteTaskDB(client, agent, store), log_writer, _NoHub(), store)
+
+    def _shutdown_handler(signum, frame):
+        _log(f"Shutdown signal {signum}")
+        agent.shutdown()
+        log_writer.close()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, _shutdown_handler)
+    signal.signal(signal.SIGTERM, _shutdown_handler)
+    agent.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# agent_registry.py
+import os
+import sys
+import time
+import uuid
+import datetime
+import threading
+from job_queue import job_queue, Job
+from telemetry import registry
+
+
+class Agent:
+    """A registered worker agent: what it offers and when it was last heard of."""
+
+    __slots__ = (
+        "id", "name", "labels", "capabilities", "max_weight", "registered_at",
+        "last_seen", "load",
+    )
+
+    def __init__(self, name, labels, capabilities):
+        self.id = str(uuid.uuid4())
+        self.name = name
+        self.labels = frozenset(labels)
+        self.capabilities = capabilities
+        # Sum of job weights the agent runs at once, like JOB_MAX_WEIGHT
+        self.max_weight = float(capabilities.get("max_weight", 1.0))
+        self.registered_at = datetime.datetime.utcnow().isoformat()
+        self.last_seen = time.monotonic()
+        self.load = {}
+
+    def admit(self, job, running_weight):
+        """
+        Placement of `job` on this agent, with `running_weight` already
+        running there. An idle agent takes any job it has the labels
+        for; host pressure is checked by the agent before it asks.
+        """
+        if not job.labels <= self.labels:
+            return False, "labels"
+        if running_weight and running_weight + job.weight > self.max_weight:
+            return False, "weight"
+        return True, None
+
+
+class AgentRegistry:
+    """
+    Worker agents known to the server.
+
+    Agents pull work: they long-poll `lease` for the next job they can
+    run, report it back over HTTP and heartbeat every
+    `heartbeat_interval` seconds. An agent not heard of for `lost_after`
+    seconds is dropped and its jobs are queued again, each at most
+    `max_attempts` times in total. A job killed on the server is
+    cancelled on its agent at the next heartbeat.
+    """
+
+    def __init__(self, queue, heartbeat_interval=5.0, lost_after=30.0, max_attempts=3):
+        self.queue = queue
+        self.heartbeat_interval = heartbeat_interval
+        self.lost_after = lost_after
+        self.max_attempts = max_attempts
+        self._agents = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._agents)
+
+    def register(self, name, labels, capabilities):
+        agent = Agent(name, labels, capabilities)
+        with self._lock:
+            self._agents[agent.id] = agent
+        return agent
+
+    def get(self, agent_id):
+        """The agent, marked as seen now, or None if unknown or lost."""
+        with self._lock:
+            agent = self._agents.get(agent_id)
+            if agent is not None:
+                agent.last_seen = time.monotonic()
+            return agent
+
+    def heartbeat(self, agent, running, load):
+        """
+        Record a heartbeat listing the job ids the agent runs. Returns
+        the ones it must stop: killed on the server, or no longer its.
+        """
+        agent.load = load
+        cancel = []
+        for job_id in running:
+            job = self.queue.leased(agent.id, job_id)
+            if job is None or job.status == Job.STATUS_CANCELED:
+                cancel.append(job_id)
+        return cancel
+
+    def lease(self, agent, wait):
+        # Reply well before the agent could be taken for lost
+        return self.queue.lease(agent, min(wait, self.lost_after / 2))
+
+    def _jobs_of(self, agent_id):
+        return [j for j in list(self.queue.running.values()) if j.agent_id == agent_id]
+
+    def _reap(self):
+        cutoff = time.monotonic() - self.lost_after
+        with self._lock:
+            lost = [a for a in self._agents.values() if a.last_seen < cutoff]
+            for agent in lost:
+                del self._agents[agent.id]
+        for agent in lost:
+            jobs = self._jobs_of(agent.id)
+            print(
+                f"[{datetime.datetime.utcnow().isoformat()}] Agent {agent.name} lost, "
+                f"taking back {len(jobs)} job(s)",
+                file=sys.stderr,
+            )
+            for job in jobs:
+                self.queue.requeue(job, f"Agent {agent.name} lost", self.max_attempts)
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self._reap()
+            except Exception as e:
+                print(
+                    f"[{datetime.datetime.utcnow().isoformat()}] Agent check failed: {e}",
+                    file=sys.stderr,
+                )
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            agents = list(self._agents.values())
+        return [
+            {
+                "id": agent.id,
+                "name": agent.name,
+                "labels": sorted(agent.labels),
+                "capabilities": agent.capabilities,
+                "registered_at": agent.registered_at,
+                "last_seen_seconds": round(now - agent.last_seen, 1),
+                "load": agent.load,
+                "jobs": [
+                    {"id": job.id, "git_uri": job.git_uri, "weight": job.weight}
+                    for job in self._jobs_of(agent.id)
+                ],
+            }
+            for agent in agents
+        ]
+
+
+# Global instance
+agent_registry = AgentRegistry(
+    job_queue,
+    heartbeat_interval=float(os.environ.get("AGENT_HEARTBEAT_SECONDS", "5")),
+    lost_after=float(os.environ.get("AGENT_LOST_SECONDS", "30")),
+    max_attempts=int(os.environ.get("AGENT_MAX_ATTEMPTS", "3")),
+)
+
+registry.gauge(
+    "buildos_agents", "Registered worker agents", fn=lambda: len(agent_registry)
+)
@@ -1,17 +1,25 @@
+import os
 import datetime
 import signal
 import sys
 from flask import Flask, render_template
 from job_queue import job_queue
-from db import db
+from db import db, log_writer, log_indexer, log_archiver
 from endpoints.pipeline import pipeline_bp
+from endpoints.tasks import tasks_bp
 from endpoints.metrics import metrics_bp
+from endpoints.agents import agents_bp
+from agent_registry import agent_registry
+from metrics_sampler import metrics_sampler
+from mirror_gc import mirror_gc
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
 
 # Register Blueprints
 app.register_blueprint(pipeline_bp)
+app.register_blueprint(tasks_bp)
 app.register_blueprint(metrics_bp)
+app.register_blueprint(agents_bp)
 
 # Root-level routes
 @app.route("/")
@@ -28,11 +36,23 @@ def _shutdown_handler(signum, frame):
         f"[{datetime.datetime.utcnow().isoformat()}] Shutdown signal {signum}",
         file=sys.stderr,
     )
+    agent_registry.close()
     job_queue.shutdown()
+    log_writer.close()
+    log_indexer.close()
+    log_archiver.close()
+    metrics_sampler.close()
+    if mirror_gc is not None:
+        mirror_gc.close()
     sys.exit(0)
 
 signal.signal(signal.SIGINT, _shutdown_handler)
 signal.signal(signal.SIGTERM, _shutdown_handler)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, threaded=True)
+    # serve.py runs this as its scheduler process, on a loopback port
+    app.run(
+        host=os.environ.get("APP_HOST", "0.0.0.0"),
+        port=int(os.environ.get("APP_PORT", "5000")),
+        threaded=True,
+    )
@@ -0,0 +1,24 @@
+# _env.py
+"""
+Shared setup of the benchmark scripts: puts python/ on the import path
+and moves into a scratch directory first, because importing the db
+package opens ./sqlite and ./yocto-mirror (see db/__init__.py).
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def scratch(prefix):
+    """Enter a fresh scratch directory, removed at exit, and return its path."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    path = tempfile.mkdtemp(prefix=prefix)
+    atexit.register(shutil.rmtree, path, ignore_errors=True)
+    os.chdir(path)
+    os.environ.setdefault("ARTIFACT_STORE", os.path.join(path, "artifacts"))
+    return path
@@ -0,0 +1,106 @@
+# bench_db_pool.py
+"""
+Read throughput of SQLiteDB while a writer appends logs, with pooled
+reader connections and one long-lived writer (the current code) against
+a fresh connection per call (the code before pooling).
+
+    python benchmarks/bench_db_pool.py [--threads 16] [--seconds 5]
+"""
+import argparse
+import datetime
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import _env
+
+_env.scratch("bench-db-pool-")
+
+from db.sqlite import SQLiteDB  # noqa: E402
+
+
+class PerCallDB(SQLiteDB):
+    """The access pattern before pooling: every call opens its own connection."""
+
+    @contextmanager
+    def _read_conn(self):
+        conn = self._get_conn()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _write_conn(self):
+        with self._lock:
+            conn = self._get_conn()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+
+def populate(db, tasks, lines):
+    now = datetime.datetime.utcnow().isoformat()
+    for i in range(tasks):
+        db.create_task(f"task-{i}", f"https://example.com/repo-{i % 10}.git", now)
+    rows = [(f"task-{i % tasks}", now, f"line {i} of the build output") for i in range(lines)]
+    db.add_logs(rows)
+
+
+def run(db, threads, seconds, tasks):
+    stop = threading.Event()
+    reads = [0] * threads
+
+    def writer():
+        now = datetime.datetime.utcnow().isoformat()
+        i = 0
+        while not stop.is_set():
+            db.add_logs([(f"task-{i % tasks}", now, "appended line")] * 100)
+            i += 1
+
+    def reader(n):
+        i = n
+        while not stop.is_set():
+            if i % 2:
+                db.get_tasks(limit=50)
+            else:
+                db.get_logs_since(f"task-{i % tasks}", 0)
+            reads[n] += 1
+            i += 1
+
+    workers = [threading.Thread(target=writer)]
+    workers += [threading.Thread(target=reader, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in workers:
+        t.join()
+    return sum(reads) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, cls in (("per-call connections", PerCallDB), ("pooled readers", SQLiteDB)):
+        path = os.path.abspath(f"{cls.__name__}.sqlite")
+        db = cls(path)
+        db.init_db()
+        populate(db, args.tasks, args.lines)
+        rate = run(db, args.threads, args.seconds, args.tasks)
+        print(f"{name:>22}: {rate:8.0f} reads/s")
+
+
+if __name__ == "__main__":
+    main()
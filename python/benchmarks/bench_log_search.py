@@ -0,0 +1,98 @@
+# bench_log_search.py
+"""
+Full-text log search on a synthetic corpus of bitbake-like lines:
+index build time, index size and the latency of typical queries.
+
+    python benchmarks/bench_log_search.py [--lines 3000000] [--tasks 30]
+"""
+import argparse
+import datetime
+import os
+import random
+import time
+
+import _env
+
+_env.scratch("bench-log-search-")
+
+from db.sqlite import SQLiteDB  # noqa: E402
+
+TASKS = ("do_fetch", "do_unpack", "do_patch", "do_configure", "do_compile", "do_install",
+         "do_package", "do_rootfs")
+QUERIES = (
+    ("ERROR:", False),
+    ("ERROR:", True),
+    ("recipe-1234", False),
+    ("do_compile recipe-7", False),
+    ("recipe-12*", True),
+)
+
+
+def corpus(lines, tasks, seed=1):
+    """Rows of (task_id, timestamp, line); about 1 line in 200 is an error."""
+    rng = random.Random(seed)
+    now = datetime.datetime.utcnow().isoformat()
+    per_task = lines // tasks
+    for t in range(tasks):
+        task_id = f"task-{t}"
+        for i in range(per_task):
+            recipe = f"recipe-{rng.randrange(10000)}"
+            step = rng.choice(TASKS)
+            if rng.random() < 0.005:
+                line = f"ERROR: {recipe}-1.0-r0 {step}: Execution of '{step}' failed with exit code 1"
+            else:
+                line = (f"NOTE: recipe {recipe}-1.0-r0: task {step}: "
+                        f"Succeeded ({i} of {per_task}, {rng.random():.3f}s)")
+            yield task_id, now, line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lines", type=int, default=3_000_000)
+    parser.add_argument("--tasks", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db = SQLiteDB(os.path.abspath("search.sqlite"))
+    db.init_db()
+    if not db.fts_enabled:
+        raise SystemExit("SQLite built without FTS5")
+    now = datetime.datetime.utcnow().isoformat()
+    for t in range(args.tasks):
+        db.create_task(f"task-{t}", "https://example.com/repo.git", now)
+
+    batch = []
+    for row in corpus(args.lines, args.tasks):
+        batch.append(row)
+        if len(batch) == 50_000:
+            db.add_logs(batch)
+            batch = []
+    if batch:
+        db.add_logs(batch)
+
+    start = time.perf_counter()
+    while db.index_logs(100_000):
+        pass
+    print(f"index build: {time.perf_counter() - start:.2f} s for {args.lines} lines")
+    with db._read_conn() as conn:
+        for name in ("logs", "logs_fts"):
+            pages = conn.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name LIKE ?", (name + "%",)
+            ).fetchone()[0]
+            if pages is not None:
+                print(f"{name} size: {pages / 1e6:.0f} MB")
+
+    for query, one_task in QUERIES:
+        task_id = "task-0" if one_task else None
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            hits = db.search_logs(query, task_id=task_id, limit=50)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        scope = "one task" if one_task else "all tasks"
+        print(f"{query!r:>24} in {scope:>9}: {best * 1000:7.1f} ms, {len(hits)} hits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# bench_runner.py
+"""
+Time to pump a command's output into a no-op line callback: the
+readline() + sleep(1) loop jobs used before, against CommandRunner.
+
+    python benchmarks/bench_runner.py [--lines 2000000]
+"""
+import argparse
+import os
+import subprocess
+import threading
+import time
+
+import _env
+
+_env.scratch("bench-runner-")
+
+from runner import CommandRunner  # noqa: E402
+
+
+def readline_loop(cmd, on_line):
+    """The old Job.run_command loop, minus the database writes."""
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        preexec_fn=os.setsid,
+    )
+    while True:
+        line = proc.stdout.readline()
+        if line:
+            on_line(line.strip(), False)
+        elif proc.poll() is not None:
+            break
+        else:
+            time.sleep(1)
+    return proc.wait()
+
+
+def command_runner(cmd, on_line):
+    runner = CommandRunner(cmd, on_line=on_line, stop_event=threading.Event(), timeout=3600)
+    runner.start()
+    return runner.pump()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lines", type=int, default=2_000_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    cmd = ["seq", str(args.lines)]
+    for name, pump in (("readline loop", readline_loop), ("CommandRunner", command_runner)):
+        best = None
+        for _ in range(args.rounds):
+            count = [0]
+
+            def on_line(line, overwritten):
+                count[0] += 1
+
+            start = time.perf_counter()
+            pump(cmd, on_line)
+            elapsed = time.perf_counter() - start
+            assert count[0] == args.lines, count[0]
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:>14}: {best:6.2f} s for {args.lines} lines (best of {args.rounds})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# soak_job_history.py
+"""
+Soak test of the job registry: enqueue and finish many jobs through
+JobQueue and its workers, then check that only JOB_HISTORY_SIZE
+summaries stay in memory and that RSS stays flat once the history is
+full. Jobs go through the real database and log writer; only the build
+itself is replaced by a few log lines.
+
+SQLite's page cache and mmap grow with the database up to
+SQLITE_CACHE_MB and SQLITE_MMAP_MB per connection, which would hide a
+leak in the job registry for a long while. They are kept small here
+unless --sqlite-caches is given.
+
+    python benchmarks/soak_job_history.py [--jobs 100000] [--history 1000]
+
+Exits non-zero if the history or RSS is not bounded.
+"""
+import argparse
+import datetime
+import gc
+import logging
+import os
+import sys
+import time
+
+import _env
+
+_env.scratch("soak-job-history-")
+# Only the queue built below runs jobs
+os.environ["JOB_WORKERS"] = "0"
+if "--sqlite-caches" not in sys.argv:
+    os.environ["SQLITE_MMAP_MB"] = "0"
+    os.environ["SQLITE_CACHE_MB"] = "1"
+
+from db import db, log_hub  # noqa: E402
+from job import Job  # noqa: E402
+from job_queue import JobQueue  # noqa: E402
+
+
+class SoakJob(Job):
+    """A job whose build is a few log lines."""
+
+    def run(self):
+        self.status = Job.STATUS_RUNNING
+        self.started_at = datetime.datetime.utcnow().isoformat()
+        db.update_task_status(self.id, self.status, started_at=self.started_at)
+        for i in range(5):
+            self._log(logging.INFO, f"step {i} of {self.id}")
+        self.status = Job.STATUS_FINISHED
+        self.finished_at = datetime.datetime.utcnow().isoformat()
+        db.update_task_status(self.id, self.status, finished_at=self.finished_at)
+        log_hub.finish(self.id)
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def drain(queue):
+    while True:
+        with queue.lock:
+            if not queue.jobs:
+                return
+        time.sleep(0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--jobs", type=int, default=100_000)
+    parser.add_argument("--history", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--checkpoints", type=int, default=10)
+    parser.add_argument("--max-growth-mb", type=float, default=16.0,
+                        help="RSS growth allowed after the first checkpoint")
+    parser.add_argument("--sqlite-caches", action="store_true",
+                        help="keep SQLite's production page cache and mmap sizes")
+    args = parser.parse_args()
+
+    queue = JobQueue(workers=args.workers, max_weight=args.workers,
+                     history_size=args.history)
+    every = max(args.jobs // args.checkpoints, 1)
+    baseline = None
+    start = time.monotonic()
+    for i in range(1, args.jobs + 1):
+        queue.add_job(SoakJob(f"https://example.com/repo-{i % 100}.git", priority=i % 3))
+        if i % every == 0 or i == args.jobs:
+            drain(queue)
+            gc.collect()
+            rss = rss_mb()
+            baseline = rss if baseline is None else baseline
+            print(f"{i:>8} jobs: RSS {rss:6.1f} MB, live {len(queue.jobs)}, "
+                  f"history {len(queue.history)}, {time.monotonic() - start:6.1f} s", flush=True)
+    queue.shutdown()
+
+    growth = rss - baseline
+    failures = []
+    if len(queue.history) > args.history:
+        failures.append(f"history holds {len(queue.history)} > {args.history} summaries")
+    if queue.jobs:
+        failures.append(f"{len(queue.jobs)} jobs still live")
+    if growth > args.max_growth_mb:
+        failures.append(f"RSS grew {growth:.1f} MB after the first checkpoint")
+    for failure in failures:
+        print("FAIL:", failure)
+    if not failures:
+        print(f"OK: history bounded, RSS grew {growth:.1f} MB after the first checkpoint")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# content_store.py
+import os
+import hashlib
+import shutil
+import tempfile
+
+
+class BlobWriter:
+    """
+    File-like sink that hashes bytes while spooling them to a temp file
+    inside the store. `commit()` moves the file to its content address.
+    Exposes tell() but not seek(), so zipfile can write into it directly.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.tmp_dir)
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def hexdigest(self):
+        """SHA-256 of the bytes written so far."""
+        return self._hash.hexdigest()
+
+    def flush(self):
+        self._file.flush()
+
+    def commit(self):
+        """Finalize the blob. Returns (digest, size)."""
+        self._file.close()
+        digest = self._hash.hexdigest()
+        dest = self._store.path(digest)
+        if os.path.exists(dest):
+            # Same content already stored
+            os.unlink(self._tmp_path)
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(self._tmp_path, dest)
+        return digest, self.size
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.unlink(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+
+
+class ContentStore:
+    """
+    Content-addressed artifact files on disk, named by SHA-256:
+    <root>/<first two hex chars>/<digest>.
+    """
+
+    COPY_CHUNK = 1024 * 1024
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def relpath(self, digest):
+        return f"{digest[:2]}/{digest}"
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.isfile(self.path(digest))
+
+    def writer(self):
+        return BlobWriter(self)
+
+    def put_bytes(self, data):
+        with self.writer() as w:
+            w.write(data)
+            return w.commit()
+
+    def put_file(self, src_path):
+        with self.writer() as w, open(src_path, "rb") as src:
+            shutil.copyfileobj(src, w, self.COPY_CHUNK)
+            return w.commit()
+
+    def open(self, digest):
+        return open(self.path(digest), "rb")
+
+    def delete(self, digest):
+        try:
+            os.unlink(self.path(digest))
+        except FileNotFoundError:
+            pass
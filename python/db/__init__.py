@@ -1,6 +1,53 @@
 # database.py
+import os
 from db.sqlite import SQLiteDB
+from db.log_writer import LogWriter
+from db.log_hub import LogHub
+from db.log_follower import LogFollower
+from db.log_indexer import LogIndexer
+from db.log_archiver import LogArchiver
+from content_store import ContentStore
+from telemetry import registry
+
+# artifacts live on the mirror volume, next to downloads/ and sstate-cache/
+content_store = ContentStore(os.environ.get("ARTIFACT_STORE", "yocto-mirror/artifacts"))
+
+# "web" in the web processes of serve.py: they only read, and the
+# scheduler process owns the schema, the stale-task sweep and every
+# background writer below
+APP_ROLE = os.environ.get("APP_ROLE", "all")
 
 # single shared DB instance
-db = SQLiteDB("sqlite")
-db.init_db()
+db = SQLiteDB("sqlite", content_store=content_store)
+
+# live fan-out of committed log rows to streaming viewers; in a web
+# process, fed by one thread polling the database for streamed tasks
+log_hub = LogHub()
+
+if APP_ROLE == "web":
+    db.attach()
+    log_writer = log_indexer = log_archiver = None
+    log_follower = LogFollower(
+        db, log_hub, interval=float(os.environ.get("WEB_LOG_POLL_SECONDS", "1"))
+    )
+else:
+    log_follower = None
+    db.init_db()
+
+    # buffered, batched log sink in front of db.add_logs
+    log_writer = LogWriter(db, hub=log_hub)
+    registry.gauge(
+        "buildos_log_buffer_depth", "Log lines buffered and not yet committed",
+        fn=lambda: log_writer.stats()["buffer_depth"],
+    )
+
+    # full-text index maintenance, off the log write path
+    log_indexer = LogIndexer(db)
+
+    # compaction of old finished tasks' logs and retention; 0 disables a limit
+    log_archiver = LogArchiver(
+        db,
+        archive_after=float(os.environ.get("LOG_ARCHIVE_AFTER_HOURS", "24")) * 3600,
+        retention_seconds=float(os.environ.get("LOG_RETENTION_DAYS", "0")) * 86400,
+        retention_bytes=int(float(os.environ.get("LOG_RETENTION_GB", "0")) * 1024**3),
+    )
@@ -1,5 +1,5 @@
 import abc
-from typing import Iterator, List, Optional, Dict
+from typing import Iterator, List, Optional, Dict, Tuple, Union
 
 
 class DBInterface(abc.ABC):
@@ -24,11 +24,70 @@ class DBInterface(abc.ABC):
         """Update status (and optional timestamps) of a task."""
         pass
 
+    @abc.abstractmethod
+    def update_task_metadata(self, task_id: str, **fields) -> None:
+        """
+        Set optional per-task measurements (e.g. clone_cache,
+        clone_seconds). Unknown field names raise ValueError.
+        """
+        pass
+
     @abc.abstractmethod
     def update_task_content(self, task_id: str, content: bytes) -> None:
         """
-        Store the full ZIP bytes (or an equivalent binary representation)
-        for a given task.
+        Store the full ZIP bytes for a given task in the artifact store.
+        """
+        pass
+
+    @abc.abstractmethod
+    def set_task_artifact(
+        self,
+        task_id: str,
+        digest: str,
+        size: int,
+        ingest_seconds: Optional[float] = None,
+        ingest_peak_rss: Optional[int] = None,
+    ) -> None:
+        """
+        Record an artifact already written to the content store
+        (identified by its SHA-256 digest) as the task's content,
+        with optional ingest duration and peak RSS growth in bytes.
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_task_artifact(self, task_id: str) -> Optional[Dict]:
+        """
+        Return artifact metadata for a task, or None:
+        {'digest': ..., 'size': ..., 'created_at': ..., 'ingest_seconds': ...,
+         'ingest_peak_rss': ..., 'path': ..., 'relpath': ...}
+        `path` is the absolute file path, `relpath` is relative to the store root.
+        """
+        pass
+
+    @abc.abstractmethod
+    def find_cached_build(self, uri_key: str, commit_sha: str) -> Optional[Dict]:
+        """
+        Return the most recent successful, non-cached build of a commit
+        whose artifact is still stored:
+        {'id': ..., 'started_at': ..., 'finished_at': ..., 'pipeline_sha': ...,
+         'digest': ..., 'size': ...}
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_cache_stats(self) -> Dict:
+        """
+        Aggregate result-cache counters: cache_hits, coalesced_submissions,
+        saved_seconds and saved_build_hours.
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_build_window_start(self, builds: int) -> Optional[str]:
+        """
+        Earliest started_at among running tasks and the last `builds`
+        successful, non-cached builds; None if there are none.
         """
         pass
 
@@ -40,19 +99,48 @@ class DBInterface(abc.ABC):
         """
         pass
 
+    @abc.abstractmethod
+    def set_task_resources(
+        self, task_id: str, fields: Tuple[str, ...], interval: float, samples: List[List]
+    ) -> None:
+        """
+        Store the resource usage time series of a task: one row of
+        numbers per sample, in the order of `fields`.
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_task_resources(self, task_id: str) -> Optional[Dict]:
+        """
+        Return {'fields': [...], 'interval': ..., 'samples': [[...], ...]}
+        or None when the task has no recorded usage.
+        """
+        pass
+
     @abc.abstractmethod
     def get_task(self, task_id: str) -> Optional[Dict]:
         """
         Return metadata for a single task (no raw blobs),
-        e.g. {'id': ..., 'git_uri': ..., 'status': ..., ..., 'has_content': 0|1}
+        e.g. {'id': ..., 'git_uri': ..., 'status': ..., ..., 'has_content': 0|1,
+              'artifact_size': ...}
         """
         pass
 
     @abc.abstractmethod
-    def get_tasks(self) -> List[Dict]:
+    def get_tasks(
+        self,
+        status: Optional[Union[str, List[str]]] = None,
+        git_uri: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        order: str = "desc",
+    ) -> Dict:
         """
-        Return a list of all tasks’ metadata (no raw blobs),
-        each including a has_content flag.
+        Return one page of tasks’ metadata (no raw blobs), keyset-paginated
+        on (created_at, id) and optionally filtered by status and git_uri:
+        {'tasks': [...], 'next_cursor': str | None}
+        Each task includes has_content and artifact_size.
+        Raises ValueError for a malformed cursor.
         """
         pass
 
@@ -61,6 +149,14 @@ class DBInterface(abc.ABC):
         """Append a line to the logs for a given task."""
         pass
 
+    @abc.abstractmethod
+    def add_logs(self, rows: List[Tuple[str, str, str]]) -> List[int]:
+        """
+        Append many (task_id, timestamp, line) rows in a single transaction.
+        Returns the ids the rows were given, in order.
+        """
+        pass
+
     @abc.abstractmethod
     def get_logs(self, task_id: str) -> List[Dict]:
         """
@@ -75,3 +171,63 @@ class DBInterface(abc.ABC):
         Return log rows for a task with id > after_id.
         """
         pass
+
+    @abc.abstractmethod
+    def index_logs(self, batch_size: int = 5000) -> int:
+        """
+        Incrementally add not yet indexed log rows to the full-text index.
+        Returns how many rows were indexed (0 when up to date).
+        """
+        pass
+
+    @abc.abstractmethod
+    def search_logs(
+        self, query: str, task_id: Optional[str] = None, limit: int = 50
+    ) -> List[Dict]:
+        """
+        Full-text search over log lines, best matches first:
+        [{'id': ..., 'task_id': ..., 'timestamp': ..., 'line': ..., 'rank': ...}, ...]
+        Raises RuntimeError when search is not available.
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_log_archive_candidates(
+        self, finished_before: str, limit: int = 50
+    ) -> List[str]:
+        """Ids of finished tasks, older than `finished_before`, with hot logs."""
+        pass
+
+    @abc.abstractmethod
+    def archive_task_logs(self, task_id: str, block_lines: int = 4096) -> Tuple[int, int, int]:
+        """
+        Compact a finished task's logs into compressed segments; reads
+        through get_logs()/get_logs_since() are unaffected.
+        Returns (rows, raw_bytes, stored_bytes).
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_log_retention_candidates(
+        self, finished_before: Optional[str] = None, max_bytes: int = 0
+    ) -> List[str]:
+        """
+        Ids of tasks whose logs are older than `finished_before` or, newest
+        first, beyond `max_bytes` of archived logs.
+        """
+        pass
+
+    @abc.abstractmethod
+    def purge_task_logs(self, task_id: str) -> None:
+        """Delete all logs of a task, hot or archived."""
+        pass
+
+    @abc.abstractmethod
+    def reclaim_space(self) -> None:
+        """Give space freed by archiving/purging back where possible."""
+        pass
+
+    @abc.abstractmethod
+    def get_log_storage_stats(self) -> Dict:
+        """Row counts and byte sizes of hot and archived logs."""
+        pass
@@ -0,0 +1,96 @@
+# log_archiver.py
+import sys
+import threading
+import time
+import datetime
+
+
+class LogArchiver:
+    """
+    Background thread that compacts the logs of tasks finished more than
+    `archive_after` seconds ago into compressed segments, then applies
+    the retention policy: logs of tasks finished more than
+    `retention_seconds` ago, or beyond `retention_bytes` of archived logs
+    (oldest first), are deleted. 0 disables a limit.
+    """
+
+    def __init__(self, db, archive_after=86400, retention_seconds=0,
+                 retention_bytes=0, interval=300, block_lines=4096):
+        self._db = db
+        self.archive_after = archive_after
+        self.retention_seconds = retention_seconds
+        self.retention_bytes = retention_bytes
+        self.interval = interval
+        self.block_lines = block_lines
+        self._stop = threading.Event()
+        self._tasks_archived = 0
+        self._rows_archived = 0
+        self._raw_bytes = 0
+        self._stored_bytes = 0
+        self._tasks_purged = 0
+        self._last_pass = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(
+                    f"[{datetime.datetime.utcnow().isoformat()}] Log archiving failed: {e}",
+                    file=sys.stderr,
+                )
+            self._stop.wait(self.interval)
+
+    def _before(self, seconds):
+        return (datetime.datetime.utcnow() - datetime.timedelta(seconds=seconds)).isoformat()
+
+    def run_once(self):
+        start = time.perf_counter()
+        changed = False
+        while not self._stop.is_set():
+            task_ids = self._db.get_log_archive_candidates(self._before(self.archive_after))
+            if not task_ids:
+                break
+            for task_id in task_ids:
+                if self._stop.is_set():
+                    break
+                rows, raw, stored = self._db.archive_task_logs(task_id, self.block_lines)
+                self._tasks_archived += 1
+                self._rows_archived += rows
+                self._raw_bytes += raw
+                self._stored_bytes += stored
+                changed = True
+
+        if self.retention_seconds or self.retention_bytes:
+            expired = self._db.get_log_retention_candidates(
+                self._before(self.retention_seconds) if self.retention_seconds else None,
+                self.retention_bytes,
+            )
+            for task_id in expired:
+                if self._stop.is_set():
+                    break
+                self._db.purge_task_logs(task_id)
+                self._tasks_purged += 1
+                changed = True
+
+        if changed:
+            self._db.reclaim_space()
+        self._last_pass = time.perf_counter() - start
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def stats(self):
+        return {
+            "tasks_archived": self._tasks_archived,
+            "rows_archived": self._rows_archived,
+            "compression_ratio": round(self._raw_bytes / self._stored_bytes, 2)
+            if self._stored_bytes
+            else None,
+            "tasks_purged": self._tasks_purged,
+            "last_pass_ms": round(self._last_pass * 1000, 3),
+            **self._db.get_log_storage_stats(),
+        }
@@ -0,0 +1,107 @@
+# log_follower.py
+import sys
+import threading
+import datetime
+
+
+class _Followed:
+    __slots__ = ("viewers", "last_id", "ended")
+
+    def __init__(self, last_id):
+        self.viewers = 1
+        self.last_id = last_id
+        self.ended = False
+
+
+class LogFollower:
+    """
+    Live log tails in a process that does not write the logs (a web
+    process of serve.py). One thread polls the database every `interval`
+    seconds for the tasks being streamed and publishes their new rows to
+    a LogHub, so viewers wait on the hub as they do in the scheduler
+    process, and each task is read once per interval however many
+    viewers it has.
+
+    A task's tail is finished once the task has ended and a whole
+    interval passed without new rows: its last lines are written after
+    its final status.
+    """
+
+    def __init__(self, db, hub, interval=1.0):
+        self._db = db
+        self._hub = hub
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def follow(self, task_id, after_id):
+        """
+        Register a viewer of `task_id` that has every row up to
+        `after_id`. Returns False, registering nothing, if the task is
+        unknown or has ended: its log is then read from the database.
+        """
+        with self._lock:
+            followed = self._tasks.get(task_id)
+            if followed is not None:
+                followed.viewers += 1
+                return True
+        task = self._db.get_task(task_id)
+        if not task or task["status"] in self._db.TERMINAL_STATUSES:
+            return False
+        with self._lock:
+            followed = self._tasks.get(task_id)
+            if followed is not None:
+                followed.viewers += 1
+            else:
+                self._tasks[task_id] = _Followed(after_id)
+                # Later viewers that are further behind catch up from the database
+                self._hub.open(task_id, covered_after=after_id)
+        return True
+
+    def unfollow(self, task_id):
+        with self._lock:
+            followed = self._tasks.get(task_id)
+            if followed is None:
+                return
+            followed.viewers -= 1
+            if not followed.viewers:
+                del self._tasks[task_id]
+                self._hub.finish(task_id)
+
+    def _poll(self, task_id, last_id):
+        task = self._db.get_task(task_id)
+        rows = self._db.get_logs_since(task_id, last_id)
+        ended = not task or task["status"] in self._db.TERMINAL_STATUSES
+        with self._lock:
+            followed = self._tasks.get(task_id)
+            if followed is None:
+                return
+            if rows:
+                followed.last_id = rows[-1]["id"]
+                self._hub.publish(task_id, rows)
+            elif ended and followed.ended:
+                del self._tasks[task_id]
+                self._hub.finish(task_id)
+                return
+            followed.ended = ended
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                tasks = [(task_id, f.last_id) for task_id, f in self._tasks.items()]
+            for task_id, last_id in tasks:
+                try:
+                    self._poll(task_id, last_id)
+                except Exception as e:
+                    print(
+                        f"[{datetime.datetime.utcnow().isoformat()}] "
+                        f"Following the log of task {task_id} failed: {e}",
+                        file=sys.stderr,
+                    )
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,91 @@
+# log_hub.py
+import bisect
+import threading
+
+
+class _TaskTail:
+    __slots__ = ("rows", "covered_after", "done", "cond")
+
+    def __init__(self, lock):
+        self.rows = []
+        # Every row of the task with id > covered_after is in `rows`
+        self.covered_after = 0
+        self.done = False
+        self.cond = threading.Condition(lock)
+
+    def since(self, after_id):
+        idx = bisect.bisect_right(self.rows, after_id, key=lambda r: r["id"])
+        return self.rows[idx:]
+
+
+class LogHub:
+    """
+    In-process fan-out of freshly written log rows.
+
+    The log writer publishes each committed batch here; every viewer of
+    a running task reads the same bounded in-memory tail and blocks on a
+    per-task condition instead of polling SQLite. Viewers that fall
+    behind the tail (or arrive after the task is gone) get None and
+    must catch up through db.get_logs_since().
+    """
+
+    def __init__(self, tail_size=5000):
+        self.tail_size = tail_size
+        self._lock = threading.Lock()
+        self._tails = {}
+
+    def open(self, task_id, covered_after=0):
+        """
+        Start buffering a task's rows. Call before it logs anything, or
+        give the id of the last row it logged so far.
+        """
+        with self._lock:
+            if task_id not in self._tails:
+                tail = self._tails[task_id] = _TaskTail(self._lock)
+                tail.covered_after = covered_after
+
+    def finish(self, task_id):
+        """Wake all viewers with done=True and drop the tail."""
+        with self._lock:
+            tail = self._tails.pop(task_id, None)
+            if tail:
+                tail.done = True
+                tail.cond.notify_all()
+
+    def publish(self, task_id, rows):
+        with self._lock:
+            tail = self._tails.get(task_id)
+            if tail is None:
+                return
+            tail.rows.extend(rows)
+            if len(tail.rows) > 2 * self.tail_size:
+                # Trim in bulk so appends stay amortized O(1)
+                cut = len(tail.rows) - self.tail_size
+                tail.covered_after = tail.rows[cut - 1]["id"]
+                del tail.rows[:cut]
+            tail.cond.notify_all()
+
+    def read(self, task_id, after_id, timeout):
+        """
+        Return (rows, done) with rows newer than after_id, waiting up to
+        `timeout` seconds for some to arrive. Returns None when the
+        in-memory tail cannot answer.
+        """
+        with self._lock:
+            tail = self._tails.get(task_id)
+            if tail is None or after_id < tail.covered_after:
+                return None
+            rows = tail.since(after_id)
+            if not rows and not tail.done:
+                tail.cond.wait(timeout)
+                if after_id < tail.covered_after:
+                    return None
+                rows = tail.since(after_id)
+            return rows, tail.done
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tasks": len(self._tails),
+                "buffered_rows": sum(len(t.rows) for t in self._tails.values()),
+            }
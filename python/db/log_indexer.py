@@ -0,0 +1,57 @@
+# log_indexer.py
+import sys
+import threading
+import time
+import datetime
+
+
+class LogIndexer:
+    """
+    Background thread feeding new log rows into the full-text index in
+    batches, so indexing never runs inside the log writer's flush. Each
+    batch holds the write lock briefly; while behind, batches run back
+    to back, otherwise the thread sleeps `interval` seconds.
+    """
+
+    def __init__(self, db, interval=1.0, batch_size=5000):
+        self._db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._rows_indexed = 0
+        self._batch_time_last = 0.0
+        self._batch_time_max = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            try:
+                n = self._db.index_logs(self.batch_size)
+            except Exception as e:
+                print(
+                    f"[{datetime.datetime.utcnow().isoformat()}] Log indexing failed: {e}",
+                    file=sys.stderr,
+                )
+                n = 0
+            if n:
+                elapsed = time.perf_counter() - start
+                self._rows_indexed += n
+                self._batch_time_last = elapsed
+                self._batch_time_max = max(self._batch_time_max, elapsed)
+            if n < self.batch_size:
+                self._stop.wait(self.interval)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def stats(self):
+        return {
+            "enabled": self._db.fts_enabled,
+            "rows_indexed": self._rows_indexed,
+            "lag_rows": self._db.get_fts_lag(),
+            "last_batch_ms": round(self._batch_time_last * 1000, 3),
+            "max_batch_ms": round(self._batch_time_max * 1000, 3),
+        }
@@ -0,0 +1,69 @@
+# log_segments.py
+import bisect
+import itertools
+import struct
+import zlib
+from array import array
+
+_HEADER = struct.Struct("<I")
+
+
+def encode_block(rows, level=6):
+    """
+    Pack log rows (dicts with id, timestamp, line; ascending ids) into
+    one compressed block. Returns (data, raw_size).
+
+    Layout before compression: row count, id deltas (int64), end offset
+    of every record (uint32), then the records `timestamp\\tline` back to
+    back in UTF-8. Offsets let a reader decode only the rows it needs.
+    """
+    ids = array("q")
+    ends = array("I")
+    text = bytearray()
+    prev = 0
+    for row in rows:
+        ids.append(row["id"] - prev)
+        prev = row["id"]
+        text += f"{row['timestamp']}\t{row['line']}".encode("utf-8")
+        ends.append(len(text))
+    raw = _HEADER.pack(len(ids)) + ids.tobytes() + ends.tobytes() + bytes(text)
+    return zlib.compress(raw, level), len(raw)
+
+
+def _unpack(data):
+    """Decompress a block into (ids, record end offsets, records)."""
+    raw = zlib.decompress(data)
+    (count,) = _HEADER.unpack_from(raw)
+    pos = _HEADER.size
+    deltas = array("q")
+    deltas.frombytes(raw[pos : pos + 8 * count])
+    pos += 8 * count
+    ends = array("I")
+    ends.frombytes(raw[pos : pos + 4 * count])
+    text = memoryview(raw)[pos + 4 * count :]
+    return list(itertools.accumulate(deltas)), ends, text
+
+
+def decode_block(data, after_id=0):
+    """Return the rows of a block with id > after_id, as dicts."""
+    ids, ends, text = _unpack(data)
+    count = len(ids)
+    start_idx = bisect.bisect_right(ids, after_id)
+    start = ends[start_idx - 1] if start_idx else 0
+    rows = []
+    for idx in range(start_idx, count):
+        ts, _, line = str(text[start : ends[idx]], "utf-8").partition("\t")
+        rows.append({"id": ids[idx], "timestamp": ts, "line": line})
+        start = ends[idx]
+    return rows
+
+
+def decode_row(data, row_id):
+    """Return the row of a block with the given id, or None."""
+    ids, ends, text = _unpack(data)
+    idx = bisect.bisect_left(ids, row_id)
+    if idx == len(ids) or ids[idx] != row_id:
+        return None
+    start = ends[idx - 1] if idx else 0
+    ts, _, line = str(text[start : ends[idx]], "utf-8").partition("\t")
+    return {"id": row_id, "timestamp": ts, "line": line}
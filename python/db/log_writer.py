@@ -0,0 +1,201 @@
+# log_writer.py
+import sys
+import threading
+import time
+import datetime
+from telemetry import registry
+
+LOG_LINES = registry.counter(
+    "buildos_log_lines_written_total", "Build log lines committed to the database"
+)
+LOG_FLUSH_ERRORS = registry.counter(
+    "buildos_log_flush_errors_total", "Failed attempts to commit a batch of log lines"
+)
+LOG_LINES_DROPPED = registry.counter(
+    "buildos_log_lines_dropped_total", "Log lines given up after repeated commit failures"
+)
+LOG_FLUSH_SECONDS = registry.histogram(
+    "buildos_log_flush_seconds", "Time to commit one batch of log lines"
+)
+
+
+class LogWriter:
+    """
+    Asynchronous group-commit sink for build log lines.
+
+    Lines are buffered in memory and written by a background thread with
+    one executemany/commit per batch. A batch is flushed when it reaches
+    `batch_size` lines or when `flush_interval` seconds have passed since
+    the first buffered line, whichever comes first. `flush()` drains the
+    buffer synchronously and is used on job completion, kill and shutdown.
+
+    A batch that fails to commit is tried `max_retries` times in all,
+    with growing pauses, while add() applies backpressure. After that its
+    rows are written one by one and the ones that still fail are dropped
+    and logged, so one bad row cannot stall every job's output; the
+    task's `log_lines_dropped` records how many it lost.
+    """
+
+    def __init__(self, db, hub=None, batch_size=1000, flush_interval=0.25,
+                 max_pending=100000, max_retries=3):
+        self._db = db
+        self._hub = hub
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        self._buffer = []
+        self._cond = threading.Condition()
+        # Serializes swap + write so batches reach the DB in order
+        self._flush_lock = threading.Lock()
+        self._closed = False
+
+        self._max_depth = 0
+        self._lines_written = 0
+        self._flushes = 0
+        self._flush_errors = 0
+        self._lines_dropped = 0
+        # Lines dropped so far, by task
+        self._dropped = {}
+        self._flush_time_total = 0.0
+        self._flush_time_last = 0.0
+        self._flush_time_max = 0.0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, task_id, timestamp, line):
+        with self._cond:
+            # Apply backpressure instead of dropping lines when the DB lags
+            while len(self._buffer) >= self.max_pending and not self._closed:
+                self._cond.wait()
+            self._buffer.append((task_id, timestamp, line))
+            depth = len(self._buffer)
+            if depth > self._max_depth:
+                self._max_depth = depth
+            if depth == 1 or depth >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self):
+        """
+        Write every line buffered so far before returning. Returns False
+        if some of them had to be dropped.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+                self._cond.notify_all()
+            return not batch or self._write(batch)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._buffer)
+        flushes = self._flushes
+        return {
+            "buffer_depth": depth,
+            "max_buffer_depth": self._max_depth,
+            "lines_written": self._lines_written,
+            "flushes": flushes,
+            "flush_errors": self._flush_errors,
+            "lines_dropped": self._lines_dropped,
+            "last_flush_ms": round(self._flush_time_last * 1000, 3),
+            "max_flush_ms": round(self._flush_time_max * 1000, 3),
+            "avg_flush_ms": round(self._flush_time_total / flushes * 1000, 3)
+            if flushes
+            else 0.0,
+        }
+
+    def _write(self, batch):
+        """Commit `batch`; returns False if some rows had to be dropped."""
+        for attempt in range(self.max_retries):
+            start = time.perf_counter()
+            try:
+                ids = self._db.add_logs(batch)
+            except Exception as e:
+                self._flush_error(f"Log flush of {len(batch)} lines failed: {e}")
+                if attempt + 1 < self.max_retries:
+                    time.sleep(self.flush_interval * 2**attempt)
+                continue
+            self._written(batch, ids, time.perf_counter() - start)
+            return True
+        # Keep what can be written; only the rows that fail on their own are lost
+        dropped = {}
+        for row in batch:
+            start = time.perf_counter()
+            try:
+                ids = self._db.add_logs([row])
+            except Exception as e:
+                dropped[row[0]] = dropped.get(row[0], 0) + 1
+                error = e
+                continue
+            self._written([row], ids, time.perf_counter() - start)
+        if dropped:
+            self._drop(dropped, error)
+        return not dropped
+
+    def _flush_error(self, message):
+        self._flush_errors += 1
+        LOG_FLUSH_ERRORS.inc()
+        print(f"[{datetime.datetime.utcnow().isoformat()}] {message}", file=sys.stderr)
+
+    def _drop(self, dropped, error):
+        count = sum(dropped.values())
+        self._lines_dropped += count
+        LOG_LINES_DROPPED.inc(count)
+        print(
+            f"[{datetime.datetime.utcnow().isoformat()}] Dropped {count} log lines of "
+            f"{', '.join(str(t) for t in dropped)}: {error}",
+            file=sys.stderr,
+        )
+        for task_id, n in dropped.items():
+            self._dropped[task_id] = self._dropped.get(task_id, 0) + n
+            try:
+                self._db.update_task_metadata(
+                    task_id, log_lines_dropped=self._dropped[task_id]
+                )
+            except Exception:
+                # Unknown task, or the database is down: the stderr line stays
+                pass
+
+    def _written(self, batch, ids, elapsed):
+        self._flushes += 1
+        self._lines_written += len(batch)
+        # Counted per batch, never per line
+        LOG_LINES.inc(len(batch))
+        LOG_FLUSH_SECONDS.observe(elapsed)
+        self._flush_time_total += elapsed
+        self._flush_time_last = elapsed
+        if elapsed > self._flush_time_max:
+            self._flush_time_max = elapsed
+        if self._hub is not None:
+            self._publish(batch, ids)
+
+    def _publish(self, batch, ids):
+        by_task = {}
+        for row_id, (task_id, timestamp, line) in zip(ids, batch):
+            by_task.setdefault(task_id, []).append(
+                {"id": row_id, "timestamp": timestamp, "line": line}
+            )
+        for task_id, rows in by_task.items():
+            self._hub.publish(task_id, rows)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._closed and len(self._buffer) < self.batch_size:
+                    # Give the batch a short time to fill up
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                break
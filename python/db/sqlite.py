@@ -1,39 +1,194 @@
+import os
 import sqlite3
 import threading
 import base64
+import queue
+import time
+import datetime
+import json
+import inspect
+import functools
+import zlib
+from array import array
+from contextlib import contextmanager
 from db.interface import DBInterface
+from content_store import ContentStore
+from db.log_segments import encode_block, decode_block, decode_row
+from telemetry import registry
+
+# Finer low end than the default buckets: most calls take well under 1 ms
+DB_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+)
+DB_CALL_SECONDS = registry.histogram(
+    "buildos_db_call_seconds", "Latency of database methods", ["method"], DB_BUCKETS
+)
+DB_LOCK_WAIT_SECONDS = registry.histogram(
+    "buildos_db_lock_wait_seconds", "Time spent waiting for the write lock", buckets=DB_BUCKETS
+)
+DB_WRITE_HOLD_SECONDS = registry.histogram(
+    "buildos_db_write_hold_seconds", "Time the write lock was held, commit included",
+    buckets=DB_BUCKETS,
+)
+
+
+# Per-connection memory: each pooled connection can hold this much
+SQLITE_MMAP_MB = int(os.environ.get("SQLITE_MMAP_MB", "256"))
+SQLITE_CACHE_MB = int(os.environ.get("SQLITE_CACHE_MB", "80"))
 
 
 class SQLiteDB(DBInterface):
-    def __init__(self, db_path: str = "sqlite.db"):
+    # Per-connection PRAGMAs; these do not persist in the database file
+    CONN_PRAGMAS = (
+        f"PRAGMA mmap_size={SQLITE_MMAP_MB * 2**20};",  # mmap reads
+        "PRAGMA temp_store=MEMORY;",  # keep temp tables in RAM
+        f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024};",  # page cache, in KiB
+    )
+
+    STREAM_CHUNK = 256 * 1024
+
+    # Optional per-task measurements, settable through update_task_metadata
+    TASK_META_COLUMNS = {
+        "clone_cache": "TEXT",  # hit | miss | bypass
+        "clone_seconds": "REAL",
+        "workspace": "TEXT",  # warm | cold | temp
+        "pipeline_seconds": "REAL",
+        "uri_key": "TEXT",  # normalized git_uri
+        "commit_sha": "TEXT",
+        "pipeline_sha": "TEXT",  # sha256 of .config/pipeline.sh
+        "cache_hit_of": "TEXT",  # task whose artifact was reused
+        "saved_seconds": "REAL",
+        "coalesced_count": "INTEGER",
+        "log_state": "TEXT",  # NULL (hot) | archived | purged
+        "log_bytes": "INTEGER",  # compressed size of archived logs
+        "output_lines": "INTEGER",  # command output lines received
+        "output_lines_logged": "INTEGER",  # after collapsing progress redraws
+        "resource_source": "TEXT",  # procfs | cgroup
+        "cpu_seconds": "REAL",
+        "peak_rss": "INTEGER",
+        "read_bytes": "INTEGER",
+        "write_bytes": "INTEGER",
+        "peak_procs": "INTEGER",
+        "priority": "INTEGER",
+        "submitter": "TEXT",
+        "labels": "TEXT",  # comma-separated labels required to run the job
+        "agent": "TEXT",  # name of the worker agent that ran the job
+        "log_lines_dropped": "INTEGER",  # lines the log writer had to give up
+    }
+
+    TERMINAL_STATUSES = ("finished", "failed", "canceled")
+
+    def __init__(self, db_path: str = "sqlite.db", content_store=None,
+                 max_readers: int = 8):
         self.db_path = db_path
+        self.content_store = content_store or ContentStore("artifacts")
+        self.fts_enabled = False
         self._lock = threading.Lock()
+        self._writer = None
+        # Idle reader connections, reused LIFO so the hottest cache wins
+        self._readers = queue.LifoQueue(maxsize=max_readers)
+
+        self._stats_lock = threading.Lock()
+        self._conns_opened = 0
+        self._reader_reuses = 0
+        self._lock_acquires = 0
+        self._lock_wait_total = 0.0
+        self._lock_wait_max = 0.0
 
     def _get_conn(self):
         conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        for pragma in self.CONN_PRAGMAS:
+            conn.execute(pragma)
+        with self._stats_lock:
+            self._conns_opened += 1
         return conn
 
+    @contextmanager
+    def _write_conn(self):
+        """
+        Hold the write lock and yield the single long-lived writer
+        connection. Commits on success, rolls back on error.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self._lock_acquires += 1
+                self._lock_wait_total += waited
+                if waited > self._lock_wait_max:
+                    self._lock_wait_max = waited
+            DB_LOCK_WAIT_SECONDS.observe(waited)
+            held = time.perf_counter()
+            if self._writer is None:
+                self._writer = self._get_conn()
+                self._writer.execute("PRAGMA synchronous=OFF;")
+            try:
+                yield self._writer
+                self._writer.commit()
+            except Exception:
+                self._writer.rollback()
+                raise
+            finally:
+                DB_WRITE_HOLD_SECONDS.observe(time.perf_counter() - held)
+
+    @contextmanager
+    def _read_conn(self):
+        """
+        Borrow a pooled reader connection. Readers never take `_lock`;
+        WAL mode gives them a consistent snapshot alongside the writer.
+        """
+        try:
+            conn = self._readers.get_nowait()
+            with self._stats_lock:
+                self._reader_reuses += 1
+        except queue.Empty:
+            conn = self._get_conn()
+        try:
+            yield conn
+        finally:
+            try:
+                self._readers.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def stats(self):
+        with self._stats_lock:
+            acquires = self._lock_acquires
+            return {
+                "connections_opened": self._conns_opened,
+                "reader_reuses": self._reader_reuses,
+                "idle_readers": self._readers.qsize(),
+                "lock_acquires": acquires,
+                "lock_wait_total_ms": round(self._lock_wait_total * 1000, 3),
+                "lock_wait_max_ms": round(self._lock_wait_max * 1000, 3),
+                "lock_wait_avg_ms": round(self._lock_wait_total / acquires * 1000, 3)
+                if acquires
+                else 0.0,
+            }
+
+    @staticmethod
+    def _add_column(cur, table, column, decl):
+        """Add a column to an existing table unless it is already there."""
+        cols = {r[1] for r in cur.execute(f"PRAGMA table_info({table});")}
+        if column not in cols:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl};")
+
     def init_db(self):
         with self._lock:
             conn = self._get_conn()
             c = conn.cursor()
 
-            # Drop existing tables if they exist
-            c.execute("DROP TABLE IF EXISTS tasks;")
-            c.execute("DROP TABLE IF EXISTS logs;")
-            c.execute("DROP TABLE IF EXISTS content_chunks;")
-
+            # Only takes effect on a new file; lets archiving shrink it
+            c.execute("PRAGMA auto_vacuum=INCREMENTAL;")
             c.execute("PRAGMA journal_mode=WAL;")  # concurrent readers + writers
             c.execute("PRAGMA synchronous=OFF;")  # skip fsync on commits
             c.execute("PRAGMA wal_autocheckpoint=0;")  # no auto-checkpoint stalls
-            c.execute("PRAGMA mmap_size=268435456;")  # allow 256 MB mmap reads
-            c.execute("PRAGMA temp_store=MEMORY;")  # keep temp tables in RAM
-            c.execute("PRAGMA cache_size=20000;")  # ~80 MB page cache
 
             c.execute(
                 """
-            CREATE TABLE tasks (
+            CREATE TABLE IF NOT EXISTS tasks (
               id           TEXT PRIMARY KEY,
               git_uri      TEXT NOT NULL,
               status       TEXT NOT NULL,
@@ -46,7 +201,7 @@ class SQLiteDB(DBInterface):
 
             c.execute(
                 """
-            CREATE TABLE logs (
+            CREATE TABLE IF NOT EXISTS logs (
               id        INTEGER PRIMARY KEY AUTOINCREMENT,
               task_id   TEXT NOT NULL,
               timestamp TEXT NOT NULL,
@@ -55,35 +210,197 @@ class SQLiteDB(DBInterface):
             );
             """
             )
-            c.execute("CREATE INDEX idx_logs_task_id ON logs(task_id);")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_logs_task_id ON logs(task_id);")
 
+            # Resource usage samples of a task's processes, as a
+            # zlib-compressed row-major array of doubles
             c.execute(
                 """
-            CREATE TABLE content_chunks (
-              task_id TEXT NOT NULL,
-              seq     INTEGER NOT NULL,
-              data    TEXT    NOT NULL,   -- base64-encoded slice
-              PRIMARY KEY(task_id, seq),
+            CREATE TABLE IF NOT EXISTS task_resources (
+              task_id  TEXT PRIMARY KEY,
+              fields   TEXT NOT NULL,      -- comma-separated column names
+              interval REAL NOT NULL,
+              samples  BLOB NOT NULL,
               FOREIGN KEY(task_id) REFERENCES tasks(id)
             );
             """
             )
+
+            # Logs of old finished tasks, moved out of `logs` into
+            # compressed blocks (see log_segments.py)
+            c.execute(
+                """
+            CREATE TABLE IF NOT EXISTS log_segments (
+              task_id    TEXT    NOT NULL,
+              first_id   INTEGER NOT NULL,
+              last_id    INTEGER NOT NULL,
+              line_count INTEGER NOT NULL,
+              raw_size   INTEGER NOT NULL,
+              data       BLOB    NOT NULL,
+              FOREIGN KEY(task_id) REFERENCES tasks(id)
+            );
+            """
+            )
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS idx_log_segments_task "
+                "ON log_segments(task_id, last_id);"
+            )
+            # Whether the segment's lines are in logs_fts
+            self._add_column(c, "log_segments", "indexed", "INTEGER NOT NULL DEFAULT 0")
+            # Finds the segments holding a given log id (global search hits)
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS idx_log_segments_span "
+                "ON log_segments(last_id, first_id);"
+            )
+
+            # Artifact bytes live in the content store; only metadata here
+            c.execute(
+                """
+            CREATE TABLE IF NOT EXISTS artifacts (
+              task_id    TEXT PRIMARY KEY,
+              digest     TEXT    NOT NULL,   -- sha256, content store key
+              size       INTEGER NOT NULL,
+              created_at TEXT    NOT NULL,
+              FOREIGN KEY(task_id) REFERENCES tasks(id)
+            );
+            """
+            )
+            c.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_digest ON artifacts(digest);")
+            self._add_column(c, "artifacts", "ingest_seconds", "REAL")
+            self._add_column(c, "artifacts", "ingest_peak_rss", "INTEGER")
+            for column, decl in self.TASK_META_COLUMNS.items():
+                self._add_column(c, "tasks", column, decl)
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS idx_tasks_build_key "
+                "ON tasks(uri_key, commit_sha);"
+            )
+
+            # Denormalized from artifacts so listings need no subquery
+            self._add_column(c, "tasks", "has_content", "INTEGER NOT NULL DEFAULT 0")
+            self._add_column(c, "tasks", "artifact_size", "INTEGER")
+            c.execute(
+                """
+            UPDATE tasks SET
+              has_content = 1,
+              artifact_size = (SELECT a.size FROM artifacts a WHERE a.task_id = tasks.id)
+            WHERE has_content = 0 AND id IN (SELECT task_id FROM artifacts);
+            """
+            )
+
+            # Keyset pagination indexes: (filter, created_at, id)
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS idx_tasks_created "
+                "ON tasks(created_at, id);"
+            )
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS idx_tasks_status_created "
+                "ON tasks(status, created_at, id);"
+            )
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS idx_tasks_uri_created "
+                "ON tasks(git_uri, created_at, id);"
+            )
+
+            # Full-text index over log lines, filled behind the write path
+            # by index_logs(). Contentless: a line is read back from `logs`
+            # or, once archived, from its segment, and stays indexed until
+            # retention purges it
+            try:
+                legacy = c.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'logs_fts' "
+                    "AND sql LIKE '%content=''logs''%';"
+                ).fetchone()
+                if legacy:
+                    # Was external content over `logs`, dropping archived
+                    # lines: rebuild it, archived segments included
+                    c.execute("DROP TABLE logs_fts;")
+                    c.execute("UPDATE fts_state SET value = 0 WHERE name = 'logs';")
+                    c.execute("UPDATE log_segments SET indexed = 0;")
+                c.execute(
+                    """
+                CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(
+                  line, task_id UNINDEXED, content=''
+                );
+                """
+                )
+                c.execute(
+                    "CREATE TABLE IF NOT EXISTS fts_state "
+                    "(name TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+                )
+                c.execute(
+                    "INSERT OR IGNORE INTO fts_state (name, value) VALUES ('logs', 0);"
+                )
+                self.fts_enabled = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: search is unavailable
+                self.fts_enabled = False
+
+            # Jobs left queued or running by a previous process never resume
+            c.execute(
+                "UPDATE tasks SET status = 'failed', finished_at = ? "
+                "WHERE status IN ('queued', 'running')",
+                (datetime.datetime.utcnow().isoformat(),),
+            )
             conn.commit()
             conn.close()
 
+        self.migrate_content_chunks()
+
+    def attach(self):
+        """
+        Open a database another process has initialized, without writing
+        to it: for the web processes, which leave the schema, migrations
+        and the stale-task sweep to the scheduler process.
+        """
+        with self._read_conn() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'logs_fts';"
+            ).fetchone()
+        self.fts_enabled = row is not None
+
+    def migrate_content_chunks(self):
+        """
+        Move artifacts from the legacy base64 `content_chunks` table into
+        the content store, one task at a time, then drop the table.
+        Returns the number of migrated tasks.
+        """
+        with self._read_conn() as conn:
+            legacy = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'content_chunks'"
+            ).fetchone()
+            if not legacy:
+                return 0
+            task_ids = [
+                r["task_id"]
+                for r in conn.execute("SELECT DISTINCT task_id FROM content_chunks")
+            ]
+
+        for task_id in task_ids:
+            with self.content_store.writer() as w:
+                with self._read_conn() as conn:
+                    for row in conn.execute(
+                        "SELECT data FROM content_chunks WHERE task_id = ? ORDER BY seq",
+                        (task_id,),
+                    ):
+                        w.write(base64.b64decode(row["data"]))
+                digest, size = w.commit()
+            with self._write_conn() as conn:
+                self._set_artifact(conn, task_id, digest, size)
+                conn.execute("DELETE FROM content_chunks WHERE task_id = ?", (task_id,))
+
+        with self._write_conn() as conn:
+            conn.execute("DROP TABLE content_chunks;")
+        return len(task_ids)
+
     def create_task(self, task_id, git_uri, created_at):
-        with self._lock:
-            conn = self._get_conn()
+        with self._write_conn() as conn:
             conn.execute(
                 "INSERT INTO tasks (id, git_uri, status, created_at) VALUES (?, ?, ?, ?)",
                 (task_id, git_uri, "queued", created_at),
             )
-            conn.commit()
-            conn.close()
 
     def update_task_status(self, task_id, status, started_at=None, finished_at=None):
-        with self._lock:
-            conn = self._get_conn()
+        with self._write_conn() as conn:
             sql = "UPDATE tasks SET status = ?"
             params = [status]
             if started_at:
@@ -95,101 +412,618 @@ class SQLiteDB(DBInterface):
             sql += " WHERE id = ?"
             params.append(task_id)
             conn.execute(sql, tuple(params))
-            conn.commit()
-            conn.close()
+
+    def update_task_metadata(self, task_id, **fields):
+        unknown = set(fields) - set(self.TASK_META_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown task metadata: {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._write_conn() as conn:
+            conn.execute(
+                f"UPDATE tasks SET {assignments} WHERE id = ?",
+                (*fields.values(), task_id),
+            )
+
+    def find_cached_build(self, uri_key, commit_sha):
+        with self._read_conn() as conn:
+            rows = conn.execute(
+                """
+              SELECT t.id, t.started_at, t.finished_at, t.pipeline_sha,
+                     a.digest, a.size
+              FROM tasks t JOIN artifacts a ON a.task_id = t.id
+              WHERE t.uri_key = ? AND t.commit_sha = ?
+                AND t.status = 'finished' AND t.cache_hit_of IS NULL
+              ORDER BY t.finished_at DESC
+            """,
+                (uri_key, commit_sha),
+            ).fetchall()
+        for r in rows:
+            if self.content_store.exists(r["digest"]):
+                return dict(r)
+        return None
+
+    def get_build_window_start(self, builds):
+        with self._read_conn() as conn:
+            row = conn.execute(
+                """
+              SELECT MIN(started_at) AS start FROM (
+                SELECT started_at FROM (
+                  SELECT started_at FROM tasks
+                  WHERE status = 'finished' AND cache_hit_of IS NULL
+                  ORDER BY finished_at DESC LIMIT ?
+                )
+                UNION ALL
+                SELECT started_at FROM tasks WHERE status = 'running'
+              )
+            """,
+                (builds,),
+            ).fetchone()
+        return row["start"]
+
+    def get_cache_stats(self):
+        with self._read_conn() as conn:
+            row = conn.execute(
+                """
+              SELECT
+                COUNT(cache_hit_of)                AS cache_hits,
+                COALESCE(SUM(coalesced_count), 0)  AS coalesced_submissions,
+                COALESCE(SUM(saved_seconds), 0.0)  AS saved_seconds
+              FROM tasks
+            """
+            ).fetchone()
+        stats = dict(row)
+        stats["saved_build_hours"] = round(stats["saved_seconds"] / 3600, 2)
+        return stats
+
+    def _set_artifact(self, conn, task_id, digest, size, ingest_seconds=None,
+                      ingest_peak_rss=None):
+        conn.execute(
+            "INSERT OR REPLACE INTO artifacts "
+            "(task_id, digest, size, created_at, ingest_seconds, ingest_peak_rss) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                task_id,
+                digest,
+                size,
+                datetime.datetime.utcnow().isoformat(),
+                ingest_seconds,
+                ingest_peak_rss,
+            ),
+        )
+        conn.execute(
+            "UPDATE tasks SET has_content = 1, artifact_size = ? WHERE id = ?",
+            (size, task_id),
+        )
 
     def update_task_content(self, task_id, blob_bytes: bytes):
         """
-        Split the ZIP bytes into ~256KB chunks, base64 each slice,
-        and insert into content_chunks.
+        Write the ZIP bytes to the content store and record its digest.
         """
-        chunk_size = 256 * 1024
-        with self._lock:
-            conn = self._get_conn()
-            cur = conn.cursor()
-            cur.execute("DELETE FROM content_chunks WHERE task_id = ?", (task_id,))
-            seq = 0
-            for offset in range(0, len(blob_bytes), chunk_size):
-                slice_ = blob_bytes[offset : offset + chunk_size]
-                b64 = base64.b64encode(slice_).decode("ascii")
-                cur.execute(
-                    "INSERT INTO content_chunks(task_id, seq, data) VALUES (?, ?, ?)",
-                    (task_id, seq, b64),
-                )
-                seq += 1
-            conn.commit()
-            conn.close()
+        digest, size = self.content_store.put_bytes(blob_bytes)
+        self.set_task_artifact(task_id, digest, size)
+
+    def set_task_artifact(self, task_id, digest, size, ingest_seconds=None,
+                          ingest_peak_rss=None):
+        with self._write_conn() as conn:
+            self._set_artifact(
+                conn, task_id, digest, size, ingest_seconds, ingest_peak_rss
+            )
+
+    def get_task_artifact(self, task_id):
+        with self._read_conn() as conn:
+            row = conn.execute(
+                "SELECT digest, size, created_at, ingest_seconds, ingest_peak_rss "
+                "FROM artifacts WHERE task_id = ?",
+                (task_id,),
+            ).fetchone()
+        if not row or not self.content_store.exists(row["digest"]):
+            return None
+        artifact = dict(row)
+        artifact["path"] = self.content_store.path(row["digest"])
+        artifact["relpath"] = self.content_store.relpath(row["digest"])
+        return artifact
+
+    def set_task_resources(self, task_id, fields, interval, samples):
+        packed = zlib.compress(array("d", [v for row in samples for v in row]).tobytes())
+        with self._write_conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO task_resources (task_id, fields, interval, samples) "
+                "VALUES (?, ?, ?, ?)",
+                (task_id, ",".join(fields), interval, packed),
+            )
+
+    def get_task_resources(self, task_id):
+        with self._read_conn() as conn:
+            row = conn.execute(
+                "SELECT fields, interval, samples FROM task_resources WHERE task_id = ?",
+                (task_id,),
+            ).fetchone()
+        if not row:
+            return None
+        fields = row["fields"].split(",")
+        values = array("d")
+        values.frombytes(zlib.decompress(row["samples"]))
+        width = len(fields)
+        samples = [
+            [int(v) if v.is_integer() else v for v in values[k : k + width]]
+            for k in range(0, len(values), width)
+        ]
+        return {"fields": fields, "interval": row["interval"], "samples": samples}
 
     def get_task(self, task_id: str) -> dict:
-        conn = self._get_conn()
-        row = conn.execute(
-            """
-          SELECT
-            t.id, t.git_uri, t.status, t.created_at, t.started_at, t.finished_at,
-            CASE WHEN EXISTS(
-              SELECT 1 FROM content_chunks cc WHERE cc.task_id = t.id
-            ) THEN 1 ELSE 0 END AS has_content
-          FROM tasks t
-          WHERE t.id = ?
-        """,
-            (task_id,),
-        ).fetchone()
-        conn.close()
+        with self._read_conn() as conn:
+            row = conn.execute(
+                """
+              SELECT
+                t.id, t.git_uri, t.status, t.created_at, t.started_at, t.finished_at,
+                {meta},
+                t.has_content, t.artifact_size
+              FROM tasks t
+              WHERE t.id = ?
+            """.format(meta=", ".join(f"t.{c}" for c in self.TASK_META_COLUMNS)),
+                (task_id,),
+            ).fetchone()
         return dict(row) if row else None
 
-    def get_tasks(self):
-        conn = self._get_conn()
-        rows = conn.execute(
-            """
-          SELECT
-            t.id, t.git_uri, t.status, t.created_at, t.started_at, t.finished_at,
-            CASE WHEN EXISTS(
-              SELECT 1 FROM content_chunks cc WHERE cc.task_id = t.id
-            ) THEN 1 ELSE 0 END AS has_content
-          FROM tasks t
-          ORDER BY t.created_at
-        """
-        ).fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+    @staticmethod
+    def _encode_cursor(row):
+        raw = json.dumps([row["created_at"], row["id"]]).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
 
-    def stream_task_content(self, task_id):
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            created_at, task_id = json.loads(base64.urlsafe_b64decode(cursor))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid cursor")
+        return created_at, task_id
+
+    def get_tasks(self, status=None, git_uri=None, limit=50, cursor=None, order="desc"):
         """
-        Generator of raw bytes: re-decode each base64 chunk in order.
+        One page of tasks ordered by (created_at, id). `cursor` is the
+        `next_cursor` of the previous page; `status` may be a list.
         """
-        conn = self._get_conn()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT data FROM content_chunks WHERE task_id = ? ORDER BY seq", (task_id,)
+        descending = order != "asc"
+        where, params = [], []
+        if status:
+            statuses = [status] if isinstance(status, str) else list(status)
+            where.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if git_uri:
+            where.append("git_uri = ?")
+            params.append(git_uri)
+        if cursor:
+            where.append(f"(created_at, id) {'<' if descending else '>'} (?, ?)")
+            params.extend(self._decode_cursor(cursor))
+        direction = "DESC" if descending else "ASC"
+        sql = (
+            "SELECT id, git_uri, status, created_at, started_at, finished_at, "
+            "has_content, artifact_size FROM tasks"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + f" ORDER BY created_at {direction}, id {direction} LIMIT ?"
         )
-        for row in cur:
-            yield base64.b64decode(row["data"])
-        conn.close()
+        # Fetch one extra row to know whether another page exists
+        params.append(limit + 1)
+        with self._read_conn() as conn:
+            rows = [dict(r) for r in conn.execute(sql, params).fetchall()]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self._encode_cursor(rows[-1])
+        return {"tasks": rows, "next_cursor": next_cursor}
+
+    def stream_task_content(self, task_id):
+        """
+        Generator of raw bytes read from the content store file.
+        Prefer get_task_artifact() and serving the file directly.
+        """
+        artifact = self.get_task_artifact(task_id)
+        if not artifact:
+            return
+        with open(artifact["path"], "rb") as f:
+            while True:
+                chunk = f.read(self.STREAM_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
 
     def add_log(self, task_id, timestamp, line):
-        with self._lock:
-            conn = self._get_conn()
+        with self._write_conn() as conn:
             conn.execute(
                 "INSERT INTO logs (task_id, timestamp, line) VALUES (?, ?, ?)",
                 (task_id, timestamp, line),
             )
-            conn.commit()
-            conn.close()
+
+    def add_logs(self, rows):
+        with self._write_conn() as conn:
+            # AUTOINCREMENT: new ids are above every id ever handed out,
+            # and the single writer adds nothing else meanwhile
+            seq = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'logs'"
+            ).fetchone()
+            conn.executemany(
+                "INSERT INTO logs (task_id, timestamp, line) VALUES (?, ?, ?)", rows
+            )
+            return [
+                r[0] for r in conn.execute(
+                    "SELECT id FROM logs WHERE id > ? ORDER BY id", (seq[0] if seq else 0,)
+                )
+            ]
+
+    def index_logs(self, batch_size=5000):
+        """
+        Add up to `batch_size` not yet indexed log rows to logs_fts; once
+        those are caught up, one archived segment that is not indexed yet
+        (from before logs_fts covered them). Returns the number of rows
+        indexed.
+        """
+        if not self.fts_enabled:
+            return 0
+        with self._write_conn() as conn:
+            done = conn.execute(
+                "SELECT value FROM fts_state WHERE name = 'logs'"
+            ).fetchone()[0]
+            count, top = conn.execute(
+                "SELECT COUNT(*), MAX(id) FROM "
+                "(SELECT id FROM logs WHERE id > ? ORDER BY id LIMIT ?)",
+                (done, batch_size),
+            ).fetchone()
+            if not count:
+                return self._index_segment(conn)
+            conn.execute(
+                "INSERT INTO logs_fts (rowid, line, task_id) "
+                "SELECT id, line, task_id FROM logs WHERE id > ? AND id <= ?",
+                (done, top),
+            )
+            conn.execute("UPDATE fts_state SET value = ? WHERE name = 'logs'", (top,))
+            return count
+
+    def _index_segment(self, conn):
+        segment = conn.execute(
+            "SELECT rowid, task_id, data FROM log_segments WHERE indexed = 0 LIMIT 1"
+        ).fetchone()
+        if segment is None:
+            return 0
+        rows = decode_block(segment["data"])
+        conn.executemany(
+            "INSERT INTO logs_fts (rowid, line, task_id) VALUES (?, ?, ?)",
+            [(r["id"], r["line"], segment["task_id"]) for r in rows],
+        )
+        conn.execute("UPDATE log_segments SET indexed = 1 WHERE rowid = ?", (segment["rowid"],))
+        return len(rows)
+
+    def get_fts_lag(self):
+        """Number of log rows, hot or archived, not yet in the full-text index."""
+        if not self.fts_enabled:
+            return 0
+        with self._read_conn() as conn:
+            return conn.execute(
+                "SELECT (SELECT COUNT(*) FROM logs WHERE id > "
+                "(SELECT value FROM fts_state WHERE name = 'logs')) + "
+                "(SELECT COALESCE(SUM(line_count), 0) FROM log_segments WHERE indexed = 0)"
+            ).fetchone()[0]
+
+    @staticmethod
+    def _fts_query(text):
+        """
+        Turn free text into an FTS5 query: every word must match. Each
+        word is quoted as a phrase, so `ERROR:` is taken literally and
+        `linux-yocto` matches its tokens in sequence; a trailing `*`
+        keeps prefix matching.
+        """
+        terms = []
+        for word in text.split():
+            prefix = word.endswith("*")
+            word = word.rstrip("*")
+            if word:
+                terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+        return " ".join(terms)
+
+    def search_logs(self, query, task_id=None, limit=50):
+        if not self.fts_enabled:
+            raise RuntimeError("Full-text search is not available")
+        match = self._fts_query(query)
+        if not match:
+            return []
+        if not task_id:
+            return self._search_all_logs(match, limit)
+        sql = (
+            "SELECT l.id, l.task_id, l.timestamp, l.line, bm25(logs_fts) AS rank "
+            "FROM logs_fts JOIN logs l ON l.id = logs_fts.rowid "
+            "WHERE logs_fts MATCH ? AND l.task_id = ? ORDER BY rank LIMIT ?"
+        )
+        with self._read_conn() as conn:
+            rows = conn.execute(sql, (match, task_id, limit)).fetchall()
+        hits = [dict(r) for r in rows]
+        if len(hits) < limit:
+            hits.extend(self._scan_archived_logs(query, task_id, limit - len(hits)))
+        return hits
+
+    def _search_all_logs(self, match, limit):
+        """
+        Ranked hits across every task. logs_fts also indexes archived
+        lines, which are read back from the segments holding them.
+        """
+        with self._read_conn() as conn:
+            # One snapshot: archiving may move hits between the two reads
+            conn.execute("BEGIN")
+            try:
+                ranked = conn.execute(
+                    "SELECT rowid AS id, bm25(logs_fts) AS rank FROM logs_fts "
+                    "WHERE logs_fts MATCH ? ORDER BY rank LIMIT ?",
+                    (match, limit),
+                ).fetchall()
+                ids = [r["id"] for r in ranked]
+                found = {}
+                if ids:
+                    placeholders = ", ".join("?" * len(ids))
+                    for r in conn.execute(
+                        "SELECT id, task_id, timestamp, line FROM logs "
+                        f"WHERE id IN ({placeholders})",
+                        ids,
+                    ):
+                        found[r["id"]] = dict(r)
+                    found.update(self._archived_rows(conn, [i for i in ids if i not in found]))
+            finally:
+                conn.commit()
+        return [{**found[r["id"]], "rank": r["rank"]} for r in ranked if r["id"] in found]
+
+    @staticmethod
+    def _archived_rows(conn, ids):
+        """Rows by id, read from the segments holding them."""
+        rows = {}
+        for log_id in ids:
+            # Segments of concurrent tasks interleave: the first one whose
+            # span holds the id may not have it
+            for seg in conn.execute(
+                "SELECT task_id, data FROM log_segments WHERE last_id >= ? AND first_id <= ?",
+                (log_id, log_id),
+            ):
+                row = decode_row(seg["data"], log_id)
+                if row is not None:
+                    rows[log_id] = {**row, "task_id": seg["task_id"]}
+                    break
+        return rows
+
+    def _scan_archived_logs(self, query, task_id, limit):
+        """
+        Archived lines of one task: a linear scan of its segments is cheap
+        and needs no lookup of FTS hits. Every word must occur
+        (case-insensitive).
+        """
+        words = [w.rstrip("*").lower() for w in query.split() if w.rstrip("*")]
+        with self._read_conn() as conn:
+            blocks = conn.execute(
+                "SELECT data FROM log_segments WHERE task_id = ? ORDER BY last_id",
+                (task_id,),
+            ).fetchall()
+        hits = []
+        for block in blocks:
+            for row in decode_block(block["data"]):
+                line = row["line"].lower()
+                if all(w in line for w in words):
+                    row["task_id"] = task_id
+                    row["rank"] = None
+                    hits.append(row)
+                    if len(hits) >= limit:
+                        return hits
+        return hits
 
     def get_logs(self, task_id):
-        conn = self._get_conn()
-        rows = conn.execute(
-            "SELECT id, timestamp, line FROM logs WHERE task_id = ? ORDER BY id",
-            (task_id,),
-        ).fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        return self.get_logs_since(task_id, 0)
 
     def get_logs_since(self, task_id, after_id):
-        conn = self._get_conn()
-        rows = conn.execute(
-            "SELECT id, timestamp, line FROM logs WHERE task_id = ? AND id > ? ORDER BY id",
-            (task_id, after_id),
-        ).fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        with self._read_conn() as conn:
+            # One read transaction over both tables: archiving moves rows
+            # atomically, so a snapshot sees every row exactly once
+            conn.execute("BEGIN")
+            try:
+                blocks = conn.execute(
+                    "SELECT data FROM log_segments "
+                    "WHERE task_id = ? AND last_id > ? ORDER BY last_id",
+                    (task_id, after_id),
+                ).fetchall()
+                rows = conn.execute(
+                    "SELECT id, timestamp, line FROM logs "
+                    "WHERE task_id = ? AND id > ? ORDER BY id",
+                    (task_id, after_id),
+                ).fetchall()
+            finally:
+                conn.commit()
+        result = []
+        for block in blocks:
+            result.extend(decode_block(block["data"], after_id))
+        result.extend(dict(r) for r in rows)
+        return result
+
+    def _unindex_logs(self, conn, where, params):
+        """Remove already indexed rows matching `where` from logs_fts."""
+        if not self.fts_enabled:
+            return
+        conn.execute(
+            "INSERT INTO logs_fts (logs_fts, rowid, line, task_id) "
+            "SELECT 'delete', id, line, task_id FROM logs "
+            f"WHERE {where} AND id <= (SELECT value FROM fts_state WHERE name = 'logs')",
+            params,
+        )
+
+    def get_log_archive_candidates(self, finished_before, limit=50):
+        placeholders = ", ".join("?" * len(self.TERMINAL_STATUSES))
+        with self._read_conn() as conn:
+            rows = conn.execute(
+                "SELECT id FROM tasks WHERE log_state IS NULL "
+                f"AND status IN ({placeholders}) AND finished_at < ? "
+                "ORDER BY finished_at LIMIT ?",
+                (*self.TERMINAL_STATUSES, finished_before, limit),
+            ).fetchall()
+        return [r["id"] for r in rows]
+
+    def archive_task_logs(self, task_id, block_lines=4096):
+        """
+        Move a finished task's rows from `logs` into compressed segments,
+        one block per write transaction so the write lock is held briefly.
+        Resumable: rows left behind by an interruption are picked up by
+        the next call. Returns (rows, raw_bytes, stored_bytes).
+        """
+        total_rows = raw_bytes = stored_bytes = 0
+        last_id = 0
+        while True:
+            with self._read_conn() as conn:
+                rows = conn.execute(
+                    "SELECT id, timestamp, line FROM logs "
+                    "WHERE task_id = ? AND id > ? ORDER BY id LIMIT ?",
+                    (task_id, last_id, block_lines),
+                ).fetchall()
+            if not rows:
+                break
+            data, raw_size = encode_block(rows)
+            first_id, last_id = rows[0]["id"], rows[-1]["id"]
+            span = (task_id, first_id, last_id)
+            with self._write_conn() as conn:
+                # The lines stay in logs_fts; the indexer would no longer
+                # see any it has not reached yet, so those are added here
+                if self.fts_enabled:
+                    conn.execute(
+                        "INSERT INTO logs_fts (rowid, line, task_id) "
+                        "SELECT id, line, task_id FROM logs "
+                        "WHERE task_id = ? AND id BETWEEN ? AND ? "
+                        "AND id > (SELECT value FROM fts_state WHERE name = 'logs')",
+                        span,
+                    )
+                conn.execute(
+                    "DELETE FROM logs WHERE task_id = ? AND id BETWEEN ? AND ?", span
+                )
+                conn.execute(
+                    "INSERT INTO log_segments "
+                    "(task_id, first_id, last_id, line_count, raw_size, data, indexed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (*span, len(rows), raw_size, data, int(self.fts_enabled)),
+                )
+            total_rows += len(rows)
+            raw_bytes += raw_size
+            stored_bytes += len(data)
+
+        with self._write_conn() as conn:
+            conn.execute(
+                "UPDATE tasks SET log_state = 'archived', log_bytes = "
+                "(SELECT COALESCE(SUM(length(data)), 0) FROM log_segments WHERE task_id = ?) "
+                "WHERE id = ?",
+                (task_id, task_id),
+            )
+        return total_rows, raw_bytes, stored_bytes
+
+    def get_log_retention_candidates(self, finished_before=None, max_bytes=0):
+        """
+        Tasks whose logs fall outside the retention policy: finished
+        before `finished_before`, or (newest first) beyond `max_bytes`
+        of archived logs.
+        """
+        placeholders = ", ".join("?" * len(self.TERMINAL_STATUSES))
+        with self._read_conn() as conn:
+            rows = conn.execute(
+                "SELECT id, finished_at, COALESCE(log_bytes, 0) AS log_bytes FROM tasks "
+                "WHERE log_state IS NOT 'purged' "
+                f"AND status IN ({placeholders}) AND finished_at IS NOT NULL "
+                "ORDER BY finished_at DESC",
+                self.TERMINAL_STATUSES,
+            ).fetchall()
+        expired = []
+        kept_bytes = 0
+        for r in rows:
+            kept_bytes += r["log_bytes"]
+            too_old = finished_before and r["finished_at"] < finished_before
+            too_big = max_bytes and kept_bytes > max_bytes
+            if too_old or too_big:
+                expired.append(r["id"])
+        return expired
+
+    def purge_task_logs(self, task_id):
+        with self._write_conn() as conn:
+            self._unindex_logs(conn, "task_id = ?", (task_id,))
+            if self.fts_enabled:
+                for seg in conn.execute(
+                    "SELECT data FROM log_segments WHERE task_id = ? AND indexed = 1",
+                    (task_id,),
+                ).fetchall():
+                    conn.executemany(
+                        "INSERT INTO logs_fts (logs_fts, rowid, line, task_id) "
+                        "VALUES ('delete', ?, ?, ?)",
+                        [(r["id"], r["line"], task_id) for r in decode_block(seg["data"])],
+                    )
+            conn.execute("DELETE FROM logs WHERE task_id = ?", (task_id,))
+            conn.execute("DELETE FROM log_segments WHERE task_id = ?", (task_id,))
+            conn.execute(
+                "UPDATE tasks SET log_state = 'purged', log_bytes = 0 WHERE id = ?",
+                (task_id,),
+            )
+
+    def reclaim_space(self, step_pages=2000):
+        """
+        Fold the delete markers left in logs_fts into its segments, then,
+        if the database was created with incremental auto-vacuum, return
+        free pages to the filesystem (otherwise they are reused in place).
+        Both run in bounded steps, each in its own write transaction.
+        """
+        while self.fts_enabled:
+            with self._write_conn() as conn:
+                before = conn.total_changes
+                conn.execute(
+                    "INSERT INTO logs_fts (logs_fts, rank) VALUES ('merge', ?)",
+                    (-step_pages,),
+                )
+                if conn.total_changes - before < 2:
+                    break
+        while True:
+            with self._write_conn() as conn:
+                if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+                    return
+                free = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+                if not free:
+                    return
+                # execute() would step the pragma once and free a single page
+                conn.executescript(f"PRAGMA incremental_vacuum({min(free, step_pages)});")
+
+    def get_log_storage_stats(self):
+        with self._read_conn() as conn:
+            hot_rows = conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+            seg = conn.execute(
+                """
+              SELECT
+                COUNT(*)                          AS segments,
+                COALESCE(SUM(line_count), 0)      AS archived_rows,
+                COALESCE(SUM(raw_size), 0)        AS archived_raw_bytes,
+                COALESCE(SUM(length(data)), 0)    AS archived_bytes
+              FROM log_segments
+            """
+            ).fetchone()
+            page_size = conn.execute("PRAGMA page_size;").fetchone()[0]
+            pages = conn.execute("PRAGMA page_count;").fetchone()[0]
+            free_pages = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        stats = {"hot_rows": hot_rows, **dict(seg)}
+        stats["db_bytes"] = pages * page_size
+        stats["db_free_bytes"] = free_pages * page_size
+        return stats
+
+
+def _timed(name, fn):
+    series = DB_CALL_SECONDS.labels(name)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            series.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+# Time every public DB method; generators are skipped since the call
+# itself only creates the iterator
+for _name in sorted(DBInterface.__abstractmethods__):
+    _fn = getattr(SQLiteDB, _name)
+    if not inspect.isgeneratorfunction(_fn):
+        setattr(SQLiteDB, _name, _timed(_name, _fn))
@@ -0,0 +1,185 @@
+import os
+import re
+import hmac
+from flask import Blueprint, request, jsonify
+from job_queue import job_queue, Job
+from agent_registry import agent_registry
+from db import db, log_writer, content_store
+
+agents_bp = Blueprint("agents", __name__)
+
+# Shared secret agents send in X-Agent-Token; unset, any host may register
+AGENT_TOKEN = os.environ.get("AGENT_TOKEN") or None
+MAX_LEASE_WAIT = 30
+# Task database calls an agent makes on behalf of the job it runs
+FORWARDED_CALLS = ("update_task_status", "update_task_metadata", "set_task_resources")
+FINAL_STATUSES = (Job.STATUS_FINISHED, Job.STATUS_FAILED, Job.STATUS_CANCELED)
+
+@agents_bp.before_request
+def check_token():
+    if request.endpoint == "agents.list_agents" or AGENT_TOKEN is None:
+        return None
+    if not hmac.compare_digest(request.headers.get("X-Agent-Token", ""), AGENT_TOKEN):
+        return jsonify({"error": "Invalid agent token"}), 403
+    return None
+
+def _lookup(agent_id, job_id=None):
+    """Return (agent, job, error response); the job must be leased to the agent."""
+    agent = agent_registry.get(agent_id)
+    if agent is None:
+        return None, None, (jsonify({"error": "Unknown agent, register again"}), 404)
+    if job_id is None:
+        return agent, None, None
+    job = job_queue.leased(agent.id, job_id)
+    if job is None:
+        return agent, None, (jsonify({"error": "Job is not leased to this agent"}), 409)
+    return agent, job, None
+
+@agents_bp.route("/agents")
+def list_agents():
+    return jsonify({"agents": agent_registry.snapshot()})
+
+@agents_bp.route("/agents/register", methods=["POST"])
+def register():
+    body = request.get_json(silent=True) or {}
+    name = str(body.get("name", "")).strip()
+    if not name:
+        return jsonify({"error": "No agent name provided"}), 400
+    labels = body.get("labels", [])
+    capabilities = body.get("capabilities", {})
+    if not isinstance(labels, list) or not isinstance(capabilities, dict):
+        return jsonify({"error": "labels must be a list and capabilities an object"}), 400
+    agent = agent_registry.register(name, [str(label) for label in labels], capabilities)
+    return jsonify({
+        "agent_id": agent.id,
+        "heartbeat_seconds": agent_registry.heartbeat_interval,
+        "lost_seconds": agent_registry.lost_after,
+    })
+
+@agents_bp.route("/agents/<agent_id>/heartbeat", methods=["POST"])
+def heartbeat(agent_id):
+    agent, _, error = _lookup(agent_id)
+    if error:
+        return error
+    body = request.get_json(silent=True) or {}
+    cancel = agent_registry.heartbeat(agent, body.get("running", []), body.get("load", {}))
+    return jsonify({"cancel": cancel})
+
+@agents_bp.route("/agents/<agent_id>/lease", methods=["POST"])
+def lease(agent_id):
+    agent, _, error = _lookup(agent_id)
+    if error:
+        return error
+    body = request.get_json(silent=True) or {}
+    wait = min(max(float(body.get("wait", 0)), 0.0), MAX_LEASE_WAIT)
+    job = agent_registry.lease(agent, wait)
+    if job is None:
+        return "", 204
+    return jsonify({
+        "id": job.id,
+        "git_uri": job.git_uri,
+        "commit": job.commit,
+        "weight": job.weight,
+        "use_workspace": job.workspace_requested,
+        "collapse_progress": job.output.enabled,
+        "priority": job.priority,
+        "submitter": job.submitter,
+        "labels": sorted(job.labels),
+        "created_at": job.created_at,
+        "timeout": job.timeout,
+        "attempt": job.attempts,
+    })
+
+@agents_bp.route("/agents/<agent_id>/logs", methods=["POST"])
+def add_logs(agent_id):
+    """
+    A batch of (task_id, timestamp, line) rows from any of the agent's
+    jobs. Rows of jobs it no longer holds are dropped and their ids
+    returned in `lost`.
+    """
+    agent, _, error = _lookup(agent_id)
+    if error:
+        return error
+    rows = (request.get_json(silent=True) or {}).get("rows", [])
+    lost = set()
+    for task_id, timestamp, line in rows:
+        if task_id in lost or job_queue.leased(agent.id, task_id) is None:
+            lost.add(task_id)
+            continue
+        log_writer.add(task_id, timestamp, line)
+    return jsonify({"lost": sorted(lost)})
+
+@agents_bp.route("/agents/<agent_id>/jobs/<job_id>/task", methods=["POST"])
+def task_call(agent_id, job_id):
+    _, job, error = _lookup(agent_id, job_id)
+    if error:
+        return error
+    body = request.get_json(silent=True) or {}
+    method = body.get("method")
+    if method not in FORWARDED_CALLS:
+        return jsonify({"error": f"Unsupported call {method!r}"}), 400
+    kwargs = body.get("kwargs", {})
+    if method == "update_task_status" and job.status == Job.STATUS_CANCELED:
+        # Killed on the server: the agent will hear of it at its next heartbeat
+        return jsonify({"ignored": True})
+    try:
+        getattr(db, method)(job.id, **kwargs)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"ignored": False})
+
+@agents_bp.route("/agents/<agent_id>/jobs/<job_id>/artifact", methods=["POST", "PUT"])
+def artifact(agent_id, job_id):
+    """
+    Record the job's artifact, given by `digest`, `ingest_seconds` and
+    `ingest_peak_rss` query arguments. A POST succeeds, with
+    {"stored": true}, only if the server already stores that content;
+    otherwise ({"stored": false}) the agent PUTs the file, which is
+    streamed to the content store and checked against its digest.
+    """
+    _, job, error = _lookup(agent_id, job_id)
+    if error:
+        return error
+    digest = request.args.get("digest", "")
+    if not re.fullmatch(r"[0-9a-f]{64}", digest):
+        return jsonify({"error": "Invalid digest"}), 400
+    ingest = {
+        "ingest_seconds": request.args.get("ingest_seconds", type=float),
+        "ingest_peak_rss": request.args.get("ingest_peak_rss", type=int),
+    }
+
+    if request.method == "POST":
+        if not content_store.exists(digest):
+            return jsonify({"stored": False})
+        size = os.path.getsize(content_store.path(digest))
+    else:
+        with content_store.writer() as w:
+            while True:
+                block = request.stream.read(content_store.COPY_CHUNK)
+                if not block:
+                    break
+                w.write(block)
+            if w.hexdigest() != digest:
+                w.abort()
+                return jsonify({"error": "Digest mismatch, upload again"}), 422
+            _, size = w.commit()
+    db.set_task_artifact(job.id, digest, size, **ingest)
+    return jsonify({"stored": True, "size": size})
+
+@agents_bp.route("/agents/<agent_id>/jobs/<job_id>/done", methods=["POST"])
+def done(agent_id, job_id):
+    """End of a lease: the job's final status, or "queued" when a stopping agent hands it back."""
+    agent, job, error = _lookup(agent_id, job_id)
+    if error:
+        return error
+    body = request.get_json(silent=True) or {}
+    status = body.get("status")
+    if status == Job.STATUS_QUEUED:
+        # Not the job's fault: does not count against AGENT_MAX_ATTEMPTS
+        job.attempts -= 1
+        job_queue.requeue(job, f"Agent {agent.name} stopped")
+        return jsonify({"message": f"Job {job.id} handed back"})
+    if status not in FINAL_STATUSES:
+        return jsonify({"error": "Invalid final status"}), 400
+    job_queue.release(job, status, body.get("finished_at"))
+    return jsonify({"message": f"Job {job.id} released"})
@@ -1,30 +1,115 @@
-from flask import Blueprint, jsonify
-import psutil
+from flask import Blueprint, Response, jsonify, request
+import os
 import shutil
+from db import db, log_writer, log_indexer, log_archiver
+from metrics_sampler import metrics_sampler
+from mirror_gc import mirror_gc
+from telemetry import registry
 
 metrics_bp = Blueprint("metrics", __name__)
 
+MAX_HISTORY_WINDOW = 24 * 3600
+
+# Readers below only look at the sampler's latest sample
+
+def read_cpu():
+    return {"cpu_percent": metrics_sampler.latest()["cpu_percent"]}
+
+def read_memory():
+    s = metrics_sampler.latest()
+    return {
+        "total":     int(s["mem_total"]),
+        "available": int(s["mem_available"]),
+        "percent":   s["mem_percent"]
+    }
+
+def read_disks():
+    return {name: metrics_sampler.disk(name) for name in metrics_sampler.disks}
+
+def read_disk(path="/"):
+    path = os.path.abspath(path)
+    for name, sampled in metrics_sampler.disks.items():
+        if sampled == path:
+            return metrics_sampler.disk(name)
+    du = shutil.disk_usage(path)
+    percent = round(du.used / du.total * 100, 1)
+    return {
+        "total":   du.total,
+        "used":    du.used,
+        "free":    du.free,
+        "percent": percent
+    }
+
 @metrics_bp.route("/metrics/cpu")
 def metrics_cpu():
-    percent = psutil.cpu_percent(interval=None)
-    return jsonify({"cpu_percent": percent})
+    return jsonify(read_cpu())
 
 @metrics_bp.route("/metrics/memory")
 def metrics_memory():
-    m = psutil.virtual_memory()
-    return jsonify({
-        "total":     m.total,
-        "available": m.available,
-        "percent":   m.percent
-    })
+    return jsonify(read_memory())
 
 @metrics_bp.route("/metrics/disk")
 def metrics_disk():
-    du = shutil.disk_usage("/")
-    percent = round(du.used / du.total * 100, 1)
+    # Top-level figures are those of the fullest volume
+    mounts = read_disks()
+    name = max(mounts, key=lambda n: mounts[n]["percent"])
+    return jsonify({**mounts[name], "mount": name, "mounts": mounts})
+
+@metrics_bp.route("/metrics/latest")
+def metrics_latest():
+    return jsonify({"cpu": read_cpu(), "memory": read_memory(), "disks": read_disks()})
+
+@metrics_bp.route("/metrics/history")
+def metrics_history():
+    # type=float would fall back to the default on a malformed value
+    try:
+        window = float(request.args.get("window", "3600"))
+    except ValueError:
+        window = None
+    if window is None or not 0 < window <= MAX_HISTORY_WINDOW:
+        return jsonify({"error": "Invalid window"}), 400
     return jsonify({
-        "total":   du.total,
-        "used":    du.used,
-        "free":    du.free,
-        "percent": percent
+        "interval": metrics_sampler.interval,
+        "samples": metrics_sampler.window(window),
     })
+
+@metrics_bp.route("/metrics/logs")
+def metrics_logs():
+    return jsonify(log_writer.stats())
+
+@metrics_bp.route("/metrics/db")
+def metrics_db():
+    return jsonify(db.stats())
+
+@metrics_bp.route("/metrics/cache")
+def metrics_cache():
+    return jsonify(db.get_cache_stats())
+
+@metrics_bp.route("/metrics/search")
+def metrics_search():
+    return jsonify(log_indexer.stats())
+
+@metrics_bp.route("/metrics/log_storage")
+def metrics_log_storage():
+    return jsonify(log_archiver.stats())
+
+
+@metrics_bp.route("/metrics/mirror_gc")
+def metrics_mirror_gc():
+    """
+    GC counters and last pass. ?dry_run=1 starts a pass reporting what
+    would be evicted now, in the background since it scans the whole
+    mirror, and returns the last finished dry-run report.
+    """
+    if mirror_gc is None:
+        return jsonify({"enabled": False})
+    if request.args.get("dry_run") == "1":
+        mirror_gc.request_dry_run()
+        return jsonify({"running": mirror_gc.dry_run_running(), "report": mirror_gc.last_dry_run})
+    return jsonify({"enabled": True, **mirror_gc.stats()})
+
+
+@metrics_bp.route("/metrics")
+def prometheus():
+    """Every registered instrument, in the Prometheus text format."""
+    return Response(registry.render(), content_type=registry.CONTENT_TYPE)
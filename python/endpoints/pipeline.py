@@ -1,7 +1,9 @@
-from flask import Blueprint, request, jsonify, Response
-from job_queue import job_queue, Job
+from flask import Blueprint, request, jsonify
+from job_queue import job_queue
 from db import db
 
+# Queue control and live job state; task history, logs and downloads,
+# which only read the database, are in endpoints/tasks.py
 pipeline_bp = Blueprint("pipeline", __name__)
 
 @pipeline_bp.route("/enqueue", methods=["POST"])
@@ -9,17 +11,36 @@ def enqueue():
     git_uri = request.form.get("git_uri", "").strip()
     if not git_uri:
         return jsonify({"error": "No Git URI provided"}), 400
-    job = job_queue.add_job(Job(git_uri))
-    return jsonify({"message": "Job enqueued", "job_id": job.id})
-
-@pipeline_bp.route("/tasks", methods=["GET"])
-def list_tasks():
-    tasks = db.get_tasks()
-    return jsonify(tasks)
+    weight = request.form.get("weight", default=1.0, type=float)
+    if weight is None or weight <= 0:
+        return jsonify({"error": "Invalid weight"}), 400
+    clean_build = request.form.get("clean_build", "") in ("1", "true", "on")
+    force = request.form.get("force", "") in ("1", "true", "on")
+    keep_progress = request.form.get("keep_progress", "") in ("1", "true", "on")
+    priority = request.form.get("priority", default=0, type=int)
+    if priority is None:
+        return jsonify({"error": "Invalid priority"}), 400
+    job_id, outcome = job_queue.submit(
+        git_uri,
+        weight=weight,
+        use_workspace=not clean_build,
+        force=force,
+        collapse_progress=not keep_progress,
+        priority=priority,
+        submitter=request.form.get("submitter", "").strip() or None,
+        labels=[label.strip() for label in request.form.get("labels", "").split(",") if label.strip()],
+    )
+    messages = {
+        "queued": "Job enqueued",
+        "coalesced": "Same commit already queued or running",
+        "cached": "Artifact for this commit reused",
+    }
+    return jsonify({"message": messages[outcome], "job_id": job_id, "outcome": outcome})
 
 @pipeline_bp.route("/kill", methods=["POST"])
 def kill_job():
-    success, msg = job_queue.kill_current_job()
+    job_id = request.form.get("job_id", "").strip() or None
+    success, msg = job_queue.kill_job(job_id)
     return (
         (jsonify({"message": msg}), 200) if success else (jsonify({"error": msg}), 400)
     )
@@ -34,28 +55,70 @@ def remove_job():
         (jsonify({"message": msg}), 200) if success else (jsonify({"error": msg}), 400)
     )
 
-@pipeline_bp.route("/logs_json/<job_id>")
-def logs_json(job_id):
-    after_id = request.args.get("after_id", default=0, type=int)
-    rows = db.get_logs_since(job_id, after_id)
-    return jsonify(rows)
-
-@pipeline_bp.route("/tasks/<job_id>/download")
-def download_content(job_id):
-    task = db.get_task(job_id)
-    if not task or not task["has_content"]:
-        return jsonify({"error": "No content available"}), 404
-
-    headers = {"Content-Disposition": f'attachment; filename="{job_id}.zip"'}
-    return Response(
-        db.stream_task_content(job_id),
-        mimetype="application/zip",
-        headers=headers
+@pipeline_bp.route("/bump", methods=["POST"])
+def bump_job():
+    job_id = request.form.get("job_id", "").strip()
+    if not job_id:
+        return jsonify({"error": "No job ID provided"}), 400
+    priority = request.form.get("priority", type=int)
+    if priority is None:
+        return jsonify({"error": "Invalid priority"}), 400
+    success, msg = job_queue.bump(job_id, priority)
+    return (
+        (jsonify({"message": msg}), 200) if success else (jsonify({"error": msg}), 400)
     )
 
+@pipeline_bp.route("/queue")
+def queue_state():
+    return jsonify(job_queue.queue_snapshot())
+
+@pipeline_bp.route("/tasks/<job_id>/resources")
+def task_resources(job_id):
+    job = next((j for j in job_queue.running_jobs() if j.id == job_id), None)
+    if job and job.monitor:
+        # Still running: serve the live series
+        monitor = job.monitor
+        return jsonify({
+            "fields": list(monitor.FIELDS),
+            "interval": monitor.interval,
+            "samples": list(monitor.samples),
+            "running": True,
+        })
+    resources = db.get_task_resources(job_id)
+    if not resources:
+        return jsonify({"error": "No resource usage recorded"}), 404
+    resources["running"] = False
+    return jsonify(resources)
+
+def _job_summary(job):
+    return {
+        "id": job.id,
+        "git_uri": job.git_uri,
+        "status": job.status,
+        "weight": job.weight,
+        "priority": job.priority,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+@pipeline_bp.route("/jobs/<job_id>")
+def job_info(job_id):
+    # Live job, recent summary, or the task row for older jobs
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(_job_summary(job))
+
 @pipeline_bp.route("/current")
-def current_job():
-    cj = job_queue.current_job
-    if cj:
-        return jsonify({"id": cj.id, "git_uri": cj.git_uri, "status": cj.status})
-    return jsonify({"message": "No job is currently running."})
+def current_jobs():
+    jobs = job_queue.running_jobs()
+    if jobs:
+        return jsonify({"jobs": [_job_summary(j) for j in jobs]})
+    return jsonify({"jobs": [], "message": "No job is currently running."})
+
+@pipeline_bp.route("/current/<job_id>")
+def current_job(job_id):
+    job = next((j for j in job_queue.running_jobs() if j.id == job_id), None)
+    if job:
+        return jsonify(_job_summary(job))
+    return jsonify({"error": "Job is not running"}), 404
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+from flask import (
+    Blueprint, request, jsonify, Response, send_file, stream_with_context
+)
+from db import db, log_hub, log_follower
+
+# Read-only routes over the database and content store: served by every
+# web process in the multi-process mode (see web.py)
+tasks_bp = Blueprint("tasks", __name__)
+
+TERMINAL_STATUSES = db.TERMINAL_STATUSES
+STREAM_KEEPALIVE = 15
+MAX_TASKS_PAGE = 500
+MAX_SEARCH_HITS = 500
+
+@tasks_bp.route("/tasks", methods=["GET"])
+def list_tasks():
+    limit = request.args.get("limit", default=50, type=int)
+    if limit is None or not 1 <= limit <= MAX_TASKS_PAGE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_TASKS_PAGE}"}), 400
+    order = request.args.get("order", "desc")
+    if order not in ("asc", "desc"):
+        return jsonify({"error": "order must be asc or desc"}), 400
+    statuses = [s for s in request.args.get("status", "").split(",") if s]
+    try:
+        page = db.get_tasks(
+            status=statuses or None,
+            git_uri=request.args.get("git_uri") or None,
+            limit=limit,
+            cursor=request.args.get("cursor") or None,
+            order=order,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page)
+
+@tasks_bp.route("/logs_json/<job_id>")
+def logs_json(job_id):
+    after_id = request.args.get("after_id", default=0, type=int)
+    rows = db.get_logs_since(job_id, after_id)
+    return jsonify(rows)
+
+@tasks_bp.route("/logs_stream/<job_id>")
+def logs_stream(job_id):
+    """
+    Server-Sent Events tail of a task's log. Each event carries a JSON
+    list of rows and the last row id, so a reconnecting EventSource
+    resumes from Last-Event-ID. Ends with a `done` event.
+    """
+    after_id = request.headers.get("Last-Event-ID", type=int)
+    if after_id is None:
+        after_id = request.args.get("after_id", default=0, type=int)
+
+    def events(last_id):
+        # A web process follows the task in the database for all of its
+        # viewers at once; the scheduler process publishes as it writes
+        following = log_follower is not None and log_follower.follow(job_id, last_id)
+        try:
+            yield from _events(last_id)
+        finally:
+            if following:
+                log_follower.unfollow(job_id)
+
+    def _events(last_id):
+        idle = 0.0
+        while True:
+            res = log_hub.read(job_id, last_id, timeout=STREAM_KEEPALIVE)
+            if res is None:
+                # Not (or no longer) in the live tail: catch up from the DB
+                rows = db.get_logs_since(job_id, last_id)
+                task = db.get_task(job_id)
+                done = not task or task["status"] in TERMINAL_STATUSES
+                if not rows and not done:
+                    time.sleep(1)
+                    idle += 1
+            else:
+                rows, done = res
+            if rows:
+                idle = 0.0
+                last_id = rows[-1]["id"]
+                yield f"id: {last_id}\ndata: {json.dumps(rows)}\n\n"
+            elif done:
+                yield "event: done\ndata: {}\n\n"
+                return
+            elif res is not None or idle >= STREAM_KEEPALIVE:
+                idle = 0.0
+                yield ": keepalive\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(
+        stream_with_context(events(after_id)),
+        mimetype="text/event-stream",
+        headers=headers,
+    )
+
+@tasks_bp.route("/logs/search")
+def search_logs():
+    """
+    Ranked full-text hits over log lines, for one task (task_id) or all.
+    Each hit's id can be passed as after_id (minus one) to /logs_json.
+    """
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "No query provided"}), 400
+    limit = request.args.get("limit", default=50, type=int)
+    if limit is None or not 1 <= limit <= MAX_SEARCH_HITS:
+        return jsonify({"error": f"limit must be between 1 and {MAX_SEARCH_HITS}"}), 400
+    try:
+        hits = db.search_logs(
+            query, task_id=request.args.get("task_id") or None, limit=limit
+        )
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify(hits)
+
+@tasks_bp.route("/tasks/<job_id>/download")
+def download_content(job_id):
+    artifact = db.get_task_artifact(job_id)
+    if not artifact:
+        return jsonify({"error": "No content available"}), 404
+
+    filename = f"{job_id}.zip"
+    accel_prefix = os.environ.get("ARTIFACT_ACCEL_PREFIX")
+    if accel_prefix:
+        # Behind nginx: let it serve the file with sendfile. Its own ETag
+        # is built from mtime and size, so the digest ETag is passed on
+        # for nginx to send instead (see nginx.conf); If-None-Match is
+        # answered here, Range and If-Range by nginx against that ETag
+        if request.if_none_match.contains_weak(artifact["digest"]):
+            response = Response(status=304)
+        else:
+            response = Response(mimetype="application/zip", headers={
+                "Content-Disposition": f'attachment; filename="{filename}"',
+                "X-Accel-Redirect": accel_prefix + artifact["relpath"],
+            })
+        response.set_etag(artifact["digest"])
+        return response
+
+    # The blob is content-addressed, so its digest is a strong validator:
+    # Range/If-Range, If-None-Match and HEAD are answered by send_file,
+    # which seeks straight to the requested offset
+    return send_file(
+        artifact["path"],
+        mimetype="application/zip",
+        as_attachment=True,
+        download_name=filename,
+        etag=artifact["digest"],
+        conditional=True,
+    )
+
@@ -0,0 +1,244 @@
+# git_cache.py
+import os
+import re
+import fcntl
+import shutil
+import hashlib
+import subprocess
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+
+
+def normalize_uri(git_uri):
+    """
+    Canonical form of a git URI so trivially different spellings of the
+    same repository share one mirror: scheme and host are lowercased,
+    credentials, trailing slashes and a trailing `.git` are dropped.
+    """
+    uri = git_uri.strip()
+    if "://" in uri:
+        parts = urlsplit(uri)
+        host = parts.hostname or ""
+        if parts.port:
+            host = f"{host}:{parts.port}"
+        uri = urlunsplit((parts.scheme.lower(), host.lower(), parts.path, "", ""))
+    else:
+        # scp-like syntax: [user@]host:path
+        m = re.match(r"^(?:[^@/]+@)?([^:/]+):(.*)$", uri)
+        if m:
+            uri = f"ssh://{m.group(1).lower()}/{m.group(2).lstrip('/')}"
+    uri = uri.rstrip("/")
+    if uri.endswith(".git"):
+        uri = uri[:-4]
+    return uri
+
+
+def resolve_head(git_uri, env=None, timeout=30):
+    """
+    Return the commit the remote's HEAD points to, using a cheap
+    `git ls-remote`, or None if it cannot be resolved.
+    """
+    try:
+        out = subprocess.run(
+            ["git", "ls-remote", git_uri, "HEAD"],
+            capture_output=True,
+            env=env,
+            timeout=timeout,
+            check=True,
+        ).stdout
+    except (subprocess.SubprocessError, OSError):
+        return None
+    for line in out.decode("utf-8", errors="replace").splitlines():
+        sha, _, ref = line.partition("\t")
+        if ref == "HEAD" and re.fullmatch(r"[0-9a-f]{40,64}", sha):
+            return sha
+    return None
+
+
+def resolve_url(base_uri, url):
+    """
+    Absolute URL of a submodule: a relative URL (./ or ../) is relative
+    to the superproject's remote, as git resolves it.
+    """
+    if not url.startswith(("./", "../")):
+        return url
+    base = base_uri.rstrip("/")
+    sep = "/"
+    for part in url.split("/"):
+        if part == "..":
+            cut = base.rfind("/")
+            colon = base.rfind(":")
+            if colon > cut and "://" not in base:
+                # scp-like host:repo
+                base, sep = base[:colon], ":"
+            else:
+                base, sep = base[:cut], "/"
+        elif part and part != ".":
+            base, sep = f"{base}{sep}{part}", "/"
+    return base
+
+
+def submodules(checkout):
+    """
+    Return [(path, url)] of the submodules declared in the .gitmodules
+    of `checkout`, in file order, or [] if it has none.
+    """
+    gitmodules = os.path.join(checkout, ".gitmodules")
+    if not os.path.isfile(gitmodules):
+        return []
+    out = subprocess.run(
+        ["git", "config", "-f", gitmodules, "-z", "--get-regexp", r"^submodule\..*\.(path|url)$"],
+        capture_output=True,
+    ).stdout.decode("utf-8", errors="replace")
+    found = {}
+    for entry in filter(None, out.split("\0")):
+        key, _, value = entry.partition("\n")
+        name, _, field = key[len("submodule."):].rpartition(".")
+        found.setdefault(name, {})[field] = value
+    return [(m["path"], m["url"]) for m in found.values() if "path" in m and "url" in m]
+
+
+class GitMirrorCache:
+    """
+    Bare mirror repositories keyed by normalized git URI, refreshed with
+    an incremental fetch and used as a clone `--reference`.
+
+    Each mirror has a lock file next to it; an exclusive flock is held
+    while a mirror is fetched or cloned from, so concurrent jobs (in any
+    process) on the same repository are serialized, and eviction skips
+    mirrors in use. The lock file's mtime doubles as the LRU timestamp.
+    """
+
+    def __init__(self, root, budget_bytes=0):
+        self.root = os.path.abspath(root)
+        self.budget_bytes = budget_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, git_uri):
+        norm = normalize_uri(git_uri)
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", norm.rsplit("/", 1)[-1])[:40]
+        digest = hashlib.sha1(norm.encode("utf-8")).hexdigest()[:16]
+        return f"{slug}-{digest}"
+
+    def mirror_path(self, git_uri):
+        return os.path.join(self.root, self.key(git_uri) + ".git")
+
+    @contextmanager
+    def _locked(self, mirror, blocking=True):
+        fd = os.open(mirror + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(fd, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def checkout(self, git_uri, run):
+        """
+        Bring the mirror for `git_uri` up to date and yield
+        (mirror_path, hit) while holding its lock. `run` executes a git
+        command list (so output and kill handling stay with the job).
+        A half-written mirror (no HEAD) is discarded and cloned again.
+        """
+        mirror = self.mirror_path(git_uri)
+        with self._locked(mirror):
+            os.utime(mirror + ".lock")
+            hit = os.path.isfile(os.path.join(mirror, "HEAD"))
+            if hit:
+                run(["git", "-C", mirror, "remote", "update", "--prune"])
+            else:
+                shutil.rmtree(mirror, ignore_errors=True)
+                try:
+                    run(["git", "clone", "--mirror", git_uri, mirror])
+                except Exception:
+                    shutil.rmtree(mirror, ignore_errors=True)
+                    raise
+            yield mirror, hit
+
+    def update_submodules(self, git_uri, checkout, run):
+        """
+        Check out the submodules of `checkout`, a clone of `git_uri`, and
+        theirs in turn, each borrowing objects from its own mirror. Only
+        one mirror lock is held at a time. Returns the number of
+        submodules checked out.
+        """
+        modules = submodules(checkout)
+        if modules:
+            # A warm workspace may hold URLs from an older .gitmodules
+            run(["git", "-C", checkout, "submodule", "sync"])
+        count = 0
+        for path, url in modules:
+            sub_uri = resolve_url(git_uri, url)
+            with self.checkout(sub_uri, run) as (mirror, _hit):
+                run(["git", "-C", checkout, "submodule", "update", "--init",
+                     "--reference", mirror, "--dissociate", "--", path])
+            count += 1 + self.update_submodules(sub_uri, os.path.join(checkout, path), run)
+        return count
+
+    def entries(self):
+        """Return [(mirror_path, last_used, size_bytes)] for every mirror."""
+        result = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".git"):
+                continue
+            mirror = os.path.join(self.root, name)
+            try:
+                last_used = os.path.getmtime(mirror + ".lock")
+            except OSError:
+                last_used = 0.0
+            result.append((mirror, last_used, dir_size(mirror)))
+        return result
+
+    def evict(self):
+        """
+        Remove least recently used mirrors until the cache fits the byte
+        budget. Mirrors currently locked by a job are skipped.
+        Returns the list of evicted mirror paths.
+        """
+        if not self.budget_bytes:
+            return []
+        entries = sorted(self.entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        evicted = []
+        for mirror, _last_used, size in entries:
+            if total <= self.budget_bytes:
+                break
+            with self._locked(mirror, blocking=False) as acquired:
+                if not acquired:
+                    continue
+                # The lock file stays: waiters may already hold it open
+                shutil.rmtree(mirror, ignore_errors=True)
+            total -= size
+            evicted.append(mirror)
+        return evicted
+
+
+def dir_size(path):
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+# Shared mirror cache on the mirror volume; GIT_CACHE_DIR="" disables it
+_cache_dir = os.environ.get("GIT_CACHE_DIR", "yocto-mirror/git-cache")
+git_cache = (
+    GitMirrorCache(
+        _cache_dir,
+        budget_bytes=int(float(os.environ.get("GIT_CACHE_BUDGET_GB", "20")) * 1024**3),
+    )
+    if _cache_dir
+    else None
+)
@@ -1,15 +1,97 @@
 # job.py
-from db import db
 import os
+import sys
 import subprocess
 import threading
 import time
 import uuid
 import datetime
-import signal
 import logging
 import shutil
 import tempfile
+import zipfile
+import hashlib
+import psutil
+from runner import CommandRunner, ProgressCollapser
+from resource_monitor import ResourceMonitor
+from git_cache import git_cache, normalize_uri
+from workspace_pool import workspace_pool
+from telemetry import registry
+
+# Seconds between kept states of a collapsed progress line
+PROGRESS_SNAPSHOT_SECONDS = float(os.environ.get("LOG_PROGRESS_SNAPSHOT", "30"))
+
+# Resource accounting of build processes; a delegated cgroup v2 directory
+# in JOB_CGROUP_ROOT also covers processes that leave the process tree
+RESOURCE_SAMPLE_SECONDS = float(os.environ.get("JOB_SAMPLE_INTERVAL", "5"))
+CGROUP_ROOT = os.environ.get("JOB_CGROUP_ROOT") or None
+
+QUEUE_WAIT_SECONDS = registry.histogram(
+    "buildos_queue_wait_seconds", "Time jobs spent queued before starting"
+)
+JOB_PHASE_SECONDS = registry.histogram(
+    "buildos_job_phase_seconds", "Duration of build phases", ["phase"]
+)
+JOB_DURATION_SECONDS = registry.histogram(
+    "buildos_job_duration_seconds", "Run time of jobs by final status", ["status"]
+)
+
+# Where jobs record their state, logs and artifacts: the server's
+# database (see job_queue), or the HTTP client of a worker agent (see
+# agent.py). This module never opens the database itself.
+db = log_writer = log_hub = content_store = None
+
+
+def bind(task_db, writer, hub, store):
+    """Set the task database, log writer, log hub and content store."""
+    global db, log_writer, log_hub, content_store
+    db, log_writer, log_hub, content_store = task_db, writer, hub, store
+
+
+def git_env():
+    """Environment for git/build commands; HOME holds the git credentials."""
+    env = os.environ.copy()
+    env["HOME"] = os.path.abspath(os.path.dirname(__file__))
+    return env
+
+
+class JobSummary:
+    """
+    What is kept of a job once it is no longer queued or running: a few
+    fields, without the Job's event, process, monitor and build directory.
+    """
+
+    __slots__ = (
+        "id", "git_uri", "status", "weight", "priority", "submitter",
+        "created_at", "started_at", "finished_at",
+    )
+
+    def __init__(self, id, git_uri, status, weight=None, priority=None, submitter=None,
+                 created_at=None, started_at=None, finished_at=None):
+        self.id = id
+        self.git_uri = git_uri
+        self.status = status
+        self.weight = weight
+        self.priority = priority
+        self.submitter = submitter
+        self.created_at = created_at
+        self.started_at = started_at
+        self.finished_at = finished_at
+
+    @classmethod
+    def from_job(cls, job):
+        return cls(
+            job.id, job.git_uri, job.status, job.weight, job.priority, job.submitter,
+            job.created_at, job.started_at, job.finished_at,
+        )
+
+    @classmethod
+    def from_task(cls, task):
+        """Build from a db.get_task() row; weight is not stored."""
+        return cls(
+            task["id"], task["git_uri"], task["status"], None, task["priority"],
+            task["submitter"], task["created_at"], task["started_at"], task["finished_at"],
+        )
 
 
 class Job:
@@ -19,84 +101,314 @@ class Job:
     STATUS_FAILED = "failed"
     STATUS_CANCELED = "canceled"
 
-    def __init__(self, git_uri):
-        self.id = str(uuid.uuid4())
+    def __init__(self, git_uri, weight=1.0, use_workspace=True, commit=None,
+                 collapse_progress=True, priority=0, submitter=None, labels=(),
+                 task_id=None):
+        # A task_id means the task already exists: a worker agent runs a
+        # job the server created and leased to it
+        self.id = task_id or str(uuid.uuid4())
         self.git_uri = git_uri
+        self.uri_key = normalize_uri(git_uri)
+        # Remote HEAD resolved at enqueue time, used to coalesce duplicates
+        self.commit = commit
+        self.coalesced = 0
+        # Declared share of the build host, used for queue admission
+        self.weight = weight
+        # Higher runs first; jobs of equal priority share the host fairly
+        # between groups (the submitter, or else the repository)
+        self.priority = priority
+        self.submitter = submitter
+        self.group = submitter or self.uri_key
+        # Only hosts (the server or a worker agent) with all these labels
+        # may run the job
+        self.labels = frozenset(labels)
+        # Worker agent running the job, None when it runs on the server
+        self.agent_id = None
+        self.attempts = 0
+        # Admission reasons this job was already counted as held back for
+        self.held_back = set()
+        # Reuse a warm build directory when the workspace pool is enabled
+        # (on the host that runs the job)
+        self.workspace_requested = use_workspace
+        self.use_workspace = use_workspace and workspace_pool is not None
         self.status = Job.STATUS_QUEUED
         self.created_at = datetime.datetime.utcnow().isoformat()
         self.started_at = None
         self.finished_at = None
-        self.process = None
+        # Command being run, if any
+        self._runner = None
+        self.monitor = None
         self._stop_event = threading.Event()
+        # Command output passes through here on its way to the log
+        self.output = ProgressCollapser(
+            lambda line: self._log(logging.INFO, line.strip()),
+            enabled=collapse_progress,
+            snapshot_interval=PROGRESS_SNAPSHOT_SECONDS,
+        )
 
-        db.create_task(self.id, self.git_uri, self.created_at)
+        if task_id is None:
+            db.create_task(self.id, self.git_uri, self.created_at)
+            db.update_task_metadata(
+                self.id, uri_key=self.uri_key, commit_sha=commit,
+                priority=priority, submitter=submitter,
+                labels=",".join(sorted(self.labels)) or None,
+            )
+        log_hub.open(self.id)
 
-        self._temp_dir_obj = tempfile.TemporaryDirectory(prefix=f"repo-{self.id}-")
-        self.clone_dir = self._temp_dir_obj.name
+        # Build directory, chosen when the job starts
+        self._temp_dir_obj = None
+        self._lease = None
+        self.clone_dir = None
         self.timeout = 3600
 
     def _log(self, level, msg):
         ts = datetime.datetime.utcnow().isoformat()
         line = msg if isinstance(msg, str) else str(msg)
-        db.add_log(self.id, ts, line)
+        log_writer.add(self.id, ts, line)
+
+    def _flush_log(self):
+        """Flush the log sink; a failure is reported, it does not fail the job."""
+        if not log_writer.flush():
+            print(
+                f"[{datetime.datetime.utcnow().isoformat()}] "
+                f"Job {self.id}: some log lines could not be written",
+                file=sys.stderr,
+            )
 
     def run_command(self, cmd, cwd=None, env=None):
         self._log(logging.INFO, f"{' '.join(cmd)}")
-        start = time.time()
-        proc = subprocess.Popen(
+        runner = CommandRunner(
             cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
+            on_line=self.output.feed,
+            stop_event=self._stop_event,
+            timeout=self.timeout,
             cwd=cwd,
             env=env,
-            universal_newlines=True,
-            preexec_fn=os.setsid,
+            monitor=self.monitor,
         )
-        self.process = proc
+        runner.start()
+        self._runner = runner
 
         try:
-            while True:
-                if self._stop_event.is_set():
-                    self._log(logging.WARNING, "Kill requested → terminating group")
-                    os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
-                    break
-                if time.time() - start > self.timeout:
-                    self._log(logging.ERROR, "Timeout exceeded → terminating")
-                    os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
-                    raise subprocess.TimeoutExpired(cmd, self.timeout)
-
-                line = proc.stdout.readline()
-                if line:
-                    self._log(logging.INFO, line.strip())
-                elif proc.poll() is not None:
-                    break
-                else:
-                    time.sleep(1)
-
-            proc.wait()
-            if proc.returncode != 0:
-                raise subprocess.CalledProcessError(proc.returncode, cmd)
+            try:
+                try:
+                    returncode = runner.pump()
+                finally:
+                    self.output.flush()
+            except subprocess.TimeoutExpired:
+                self._log(logging.ERROR, "Timeout exceeded → terminating")
+                raise
+            if runner.stopped:
+                self._log(logging.WARNING, "Kill requested → terminating group")
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, cmd)
         except Exception as e:
             self._log(logging.ERROR, f"Command failed: {e}")
             raise
         finally:
-            self.process = None
+            self._runner = None
+
+    def _clone(self, env):
+        """
+        Clone the repository, borrowing objects from the shared mirror
+        cache when possible. Records hit/miss/bypass and clone time.
+        """
+        start = time.monotonic()
+        cache_status = "bypass"
+        shutil.rmtree(self.clone_dir, ignore_errors=True)
+
+        if git_cache is not None:
+            try:
+                run = lambda cmd: self.run_command(cmd, env=env)
+                with git_cache.checkout(self.git_uri, run) as (mirror, hit):
+                    self.run_command(
+                        ["git", "clone", "--reference", mirror, "--dissociate",
+                         self.git_uri, self.clone_dir],
+                        env=env,
+                    )
+                cache_status = "hit" if hit else "miss"
+            except (subprocess.CalledProcessError, OSError) as e:
+                if self._stop_event.is_set():
+                    raise
+                self._log(logging.WARNING, f"Git cache unusable ({e}), cloning directly")
+                shutil.rmtree(self.clone_dir, ignore_errors=True)
+            else:
+                for mirror in git_cache.evict():
+                    self._log(logging.INFO, f"Evicted git mirror {mirror}")
+
+        if cache_status == "bypass":
+            self.run_command(["git", "clone", self.git_uri, self.clone_dir], env=env)
+
+        elapsed = time.monotonic() - start
+        JOB_PHASE_SECONDS.labels("clone").observe(elapsed)
+        self._log(logging.INFO, f"Clone took {elapsed:.1f}s (cache {cache_status})")
+        db.update_task_metadata(
+            self.id, clone_cache=cache_status, clone_seconds=round(elapsed, 3)
+        )
+
+    def _update_submodules(self, env):
+        """
+        Check out the commits the build records for its submodules,
+        through their own mirrors when the git cache is enabled.
+        """
+        if not os.path.isfile(os.path.join(self.clone_dir, ".gitmodules")):
+            return
+        if git_cache is not None:
+            try:
+                run = lambda cmd: self.run_command(cmd, env=env)
+                count = git_cache.update_submodules(self.git_uri, self.clone_dir, run)
+                self._log(logging.INFO, f"Checked out {count} submodules through the git cache")
+                return
+            except (subprocess.CalledProcessError, OSError) as e:
+                if self._stop_event.is_set():
+                    raise
+                self._log(logging.WARNING, f"Git cache unusable for submodules ({e}), fetching directly")
+        self.run_command(
+            ["git", "-C", self.clone_dir, "submodule", "update", "--init", "--recursive"],
+            env=env,
+        )
+
+    def _prepare_workdir(self):
+        """
+        Pick the build directory: a leased pool workspace if possible,
+        otherwise a throwaway temp dir. Returns warm | cold | temp.
+        """
+        if self.use_workspace:
+            self._lease = workspace_pool.acquire(self.git_uri)
+            if self._lease is None:
+                self._log(logging.INFO, "Workspace busy, building in a temporary directory")
+        if self._lease is not None:
+            self.clone_dir = self._lease.path
+            return "warm" if self._lease.warm else "cold"
+        self._temp_dir_obj = tempfile.TemporaryDirectory(prefix=f"repo-{self.id}-")
+        self.clone_dir = self._temp_dir_obj.name
+        return "temp"
+
+    def _update_workspace(self, env):
+        """
+        Bring a warm workspace to the upstream head, keeping untracked
+        build state (TMPDIR, cache, sstate). Returns False if the
+        checkout could not be updated.
+        """
+        start = time.monotonic()
+        try:
+            self.run_command(["git", "-C", self.clone_dir, "fetch", "--prune", "origin"], env=env)
+            self.run_command(
+                ["git", "-C", self.clone_dir, "reset", "--hard", "@{upstream}"], env=env
+            )
+        except subprocess.CalledProcessError:
+            if self._stop_event.is_set():
+                raise
+            return False
+        finally:
+            JOB_PHASE_SECONDS.labels("workspace_update").observe(time.monotonic() - start)
+        # Never ship a previous build's results
+        shutil.rmtree(os.path.join(self.clone_dir, ".result"), ignore_errors=True)
+        return True
+
+    def _release_workdir(self, healthy):
+        if self._lease is not None:
+            # Sizing and eviction happen in the pool's trim thread
+            workspace_pool.release(self._lease, healthy=healthy)
+            self._lease = None
+        elif self._temp_dir_obj is not None:
+            self._temp_dir_obj.cleanup()
+            self._temp_dir_obj = None
+
+    def _record_checkout(self, env):
+        """Store the commit actually built and the pipeline script hash."""
+        try:
+            commit = subprocess.run(
+                ["git", "-C", self.clone_dir, "rev-parse", "HEAD"],
+                capture_output=True, env=env, check=True,
+            ).stdout.decode().strip()
+        except (subprocess.SubprocessError, OSError):
+            commit = None
+        pipeline_sha = None
+        script = os.path.join(self.clone_dir, ".config", "pipeline.sh")
+        if os.path.isfile(script):
+            with open(script, "rb") as f:
+                pipeline_sha = hashlib.sha256(f.read()).hexdigest()
+        if commit:
+            self.commit = commit
+        db.update_task_metadata(self.id, commit_sha=self.commit, pipeline_sha=pipeline_sha)
+
+    def _store_results(self, result_dir):
+        """
+        Zip `result_dir` straight into the content store. Files are
+        streamed through zipfile in small blocks, so memory stays bounded
+        whatever the artifact size, and no DB lock is held while writing.
+        """
+        proc = psutil.Process()
+        base_rss = peak_rss = proc.memory_info().rss
+        start = time.monotonic()
+
+        with content_store.writer() as w:
+            with zipfile.ZipFile(w, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+                for root, dirs, files in os.walk(result_dir):
+                    dirs.sort()
+                    for name in dirs + sorted(files):
+                        path = os.path.join(root, name)
+                        zf.write(path, os.path.relpath(path, result_dir))
+                        peak_rss = max(peak_rss, proc.memory_info().rss)
+            digest, size = w.commit()
+
+        elapsed = time.monotonic() - start
+        JOB_PHASE_SECONDS.labels("ingest").observe(elapsed)
+        peak_delta = max(0, peak_rss - base_rss)
+        db.set_task_artifact(
+            self.id, digest, size, ingest_seconds=elapsed, ingest_peak_rss=peak_delta
+        )
+        throughput = size / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+        self._log(
+            logging.INFO,
+            f"Stored artifact {digest[:12]} ({size} bytes) in {elapsed:.1f}s, "
+            f"{throughput:.1f} MB/s, peak RSS +{peak_delta // 1024} KB",
+        )
 
     def run(self):
         self.status = Job.STATUS_RUNNING
         self.started_at = datetime.datetime.utcnow().isoformat()
         db.update_task_status(self.id, self.status, started_at=self.started_at)
+        run_start = time.monotonic()
+        QUEUE_WAIT_SECONDS.observe(
+            (
+                datetime.datetime.fromisoformat(self.started_at)
+                - datetime.datetime.fromisoformat(self.created_at)
+            ).total_seconds()
+        )
 
-        env = os.environ.copy()
-        env["HOME"] = os.path.abspath(os.path.dirname(__file__))
+        env = git_env()
+        self.monitor = ResourceMonitor(
+            f"job-{self.id}", interval=RESOURCE_SAMPLE_SECONDS, cgroup_root=CGROUP_ROOT
+        )
+        self.monitor.start()
 
+        workspace = self._prepare_workdir()
+        # Until the checkout is known good, a kept workspace is suspect
+        checkout_ok = False
         try:
-            shutil.rmtree(self.clone_dir, ignore_errors=True)
-            self.run_command(["git", "clone", self.git_uri, self.clone_dir], env=env)
+            if workspace == "warm" and not self._update_workspace(env):
+                self._log(logging.WARNING, "Workspace update failed, starting cold")
+                workspace_pool.discard(self._lease)
+                workspace = "cold"
+            if workspace != "warm":
+                self._clone(env)
+            self._update_submodules(env)
+            checkout_ok = True
+            self._record_checkout(env)
+            self._log(logging.INFO, f"Building in a {workspace} workspace")
+            db.update_task_metadata(self.id, workspace=workspace)
 
             script = os.path.join(self.clone_dir, ".config", "pipeline.sh")
             if os.path.isfile(script):
-                self.run_command(["bash", script], cwd=self.clone_dir, env=env)
+                start = time.monotonic()
+                try:
+                    self.run_command(["bash", script], cwd=self.clone_dir, env=env)
+                finally:
+                    elapsed = time.monotonic() - start
+                    JOB_PHASE_SECONDS.labels("pipeline").observe(elapsed)
+                    db.update_task_metadata(self.id, pipeline_seconds=round(elapsed, 3))
             else:
                 self._log(logging.INFO, "No pipeline.sh found, skipping")
 
@@ -105,13 +417,7 @@ class Job:
 
             result_dir = os.path.join(self.clone_dir, ".result")
             if os.path.isdir(result_dir):
-                archive_base = os.path.join(self.clone_dir, self.id)
-                zip_path = shutil.make_archive(archive_base, "zip", result_dir)
-                self._log(logging.INFO, f"Created zip file: {zip_path}")
-
-                with open(zip_path, "rb") as f:
-                    blob = f.read()
-                db.update_task_content(self.id, blob)
+                self._store_results(result_dir)
             else:
                 self._log(logging.INFO, "No .result directory found, skipping zipping")
 
@@ -134,14 +440,49 @@ class Job:
             return False
 
         finally:
-            self._temp_dir_obj.cleanup()
+            self._release_workdir(healthy=checkout_ok)
+            self._record_resources()
+            self._record_output()
+            self._flush_log()
+            log_hub.finish(self.id)
+            JOB_DURATION_SECONDS.labels(self.status).observe(time.monotonic() - run_start)
+
+    def _record_resources(self):
+        summary = self.monitor.stop()
+        db.update_task_metadata(self.id, **summary)
+        db.set_task_resources(
+            self.id, ResourceMonitor.FIELDS, self.monitor.interval, self.monitor.samples
+        )
+        mb = 1024 * 1024
+        self._log(
+            logging.INFO,
+            f"Resources ({summary['resource_source']}): "
+            f"{summary['cpu_seconds']:.1f} CPU seconds, "
+            f"peak RSS {summary['peak_rss'] // mb} MB, "
+            f"read {summary['read_bytes'] // mb} MB, "
+            f"written {summary['write_bytes'] // mb} MB, "
+            f"up to {summary['peak_procs']} processes",
+        )
+
+    def _record_output(self):
+        out = self.output
+        db.update_task_metadata(
+            self.id, output_lines=out.lines_in, output_lines_logged=out.lines_out
+        )
+        if out.enabled and out.lines_in:
+            self._log(
+                logging.INFO,
+                f"Command output: {out.lines_in} lines, {out.lines_out} logged "
+                f"({out.lines_in - out.lines_out} progress redraws collapsed)",
+            )
 
     def kill(self):
         self._stop_event.set()
-        if self.process:
-            os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
+        runner = self._runner
+        # Signals the group recorded at spawn; one that already exited is fine
+        if runner is not None and runner.terminate():
             self._log(logging.WARNING, "Process group killed")
         self.status = Job.STATUS_CANCELED
         self.finished_at = datetime.datetime.utcnow().isoformat()
+        self._flush_log()
         db.update_task_status(self.id, self.status, finished_at=self.finished_at)
-        self._temp_dir_obj.cleanup()
@@ -1,84 +1,492 @@
 # job_queue.py
+import os
+import sys
+import time
 import threading
 import datetime
-from db import db
-from job import Job
+import uuid
+from collections import OrderedDict
+from db import db, log_hub, log_writer, content_store
+import job as job_module
+from job import Job, JobSummary, git_env, QUEUE_WAIT_SECONDS
+from git_cache import normalize_uri, resolve_head
+from scheduler import FairScheduler
+from endpoints.metrics import read_cpu, read_memory, read_disk
+from telemetry import registry
+
+job_module.bind(db, log_writer, log_hub, content_store)
+
+JOBS_SUBMITTED = registry.counter(
+    "buildos_jobs_submitted_total", "Build submissions by outcome", ["outcome"]
+)
+ADMISSION_REJECTIONS = registry.counter(
+    "buildos_admission_rejections_total",
+    "Queued jobs held back by admission, once per job and limiting resource",
+    ["reason"],
+)
 
 
 class JobQueue:
-    def __init__(self):
-        self.queue = []
+    def __init__(
+        self,
+        workers=1,
+        max_weight=1.0,
+        max_cpu=90.0,
+        max_memory=90.0,
+        max_disk=95.0,
+        disk_path="/",
+        admission_interval=5.0,
+        history_size=1000,
+        labels=(),
+        scan_limit=32,
+    ):
+        self.scheduler = FairScheduler(scan_limit=scan_limit)
+        # Queued and running jobs only; see retire()
         self.jobs = {}
-        self.current_job = None
+        self.running = {}
+        # (uri_key, commit) -> id of the live job building that commit
+        self.building = {}
+        # (uri_key, commit) -> Event set once a submit() of it has decided
+        self._submitting = {}
+        # Summaries of the most recently ended jobs, oldest first
+        self.history = OrderedDict()
+        self.history_size = history_size
+        self.max_weight = max_weight
+        self.max_cpu = max_cpu
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.disk_path = disk_path
+        self.admission_interval = admission_interval
+        # Labels of this host, matched against the jobs' required labels
+        self.labels = frozenset(labels)
+        self._shutting_down = False
         self.lock = threading.Lock()
         self.condition = threading.Condition(self.lock)
-        self.worker_thread = threading.Thread(target=self.worker, daemon=True)
-        self.worker_thread.start()
+        # With workers=0 every build runs on a worker agent
+        self.worker_threads = [
+            threading.Thread(target=self.worker, daemon=True, name=f"job-worker-{i}")
+            for i in range(max(0, workers))
+        ]
+        for t in self.worker_threads:
+            t.start()
 
     def add_job(self, job: Job):
         with self.condition:
             self.jobs[job.id] = job
-            self.queue.append(job)
-            self.condition.notify()
+            if job.commit:
+                self.building[(job.uri_key, job.commit)] = job.id
+            self.scheduler.push(job)
+            # Local workers and agents waiting for a lease may not all
+            # be able to take it
+            self.condition.notify_all()
         return job
 
+    def submit(self, git_uri, weight=1.0, use_workspace=True, force=False,
+               collapse_progress=True, priority=0, submitter=None, labels=()):
+        """
+        Enqueue a build unless it is redundant. Returns (job_id, outcome):
+        - "coalesced": the same commit is already queued or running,
+        - "cached": a stored artifact of that commit is reused as a new
+          finished task,
+        - "queued": a new job was added.
+        `force` skips both checks. `collapse_progress=False` logs every
+        progress redraw of the build's output. `priority` and `submitter`
+        place the job in the scheduler (see FairScheduler); `labels` limit
+        it to the hosts that have all of them.
+        """
+        commit = None if force else resolve_head(git_uri, env=git_env())
+        if not commit:
+            return self._enqueue(git_uri, None, weight, use_workspace, collapse_progress,
+                                 priority, submitter, labels)
+
+        # Lookup and insert must not interleave with another submit of
+        # the same commit: the first one decides, later ones wait for it
+        # without holding the queue lock, then coalesce onto its job
+        key = (normalize_uri(git_uri), commit)
+        while True:
+            with self.lock:
+                job = self.jobs.get(self.building.get(key))
+                if job is not None and job.status in (Job.STATUS_QUEUED, Job.STATUS_RUNNING):
+                    job.coalesced += 1
+                    db.update_task_metadata(job.id, coalesced_count=job.coalesced)
+                    JOBS_SUBMITTED.labels("coalesced").inc()
+                    return job.id, "coalesced"
+                deciding = self._submitting.get(key)
+                if deciding is None:
+                    deciding = self._submitting[key] = threading.Event()
+                    break
+            deciding.wait()
+
+        try:
+            cached = db.find_cached_build(key[0], commit)
+            if cached:
+                JOBS_SUBMITTED.labels("cached").inc()
+                return self._record_cache_hit(git_uri, key[0], commit, cached), "cached"
+            return self._enqueue(git_uri, commit, weight, use_workspace, collapse_progress,
+                                 priority, submitter, labels)
+        finally:
+            with self.lock:
+                del self._submitting[key]
+            deciding.set()
+
+    def _enqueue(self, git_uri, commit, weight, use_workspace, collapse_progress,
+                 priority, submitter, labels):
+        job = self.add_job(
+            Job(
+                git_uri,
+                weight=weight,
+                use_workspace=use_workspace,
+                commit=commit,
+                collapse_progress=collapse_progress,
+                priority=priority,
+                submitter=submitter,
+                labels=labels,
+            )
+        )
+        JOBS_SUBMITTED.labels("queued").inc()
+        return job.id, "queued"
+
+    def _record_cache_hit(self, git_uri, uri_key, commit, cached):
+        task_id = str(uuid.uuid4())
+        now = datetime.datetime.utcnow().isoformat()
+        saved = 0.0
+        if cached["started_at"] and cached["finished_at"]:
+            saved = (
+                datetime.datetime.fromisoformat(cached["finished_at"])
+                - datetime.datetime.fromisoformat(cached["started_at"])
+            ).total_seconds()
+        db.create_task(task_id, git_uri, now)
+        db.set_task_artifact(task_id, cached["digest"], cached["size"])
+        db.update_task_metadata(
+            task_id,
+            uri_key=uri_key,
+            commit_sha=commit,
+            pipeline_sha=cached["pipeline_sha"],
+            cache_hit_of=cached["id"],
+            saved_seconds=round(saved, 3),
+        )
+        log_writer.add(
+            task_id, now, f"Commit {commit} already built by task {cached['id']}, artifact reused"
+        )
+        log_writer.flush()
+        db.update_task_status(task_id, Job.STATUS_FINISHED, started_at=now, finished_at=now)
+        return task_id
+
+    def _retire(self, job):
+        """
+        Replace an ended job by its summary. Called with the lock held;
+        the history keeps the latest `history_size` summaries, older
+        jobs are only in the database.
+        """
+        self.jobs.pop(job.id, None)
+        key = (job.uri_key, job.commit)
+        if self.building.get(key) == job.id:
+            del self.building[key]
+        self.history[job.id] = JobSummary.from_job(job)
+        while len(self.history) > self.history_size:
+            self.history.popitem(last=False)
+
+    def get_job(self, job_id):
+        """
+        Return the live Job if it is queued or running, otherwise a
+        JobSummary from the recent history or the database, or None.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id) or self.history.get(job_id)
+        if job is not None:
+            return job
+        task = db.get_task(job_id)
+        return JobSummary.from_task(task) if task else None
+
     def remove_job(self, job_id):
         with self.lock:
             job = self.jobs.get(job_id)
             if not job:
+                if job_id in self.history or db.get_task(job_id):
+                    return False, "Only queued jobs can be removed."
                 return False, "Job not found."
             if job.status != Job.STATUS_QUEUED:
                 return False, "Only queued jobs can be removed."
             job.status = Job.STATUS_CANCELED
             job.finished_at = datetime.datetime.utcnow().isoformat()
             db.update_task_status(job.id, job.status, finished_at=job.finished_at)
-            self.queue = [j for j in self.queue if j.id != job_id]
+            log_hub.finish(job.id)
+            self.scheduler.remove(job_id)
+            self._retire(job)
             return True, f"Job {job_id} removed from queue."
 
-    def kill_current_job(self):
+    def bump(self, job_id, priority):
+        """Change the priority of a queued job."""
+        with self.condition:
+            if not self.scheduler.bump(job_id, priority):
+                return False, f"Job {job_id} is not queued."
+            db.update_task_metadata(job_id, priority=priority)
+            # It may now be the next job to start
+            self.condition.notify_all()
+            return True, f"Job {job_id} priority set to {priority}."
+
+    def queue_snapshot(self):
+        """Queued jobs in dispatch order, and the latest dispatch decisions."""
         with self.lock:
-            if self.current_job and self.current_job.status == Job.STATUS_RUNNING:
-                self.current_job.kill()
-                return True, f"Killed job {self.current_job.id}."
-            return False, "No running job to kill."
+            queued = self.scheduler.ordered()
+            decisions = list(self.scheduler.decisions)
+        return {
+            "queued": [
+                {
+                    "id": job.id,
+                    "git_uri": job.git_uri,
+                    "group": job.group,
+                    "priority": job.priority,
+                    "weight": job.weight,
+                    "labels": sorted(job.labels),
+                    "created_at": job.created_at,
+                }
+                for job in queued
+            ],
+            "decisions": decisions,
+        }
 
-    def worker(self):
-        while True:
-            with self.condition:
-                while not self.queue:
-                    self.condition.wait()
-                job = self.queue.pop(0)
+    def kill_job(self, job_id=None):
+        """
+        Kill a running job. Without a job_id, only succeeds when exactly
+        one job is running.
+        """
+        with self.lock:
+            if job_id is None:
+                if not self.running:
+                    return False, "No running job to kill."
+                if len(self.running) > 1:
+                    return False, "Several jobs are running; a job ID is required."
+                job_id = next(iter(self.running))
+            job = self.running.get(job_id)
+            if job and job.status == Job.STATUS_RUNNING:
+                # A job on a worker agent learns it from its next heartbeat
+                job.kill()
+                return True, f"Killed job {job.id}."
+            return False, f"Job {job_id} is not running."
+
+    def lease(self, agent, timeout):
+        """
+        Hand the next job that `agent.admit` accepts to a worker agent,
+        waiting up to `timeout` seconds for one. The job stays in
+        `running` until the agent releases it or is lost.
+        """
+        deadline = time.monotonic() + timeout
+        admit = lambda job: agent.admit(job, self.running_weight(agent.id))
+        with self.condition:
+            while not self._shutting_down:
+                job = self.scheduler.pop(admit)
+                if job is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            else:
+                return None
+            self.scheduler.decisions[-1]["agent"] = agent.name
+            job.agent_id = agent.id
+            job.attempts += 1
+            job.status = Job.STATUS_RUNNING
+            job.started_at = datetime.datetime.utcnow().isoformat()
+            self.running[job.id] = job
+        QUEUE_WAIT_SECONDS.observe(
+            (
+                datetime.datetime.fromisoformat(job.started_at)
+                - datetime.datetime.fromisoformat(job.created_at)
+            ).total_seconds()
+        )
+        db.update_task_metadata(job.id, agent=agent.name)
+        return job
 
-            if job is None:
-                break
+    def leased(self, agent_id, job_id):
+        """The job if it is leased to this agent, else None."""
+        job = self.running.get(job_id)
+        return job if job is not None and job.agent_id == agent_id else None
 
-            with self.lock:
-                self.current_job = job
+    def release(self, job, status, finished_at=None):
+        """An agent is done with `job`, which ended with `status`."""
+        with self.condition:
+            if self.running.get(job.id) is not job:
+                return False
+            del self.running[job.id]
+            # A kill from the server wins over what the agent saw
+            if job.status != Job.STATUS_CANCELED:
+                job.status = status
+            job.finished_at = (
+                job.finished_at or finished_at or datetime.datetime.utcnow().isoformat()
+            )
+            self._retire(job)
+            self.condition.notify_all()
+        # Also covers a final status update the agent could not deliver
+        db.update_task_status(job.id, job.status, finished_at=job.finished_at)
+        log_writer.flush()
+        log_hub.finish(job.id)
+        return True
 
-            if job.status == Job.STATUS_CANCELED:
-                with self.lock:
-                    self.current_job = None
-                continue
+    def requeue(self, job, reason, max_attempts=None):
+        """
+        Take back a job from a worker agent: queue it again, or fail it
+        once it was leased `max_attempts` times. A killed job stays
+        canceled.
+        """
+        now = datetime.datetime.utcnow().isoformat()
+        with self.condition:
+            if self.running.get(job.id) is not job:
+                return
+            del self.running[job.id]
+            job.agent_id = None
+            if job.status == Job.STATUS_CANCELED or (max_attempts and job.attempts >= max_attempts):
+                if job.status != Job.STATUS_CANCELED:
+                    job.status = Job.STATUS_FAILED
+                job.finished_at = now
+                db.update_task_status(job.id, job.status, finished_at=now)
+                self._retire(job)
+                message = f"{reason}, job {job.status}"
+            else:
+                job.status = Job.STATUS_QUEUED
+                job.started_at = None
+                db.update_task_status(job.id, job.status)
+                self.scheduler.push(job)
+                message = f"{reason}, job queued again (attempt {job.attempts + 1})"
+            self.condition.notify_all()
+        log_writer.add(job.id, now, message)
+        log_writer.flush()
+        if job.status != Job.STATUS_QUEUED:
+            log_hub.finish(job.id)
 
-            job.run()
+    def running_jobs(self):
+        with self.lock:
+            return list(self.running.values())
 
-            with self.lock:
-                self.current_job = None
+    def running_weight(self, agent_id=None):
+        """Summed weight of the jobs running here, or on one agent."""
+        return sum(j.weight for j in self.running.values() if j.agent_id == agent_id)
+
+    def _admissible(self, job):
+        """
+        Decide whether `job` may start now on this host. Called with the
+        lock held. An idle host always admits, so a heavy job can never
+        starve.
+        """
+        if not job.labels <= self.labels:
+            return False, "labels"
+        if not any(j.agent_id is None for j in self.running.values()):
+            return True, None
+        if self.running_weight() + job.weight > self.max_weight:
+            return False, "weight"
+        if read_cpu()["cpu_percent"] >= self.max_cpu:
+            return False, "cpu"
+        if read_memory()["percent"] >= self.max_memory:
+            return False, "memory"
+        if read_disk(self.disk_path)["percent"] >= self.max_disk:
+            return False, "disk"
+        return True, None
+
+    def _admit(self, job):
+        ok, reason = self._admissible(job)
+        # A waiting job is checked again on every pass: count it once
+        if not ok and reason not in job.held_back:
+            job.held_back.add(reason)
+            ADMISSION_REJECTIONS.labels(reason).inc()
+        return ok, reason
+
+    def _next_job(self):
+        """
+        Pop the next job in scheduling order that can be admitted. A
+        lighter job may overtake a heavier one that does not fit yet;
+        host-wide pressure applies to every candidate. Called with the
+        lock held; returns None if nothing can start.
+        """
+        return self.scheduler.pop(self._admit)
+
+    def worker(self):
+        while True:
+            with self.condition:
+                job = None
+                while not self._shutting_down:
+                    job = self._next_job()
+                    if job is not None:
+                        break
+                    # Resource readings change without notification: re-check
+                    self.condition.wait(self.admission_interval if self.scheduler else None)
+                if job is None:
+                    break
+                self.running[job.id] = job
+
+            try:
+                job.run()
+            except Exception as e:
+                self._crashed(job, e)
+            finally:
+                with self.condition:
+                    self.running.pop(job.id, None)
+                    self._retire(job)
+                    self.condition.notify_all()
+
+    def _crashed(self, job, error):
+        """
+        A job raised out of run(): fail it and keep the worker going. The
+        error may come from the database itself, so recording it is best
+        effort.
+        """
+        print(
+            f"[{datetime.datetime.utcnow().isoformat()}] Job {job.id} crashed: "
+            f"{type(error).__name__}: {error}",
+            file=sys.stderr,
+        )
+        if job.status != Job.STATUS_CANCELED:
+            job.status = Job.STATUS_FAILED
+        job.finished_at = job.finished_at or datetime.datetime.utcnow().isoformat()
+        try:
+            log_writer.add(job.id, job.finished_at, f"Internal error: {error}")
+            log_writer.flush()
+            db.update_task_status(job.id, job.status, finished_at=job.finished_at)
+        except Exception as e:
+            print(
+                f"[{datetime.datetime.utcnow().isoformat()}] "
+                f"Recording the failure of job {job.id} failed: {e}",
+                file=sys.stderr,
+            )
+        log_hub.finish(job.id)
 
     def shutdown(self):
         with self.lock:
-            for job in self.queue:
-                if job is not None:
-                    job.status = Job.STATUS_CANCELED
-                    ts = datetime.datetime.utcnow().isoformat()
-                    db.update_task_status(job.id, job.status, finished_at=ts)
-            self.queue.clear()
-            self.queue.append(None)
+            for job in self.scheduler.jobs():
+                job.status = Job.STATUS_CANCELED
+                ts = datetime.datetime.utcnow().isoformat()
+                db.update_task_status(job.id, job.status, finished_at=ts)
+                log_hub.finish(job.id)
+                self._retire(job)
+            self.scheduler.clear()
+            self._shutting_down = True
 
         with self.condition:
             self.condition.notify_all()
-        self.worker_thread.join()
+        for t in self.worker_threads:
+            t.join()
 
 
 # Global instance
-job_queue = JobQueue()
+job_queue = JobQueue(
+    workers=int(os.environ.get("JOB_WORKERS", "1")),
+    max_weight=float(os.environ.get("JOB_MAX_WEIGHT", "1.0")),
+    max_cpu=float(os.environ.get("JOB_MAX_CPU", "90")),
+    max_memory=float(os.environ.get("JOB_MAX_MEMORY", "90")),
+    max_disk=float(os.environ.get("JOB_MAX_DISK", "95")),
+    disk_path=os.environ.get("JOB_DISK_PATH", "/"),
+    history_size=int(os.environ.get("JOB_HISTORY_SIZE", "1000")),
+    labels=[label.strip() for label in os.environ.get("JOB_LABELS", "").split(",") if label.strip()],
+    scan_limit=int(os.environ.get("JOB_SCAN_LIMIT", "32")),
+)
+
+# Read without the queue lock: a scrape must never wait behind admission
+registry.gauge(
+    "buildos_queue_length", "Jobs waiting to start",
+    fn=lambda: len(job_queue.scheduler),
+)
+registry.gauge("buildos_running_jobs", "Jobs currently running", fn=lambda: len(job_queue.running))
+registry.gauge(
+    "buildos_running_weight", "Summed weight of jobs running on the server",
+    fn=lambda: sum(j.weight for j in list(job_queue.running.values()) if j.agent_id is None),
+)
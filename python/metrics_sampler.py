@@ -0,0 +1,186 @@
+# metrics_sampler.py
+import os
+import sys
+import time
+import shutil
+import datetime
+import tempfile
+import threading
+from array import array
+import psutil
+from workspace_pool import workspace_pool
+from telemetry import registry
+
+
+class RingBuffer:
+    """
+    Fixed-capacity history of numeric samples, one preallocated array of
+    doubles per field. Appending overwrites the oldest sample; nothing is
+    allocated after construction.
+    """
+
+    def __init__(self, fields, capacity):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self._columns = [array("d", bytes(8 * capacity)) for _ in self.fields]
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, values):
+        with self._lock:
+            for column, value in zip(self._columns, values):
+                column[self._next] = value
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def latest(self):
+        with self._lock:
+            if not self._count:
+                return None
+            idx = self._next - 1
+            return {f: c[idx] for f, c in zip(self.fields, self._columns)}
+
+    def since(self, t0):
+        """Return {field: [values...]} of samples with field 0 >= t0, oldest first."""
+        with self._lock:
+            start = (self._next - self._count) % self.capacity
+            order = list(range(start, self.capacity)) + list(range(0, start))
+            order = order[: self._count]
+            times = self._columns[0]
+            # Time is monotonic along the ring: skip the part before t0
+            lo, hi = 0, len(order)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if times[order[mid]] < t0:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            order = order[lo:]
+            return {f: [c[i] for i in order] for f, c in zip(self.fields, self._columns)}
+
+
+class MetricsSampler:
+    """
+    Single background thread reading host metrics every `interval`
+    seconds into a RingBuffer. Request handlers and queue admission only
+    read the latest sample, so the cost no longer grows with the number
+    of open UI tabs, and cpu_percent always covers one full interval.
+
+    `disks` maps a name to a path; each distinct filesystem among them is
+    measured once per sample.
+    """
+
+    def __init__(self, disks, interval=5.0, capacity=4320):
+        self.interval = interval
+        self.disks = {
+            name: os.path.abspath(path) for name, path in disks.items() if os.path.exists(path)
+        }
+        fields = ["t", "cpu_percent", "mem_percent", "mem_available", "mem_total"]
+        for name in self.disks:
+            fields += [f"disk_{name}_total", f"disk_{name}_used", f"disk_{name}_free"]
+        self.history = RingBuffer(fields, capacity)
+        self._stop = threading.Event()
+        psutil.cpu_percent(interval=None)  # prime the CPU counter
+        self.sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def sample(self):
+        mem = psutil.virtual_memory()
+        values = [
+            time.time(),
+            psutil.cpu_percent(interval=None),
+            mem.percent,
+            mem.available,
+            mem.total,
+        ]
+        by_device = {}
+        for path in self.disks.values():
+            dev = os.stat(path).st_dev
+            if dev not in by_device:
+                by_device[dev] = shutil.disk_usage(path)
+            du = by_device[dev]
+            values += [du.total, du.used, du.free]
+        self.history.append(values)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(
+                    f"[{datetime.datetime.utcnow().isoformat()}] Metrics sampling failed: {e}",
+                    file=sys.stderr,
+                )
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def latest(self):
+        return self.history.latest()
+
+    def disk(self, name):
+        """Usage of one sampled filesystem from the latest sample."""
+        s = self.latest()
+        total = s[f"disk_{name}_total"]
+        used = s[f"disk_{name}_used"]
+        return {
+            "path": self.disks[name],
+            "total": int(total),
+            "used": int(used),
+            "free": int(s[f"disk_{name}_free"]),
+            "percent": round(used / total * 100, 1) if total else 0.0,
+        }
+
+    def window(self, seconds):
+        return self.history.since(time.time() - seconds)
+
+    def register(self, registry):
+        """Expose the latest sample as Prometheus gauges."""
+
+        def field(name):
+            return lambda: self.latest()[name]
+
+        def disks(suffix):
+            return lambda: {
+                (name, path): self.latest()[f"disk_{name}_{suffix}"]
+                for name, path in self.disks.items()
+            }
+
+        registry.gauge("buildos_host_cpu_percent", "Host CPU utilisation", fn=field("cpu_percent"))
+        registry.gauge("buildos_host_memory_percent", "Host memory in use", fn=field("mem_percent"))
+        registry.gauge(
+            "buildos_host_memory_available_bytes", "Host memory available",
+            fn=field("mem_available"),
+        )
+        registry.gauge(
+            "buildos_disk_used_bytes", "Used space of sampled filesystems",
+            ["disk", "path"], fn=disks("used"),
+        )
+        registry.gauge(
+            "buildos_disk_free_bytes", "Free space of sampled filesystems",
+            ["disk", "path"], fn=disks("free"),
+        )
+
+
+def _disk_paths():
+    disks = {
+        "root": "/",
+        "mirror": os.environ.get("MIRROR_DIR", "yocto-mirror"),
+        "tmp": tempfile.gettempdir(),
+    }
+    if workspace_pool is not None:
+        disks["workspaces"] = workspace_pool.root
+    return disks
+
+
+# Global instance
+_interval = float(os.environ.get("METRICS_INTERVAL", "5"))
+metrics_sampler = MetricsSampler(
+    _disk_paths(),
+    interval=_interval,
+    capacity=max(1, int(float(os.environ.get("METRICS_HISTORY_HOURS", "6")) * 3600 / _interval)),
+)
+metrics_sampler.register(registry)
@@ -0,0 +1,291 @@
+# mirror_gc.py
+import os
+import sys
+import time
+import fcntl
+import datetime
+import threading
+from db import db
+
+# Companion files handled together with the object they describe
+COMPANION_SUFFIXES = (".done", ".siginfo", ".sig")
+# relatime only moves atime forward once it is a day old
+RELATIME_SLACK = 86400
+
+
+def detect_atime_slack(path):
+    """
+    How far atime may lag behind the last read of a file under `path`,
+    from the options of the mount holding it: 0 with strictatime,
+    RELATIME_SLACK with relatime (the default), None with noatime, where
+    reads do not show at all.
+    """
+    path = os.path.realpath(path)
+    best, options = "", set()
+    try:
+        with open("/proc/self/mounts") as f:
+            for line in f:
+                fields = line.split()
+                mount_point = fields[1].replace("\\040", " ")
+                if (
+                    path == mount_point
+                    or path.startswith(mount_point.rstrip("/") + "/")
+                ) and len(mount_point) >= len(best):
+                    best, options = mount_point, set(fields[3].split(","))
+    except OSError:
+        return RELATIME_SLACK
+    if "noatime" in options:
+        return None
+    if "relatime" in options:
+        return RELATIME_SLACK
+    return 0
+
+
+class MirrorGC:
+    """
+    Keeps `downloads/` and `sstate-cache/` on the mirror volume under a
+    byte budget by deleting the least recently used objects.
+
+    Last use is the newer of atime and mtime. Files served by nginx or
+    read by a build update atime; under the default relatime mount
+    option only once a day, so a file read an hour ago may show an atime
+    up to a day old.
+
+    An object is protected when it was used since the start of the
+    oldest of the last `protect_builds` successful builds or of any
+    running build, widened by how far atime may lag (`atime_slack`,
+    detected from the mount when None), or within the last `min_age`
+    seconds, which also covers files still being written. On a noatime
+    mount reads do not show, and only the `min_age` and mtime
+    protection holds; a warning is printed. A download is evicted together with
+    its `.done` stamp, an sstate object with its `.siginfo`/`.sig`. An
+    object whose bitbake `.lock` is held is skipped; the lock is held
+    while deleting, so a fetch of the same file waits and then fetches
+    it again. Only top-level files of `downloads/` are candidates: the
+    git2/, svn/... checkouts below it are never deleted piecemeal.
+
+    With `dry_run`, passes only report what would be evicted.
+    """
+
+    def __init__(self, root, budget_bytes, min_age=3600, protect_builds=5,
+                 interval=3600, dry_run=False, atime_slack=None):
+        self.root = os.path.abspath(root)
+        self.budget_bytes = budget_bytes
+        self.min_age = min_age
+        self.protect_builds = protect_builds
+        self.interval = interval
+        self.dry_run = dry_run
+        if atime_slack is None:
+            atime_slack = detect_atime_slack(self.root)
+            if atime_slack is None:
+                print(
+                    f"[{datetime.datetime.utcnow().isoformat()}] Mirror GC: {self.root} is "
+                    "mounted noatime, objects read by recent builds are not protected",
+                    file=sys.stderr,
+                )
+        self.atime_slack = atime_slack
+        self.last_report = None
+        self.last_dry_run = None
+        self._evicted_files = 0
+        self._freed_bytes = 0
+        self._pass_lock = threading.Lock()
+        self._dry_run_thread = None
+        self._dry_run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.last_report = self.run_once()
+            except Exception as e:
+                print(
+                    f"[{datetime.datetime.utcnow().isoformat()}] Mirror GC failed: {e}",
+                    file=sys.stderr,
+                )
+            self._stop.wait(self.interval)
+
+    def _scan(self):
+        """Return {object path: [last_use, size, [paths]]}."""
+        groups = {}
+
+        def add(path, st):
+            key = path
+            for suffix in COMPANION_SUFFIXES:
+                if path.endswith(suffix):
+                    key = path[: -len(suffix)]
+                    break
+            group = groups.setdefault(key, [0.0, 0, []])
+            group[0] = max(group[0], st.st_atime, st.st_mtime)
+            group[1] += st.st_size
+            group[2].append(path)
+
+        def files(path, recursive):
+            try:
+                it = os.scandir(path)
+            except FileNotFoundError:
+                return
+            with it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                files(entry.path, recursive)
+                        elif entry.is_file(follow_symlinks=False) and not entry.name.endswith(".lock"):
+                            add(entry.path, entry.stat(follow_symlinks=False))
+                    except FileNotFoundError:
+                        continue
+
+        files(os.path.join(self.root, "downloads"), recursive=False)
+        files(os.path.join(self.root, "sstate-cache"), recursive=True)
+        return groups
+
+    def protect_since(self):
+        """Epoch seconds after which a used object is kept."""
+        since = time.time() - self.min_age
+        start = db.get_build_window_start(self.protect_builds)
+        if start:
+            started = datetime.datetime.fromisoformat(start).replace(
+                tzinfo=datetime.timezone.utc
+            )
+            since = min(since, started.timestamp() - (self.atime_slack or 0))
+        return since
+
+    def _remove(self, key, paths):
+        """Delete one object's files under its bitbake lock. False if busy."""
+        lock = key + ".lock"
+        # Created if missing: a fetch starting now must wait for us, not
+        # create its own lock file beside a deleted one
+        fd = os.open(lock, os.O_RDWR | os.O_CREAT, 0o664)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            # Unlinked while held, as bitbake's unlockfile does: its
+            # lockfile() re-checks the inode after locking and retries
+            try:
+                os.remove(lock)
+            except FileNotFoundError:
+                pass
+        finally:
+            os.close(fd)
+        return True
+
+    def run_once(self, dry_run=None, report_limit=20):
+        """
+        One collection pass; returns a report of what was (or, with
+        `dry_run`, would be) evicted.
+        """
+        dry_run = self.dry_run if dry_run is None else dry_run
+        with self._pass_lock:
+            start = time.perf_counter()
+            groups = self._scan()
+            since = self.protect_since()
+            total = sum(g[1] for g in groups.values())
+            protected = sum(g[1] for g in groups.values() if g[0] >= since)
+            candidates = sorted(
+                ((g[0], g[1], key, g[2]) for key, g in groups.items() if g[0] < since),
+                key=lambda c: c[0],
+            )
+
+            remaining = total
+            evicted = []
+            skipped_locked = 0
+            for last_use, size, key, paths in candidates:
+                if remaining <= self.budget_bytes or self._stop.is_set():
+                    break
+                if not dry_run and not self._remove(key, paths):
+                    skipped_locked += 1
+                    continue
+                remaining -= size
+                evicted.append((key, size, last_use, len(paths)))
+
+            freed = total - remaining
+            if not dry_run:
+                self._evicted_files += sum(n for _, _, _, n in evicted)
+                self._freed_bytes += freed
+            report = {
+                "dry_run": dry_run,
+                "objects": len(groups),
+                "total_bytes": total,
+                "budget_bytes": self.budget_bytes,
+                "protected_bytes": protected,
+                "protect_since": datetime.datetime.utcfromtimestamp(since).isoformat(),
+                "atime_slack_seconds": self.atime_slack,
+                "evicted_objects": len(evicted),
+                "freed_bytes": freed,
+                "over_budget_bytes": max(0, remaining - self.budget_bytes),
+                "skipped_locked": skipped_locked,
+                "oldest_evicted": [
+                    {
+                        "path": os.path.relpath(key, self.root),
+                        "size": size,
+                        "last_use": datetime.datetime.utcfromtimestamp(last_use).isoformat(),
+                    }
+                    for key, size, last_use, _n in evicted[:report_limit]
+                ],
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+            }
+            return report
+
+    def request_dry_run(self):
+        """
+        Start a dry-run pass in the background unless one is running;
+        its report goes to `last_dry_run`.
+        """
+        with self._dry_run_lock:
+            if not self.dry_run_running():
+                self._dry_run_thread = threading.Thread(target=self._dry_run, daemon=True)
+                self._dry_run_thread.start()
+
+    def _dry_run(self):
+        try:
+            report = self.run_once(dry_run=True)
+        except Exception as e:
+            print(
+                f"[{datetime.datetime.utcnow().isoformat()}] Mirror GC dry run failed: {e}",
+                file=sys.stderr,
+            )
+            return
+        report["finished_at"] = datetime.datetime.utcnow().isoformat()
+        self.last_dry_run = report
+
+    def dry_run_running(self):
+        thread = self._dry_run_thread
+        return thread is not None and thread.is_alive()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def stats(self):
+        return {
+            "budget_bytes": self.budget_bytes,
+            "dry_run": self.dry_run,
+            "evicted_files": self._evicted_files,
+            "freed_bytes": self._freed_bytes,
+            "last_pass": self.last_report,
+        }
+
+
+# Opt-in: set MIRROR_GC_BUDGET_GB to bound downloads/ and sstate-cache/
+_mirror_budget = int(float(os.environ.get("MIRROR_GC_BUDGET_GB", "0")) * 1024**3)
+mirror_gc = (
+    MirrorGC(
+        os.environ.get("MIRROR_DIR", "yocto-mirror"),
+        _mirror_budget,
+        min_age=float(os.environ.get("MIRROR_GC_MIN_AGE_HOURS", "1")) * 3600,
+        protect_builds=int(os.environ.get("MIRROR_GC_PROTECT_BUILDS", "5")),
+        interval=float(os.environ.get("MIRROR_GC_INTERVAL_MINUTES", "60")) * 60,
+        dry_run=os.environ.get("MIRROR_GC_DRY_RUN", "0") == "1",
+    )
+    if _mirror_budget
+    else None
+)
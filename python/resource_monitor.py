@@ -0,0 +1,195 @@
+# resource_monitor.py
+import os
+import sys
+import time
+import datetime
+import threading
+import psutil
+
+
+class ResourceMonitor:
+    """
+    Samples what a job's processes consume while it runs.
+
+    Each command started for the job is tracked by its root pid. Without
+    a cgroup, the process trees are walked with psutil: the kernel moves
+    the CPU time and I/O of a reaped child into its parent, and the final
+    totals of a command come from wait4() when it exits, so short-lived
+    compiler processes are not lost between samples.
+
+    With `cgroup_root` (a writable, delegated cgroup v2 directory with
+    the cpu, memory, io and pids controllers enabled for children) every
+    command joins a per-job cgroup, whose counters also cover processes
+    that daemonize out of the tree.
+
+    A sample is [seconds since start, cumulative CPU seconds, RSS bytes,
+    cumulative read bytes, cumulative write bytes, process count]. When
+    `max_samples` is reached every other sample is dropped and the
+    interval doubles, so long builds keep a bounded series.
+    """
+
+    FIELDS = ("t", "cpu_seconds", "rss_bytes", "read_bytes", "write_bytes", "procs")
+
+    def __init__(self, name, interval=5.0, cgroup_root=None, max_samples=2000):
+        self.interval = interval
+        self.max_samples = max_samples
+        self.samples = []
+        self.peak_rss = 0
+        self.peak_procs = 0
+        self.cgroup = self._create_cgroup(cgroup_root, name) if cgroup_root else None
+        self.source = "cgroup" if self.cgroup else "procfs"
+        self._lock = threading.Lock()
+        self._roots = set()
+        # Totals of commands that already exited (procfs source)
+        self._done_cpu = 0.0
+        self._done_read = 0
+        self._done_write = 0
+        self._last = (0.0, 0, 0)
+        self._start = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _create_cgroup(root, name):
+        path = os.path.join(root, name)
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError:
+            return None
+        return path
+
+    def start(self):
+        self._start = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def preexec(self):
+        """Runs in a command's child process before exec."""
+        if self.cgroup:
+            with open(os.path.join(self.cgroup, "cgroup.procs"), "w") as f:
+                f.write("0")
+
+    def track(self, pid):
+        with self._lock:
+            self._roots.add(pid)
+
+    def untrack(self, pid, rusage):
+        """Record a reaped command's totals, as returned by os.wait4()."""
+        with self._lock:
+            self._roots.discard(pid)
+            self._done_cpu += rusage.ru_utime + rusage.ru_stime
+            # Block I/O counts are in 512-byte units
+            self._done_read += rusage.ru_inblock * 512
+            self._done_write += rusage.ru_oublock * 512
+            self.peak_rss = max(self.peak_rss, rusage.ru_maxrss * 1024)
+
+    def _read_cgroup(self):
+        def read(name):
+            try:
+                with open(os.path.join(self.cgroup, name)) as f:
+                    return f.read()
+            except OSError:
+                return ""
+
+        cpu = rss = read_bytes = write_bytes = 0
+        for line in read("cpu.stat").splitlines():
+            key, _, value = line.partition(" ")
+            if key == "usage_usec":
+                cpu = int(value) / 1e6
+        for line in read("memory.stat").splitlines():
+            key, _, value = line.partition(" ")
+            if key == "anon":
+                rss = int(value)
+        for line in read("io.stat").splitlines():
+            for field in line.split()[1:]:
+                key, _, value = field.partition("=")
+                if key == "rbytes":
+                    read_bytes += int(value)
+                elif key == "wbytes":
+                    write_bytes += int(value)
+        procs = read("pids.current").strip()
+        procs = int(procs) if procs else len(read("cgroup.procs").split())
+        return cpu, rss, read_bytes, write_bytes, procs
+
+    def _read_procfs(self):
+        with self._lock:
+            roots = list(self._roots)
+            cpu, read_bytes, write_bytes = self._done_cpu, self._done_read, self._done_write
+        rss = procs = 0
+        for pid in roots:
+            try:
+                root = psutil.Process(pid)
+                tree = [root] + root.children(recursive=True)
+            except psutil.NoSuchProcess:
+                continue
+            for proc in tree:
+                try:
+                    with proc.oneshot():
+                        t = proc.cpu_times()
+                        mem = proc.memory_info()
+                        io = proc.io_counters()
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+                cpu += t.user + t.system + t.children_user + t.children_system
+                rss += mem.rss
+                read_bytes += io.read_bytes
+                write_bytes += io.write_bytes
+                procs += 1
+        return cpu, rss, read_bytes, write_bytes, procs
+
+    def sample(self):
+        if self.cgroup:
+            cpu, rss, read_bytes, write_bytes, procs = self._read_cgroup()
+        else:
+            cpu, rss, read_bytes, write_bytes, procs = self._read_procfs()
+        # A child reaped mid-walk can be missed once; totals never go back
+        last_cpu, last_read, last_write = self._last
+        cpu = max(cpu, last_cpu)
+        read_bytes = max(read_bytes, last_read)
+        write_bytes = max(write_bytes, last_write)
+        self._last = (cpu, read_bytes, write_bytes)
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_procs = max(self.peak_procs, procs)
+        self.samples.append([
+            round(time.monotonic() - self._start, 1),
+            round(cpu, 2),
+            rss,
+            read_bytes,
+            write_bytes,
+            procs,
+        ])
+        if len(self.samples) >= self.max_samples:
+            del self.samples[1::2]
+            self.interval *= 2
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(
+                    f"[{datetime.datetime.utcnow().isoformat()}] Resource sampling failed: {e}",
+                    file=sys.stderr,
+                )
+
+    def stop(self):
+        """Stop sampling, take a last sample and return the summary."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.sample()
+        if self.cgroup:
+            try:
+                os.rmdir(self.cgroup)
+            except OSError:
+                # Processes outlived the job; the cgroup stays for inspection
+                pass
+        cpu, read_bytes, write_bytes = self._last
+        return {
+            "resource_source": self.source,
+            "cpu_seconds": round(cpu, 2),
+            "peak_rss": self.peak_rss,
+            "read_bytes": read_bytes,
+            "write_bytes": write_bytes,
+            "peak_procs": self.peak_procs,
+        }
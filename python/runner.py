@@ -0,0 +1,258 @@
+# runner.py
+import os
+import re
+import signal
+import subprocess
+import selectors
+import time
+from itertools import repeat
+
+
+class LineSplitter:
+    """
+    Incrementally split a raw byte stream into text lines.
+
+    `\\n`, `\\r\\n` and bare `\\r` all end a line, matching what
+    universal_newlines used to produce. Lines come back as
+    (line, overwritten) pairs, overwritten being True for a line ended
+    by a bare `\\r` (a terminal redraws over it). Only complete lines are
+    decoded, one decode call per chunk, so multi-byte characters split
+    across reads are never mangled.
+    """
+
+    def __init__(self, encoding="utf-8"):
+        self.encoding = encoding
+        self._partial = b""
+
+    def feed(self, data):
+        buf = self._partial + data if self._partial else data
+        # Hold back a trailing \r: it may be the first half of \r\n
+        end = len(buf) - 1 if buf.endswith(b"\r") else len(buf)
+        cut = max(buf.rfind(b"\n", 0, end), buf.rfind(b"\r", 0, end)) + 1
+        if cut == 0:
+            self._partial = buf
+            return []
+        self._partial = buf[cut:]
+        text = buf[:cut].decode(self.encoding, errors="replace").replace("\r\n", "\n")
+        segments = text.split("\n")
+        # After the final \n: empty, or lines ended by bare \r
+        tail = segments.pop()
+        if "\r" not in text:
+            return zip(segments, repeat(False))
+        lines = []
+        for segment in segments:
+            parts = segment.split("\r")
+            last = parts.pop()
+            lines.extend((part, True) for part in parts)
+            lines.append((last, False))
+        lines.extend((part, True) for part in tail.split("\r")[:-1])
+        return lines
+
+    def flush(self):
+        """Return whatever is left as a final unterminated line."""
+        buf, self._partial = self._partial, b""
+        if not buf:
+            return []
+        return self.feed(buf + b"\n")
+
+
+class ProgressCollapser:
+    """
+    Ingestion stage that drops progress redraws from command output.
+
+    A line ended by a bare `\\r` is overwritten by whatever follows it,
+    and consecutive progress lines (percentages, `(n/m)` counters, ETA)
+    that differ only in numbers and bar characters redraw the same
+    status. Of each such run only the final state is passed to `emit`,
+    plus a snapshot every `snapshot_interval` seconds so long steps still
+    show progress. Call flush() when a command ends.
+    """
+
+    PERCENT_RE = re.compile(r"\d%")
+    COUNTER_RE = re.compile(r"\(\d+/\d+\)")
+    # Removed to compare two progress lines: numbers, spacing, bar glyphs
+    KEY_RE = re.compile(r"[\d\s#=<>.,:;/|%()\[\]*+-]+")
+
+    def __init__(self, emit, enabled=True, snapshot_interval=30.0,
+                 clock=time.monotonic):
+        self.emit = emit
+        self.enabled = enabled
+        self.snapshot_interval = snapshot_interval
+        self._clock = clock
+        self._pending = None
+        self._pending_key = None
+        self._pending_overwritten = False
+        self._run_start = 0.0
+        self.lines_in = 0
+        self.lines_out = 0
+
+    def _is_progress(self, line):
+        # Substring checks first: most build output has none of these
+        return (
+            ("%" in line and self.PERCENT_RE.search(line) is not None)
+            or "ETA" in line
+            or ("(" in line and self.COUNTER_RE.search(line) is not None)
+        )
+
+    def _emit(self, line):
+        self.lines_out += 1
+        self.emit(line)
+
+    def feed(self, line, overwritten=False):
+        self.lines_in += 1
+        if not self.enabled:
+            self._emit(line)
+            return
+        transient = overwritten or self._is_progress(line)
+        key = self.KEY_RE.sub(" ", line).strip() if transient else None
+        now = self._clock()
+
+        if self._pending is not None:
+            if not (self._pending_overwritten or key == self._pending_key):
+                self._emit(self._pending)
+                self._pending = None
+            else:
+                if now - self._run_start >= self.snapshot_interval:
+                    self._emit(self._pending)
+                    self._run_start = now
+                # otherwise the pending state is superseded and dropped
+                if not transient:
+                    # Overwritten by a plain line: the run ends here
+                    self._pending = None
+
+        if not transient:
+            self._emit(line)
+            return
+        if self._pending is None:
+            self._run_start = now
+        self._pending = line
+        self._pending_key = key
+        self._pending_overwritten = overwritten
+
+    def flush(self):
+        """Pass on the final state of a pending progress line."""
+        if self._pending is not None:
+            self._emit(self._pending)
+            self._pending = None
+
+
+class CommandRunner:
+    """
+    Run a command in its own process group and pump its combined
+    stdout/stderr through a selector on a non-blocking pipe.
+
+    Output is read in large chunks and handed to
+    `on_line(line, overwritten)` one line at a time. The stop event and
+    the timeout are checked at least every `poll_interval` seconds, even
+    while the command is silent.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, cmd, on_line, stop_event, timeout, cwd=None, env=None,
+                 poll_interval=0.1, monitor=None):
+        self.cmd = cmd
+        self.on_line = on_line
+        self.stop_event = stop_event
+        self.timeout = timeout
+        self.cwd = cwd
+        self.env = env
+        self.poll_interval = poll_interval
+        # Optional ResourceMonitor accounting for the command's processes
+        self.monitor = monitor
+        self.process = None
+        # Recorded at spawn: the command leads its own group (see _preexec)
+        self.pgid = None
+        self.stopped = False
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=self.cwd,
+            env=self.env,
+            bufsize=0,
+            preexec_fn=self._preexec,
+        )
+        self.pgid = self.process.pid
+        if self.monitor:
+            self.monitor.track(self.process.pid)
+        return self.process
+
+    def _preexec(self):
+        os.setsid()
+        if self.monitor:
+            self.monitor.preexec()
+
+    def terminate(self):
+        """
+        SIGTERM the command's process group. Returns False if the group
+        has already exited. Safe to call from another thread.
+        """
+        if self.pgid is None:
+            return False
+        try:
+            os.killpg(self.pgid, signal.SIGTERM)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def pump(self):
+        """
+        Read output until EOF, a stop request or the timeout.
+        Returns the process exit code; raises TimeoutExpired on timeout,
+        once the command is terminated and reaped.
+        """
+        proc = self.process
+        fd = proc.stdout.fileno()
+        os.set_blocking(fd, False)
+        splitter = LineSplitter()
+        on_line = self.on_line
+        deadline = time.monotonic() + self.timeout
+
+        sel = selectors.DefaultSelector()
+        sel.register(fd, selectors.EVENT_READ)
+        timed_out = False
+        try:
+            eof = False
+            while not eof:
+                if self.stop_event.is_set():
+                    self.stopped = True
+                    self.terminate()
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    self.terminate()
+                    break
+
+                for _key, _events in sel.select(min(self.poll_interval, remaining)):
+                    try:
+                        data = os.read(fd, self.CHUNK_SIZE)
+                    except BlockingIOError:
+                        continue
+                    if not data:
+                        eof = True
+                        break
+                    for line, overwritten in splitter.feed(data):
+                        on_line(line, overwritten)
+        finally:
+            sel.close()
+            for line, overwritten in splitter.flush():
+                self.on_line(line, overwritten)
+            proc.stdout.close()
+
+        returncode = self._wait()
+        if timed_out:
+            raise subprocess.TimeoutExpired(self.cmd, self.timeout)
+        return returncode
+
+    def _wait(self):
+        """Reap the command, handing its resource usage to the monitor."""
+        if not self.monitor:
+            return self.process.wait()
+        _pid, status, rusage = os.wait4(self.process.pid, 0)
+        self.process.returncode = os.waitstatus_to_exitcode(status)
+        self.monitor.untrack(self.process.pid, rusage)
+        return self.process.returncode
@@ -0,0 +1,152 @@
+# scheduler.py
+import heapq
+import datetime
+import itertools
+from collections import deque
+
+# Heap entry fields
+_PRIORITY, _START, _SEQ, _JOB, _LIVE = range(5)
+
+# Refusals that concern only the job, not the host: later jobs may overtake
+OVERTAKE_REASONS = ("weight", "labels")
+
+
+class FairScheduler:
+    """
+    Queued jobs ordered by priority, then fair share between groups.
+
+    Fair share is start-time fair queuing: each group (the submitter, or
+    the repository) has a virtual finish time, advanced by a job's weight
+    when it is queued, and a job's start tag is the later of its group's
+    finish time and the start tag of the last job dispatched. Among jobs
+    of equal priority the smallest start tag runs first, so twenty builds
+    queued at once by one group alternate with other groups' builds
+    instead of running back to back. Tags are fixed when a job is queued,
+    so one heap keyed (-priority, start tag, sequence) is enough.
+
+    Removal and re-prioritisation are O(1) and O(log n): the old heap
+    entry is only flagged dead and skipped when it surfaces; the heap is
+    rebuilt once dead entries outnumber live ones. A pass looks at no
+    more than `scan_limit` refused candidates, so a long queue of jobs
+    that do not fit costs a bounded amount per dispatch attempt.
+
+    Not thread-safe: the JobQueue lock is held around every call.
+    """
+
+    def __init__(self, history=100, scan_limit=32):
+        self.scan_limit = scan_limit
+        self._heap = []
+        self._entries = {}
+        self._dead = 0
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        self._finish = {}
+        # Most recent dispatches, newest last
+        self.decisions = deque(maxlen=history)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, job_id):
+        return job_id in self._entries
+
+    def jobs(self):
+        """Queued jobs, in no particular order."""
+        return [entry[_JOB] for entry in self._entries.values()]
+
+    def ordered(self):
+        """Queued jobs in the order they would be dispatched, if admitted."""
+        return [entry[_JOB] for entry in sorted(self._entries.values())]
+
+    def _add(self, job, priority, start):
+        entry = [-priority, start, next(self._seq), job, True]
+        self._entries[job.id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _kill(self, entry):
+        entry[_LIVE] = False
+        self._dead += 1
+        if self._dead > 64 and self._dead > len(self._entries):
+            self._heap = [e for e in self._heap if e[_LIVE]]
+            heapq.heapify(self._heap)
+            self._dead = 0
+
+    def push(self, job):
+        """Queue `job` by its `priority` and `group` attributes."""
+        start = max(self._vtime, self._finish.get(job.group, 0.0))
+        self._finish[job.group] = start + job.weight
+        if len(self._finish) > 2 * len(self._entries) + 64:
+            # Groups that are not ahead of the clock are as good as new
+            self._finish = {g: f for g, f in self._finish.items() if f > self._vtime}
+        self._add(job, job.priority, start)
+
+    def remove(self, job_id):
+        """Drop a queued job. Returns it, or None if it is not queued."""
+        entry = self._entries.pop(job_id, None)
+        if entry is None:
+            return None
+        self._kill(entry)
+        return entry[_JOB]
+
+    def bump(self, job_id, priority):
+        """
+        Change a queued job's priority, keeping its fair-share tag.
+        Returns False if the job is not queued.
+        """
+        entry = self._entries.get(job_id)
+        if entry is None:
+            return False
+        self._kill(entry)
+        job = entry[_JOB]
+        job.priority = priority
+        self._add(job, priority, entry[_START])
+        return True
+
+    def clear(self):
+        self._heap.clear()
+        self._entries.clear()
+        self._dead = 0
+
+    def pop(self, admit):
+        """
+        Remove and return the first job, in scheduling order, that
+        `admit(job)` accepts; `admit` returns (ok, reason). A "weight" or
+        "labels" refusal lets later jobs overtake, any other reason stops
+        the search, as does the `scan_limit`-th refusal. Returns None if
+        nothing can start.
+        """
+        refused = []
+        chosen = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if not entry[_LIVE]:
+                self._dead -= 1
+                continue
+            ok, reason = admit(entry[_JOB])
+            if ok:
+                chosen = entry
+                break
+            refused.append(entry)
+            if reason not in OVERTAKE_REASONS or len(refused) >= self.scan_limit:
+                break
+        for entry in refused:
+            heapq.heappush(self._heap, entry)
+        if chosen is None:
+            return None
+
+        job = chosen[_JOB]
+        del self._entries[job.id]
+        self._vtime = max(self._vtime, chosen[_START])
+        now = datetime.datetime.utcnow()
+        self.decisions.append({
+            "job_id": job.id,
+            "group": job.group,
+            "priority": job.priority,
+            "start_tag": round(chosen[_START], 3),
+            "overtook": len(refused),
+            "queued_seconds": round(
+                (now - datetime.datetime.fromisoformat(job.created_at)).total_seconds(), 3
+            ),
+            "dispatched_at": now.isoformat(),
+        })
+        return job
@@ -0,0 +1,96 @@
+# serve.py
+"""
+Production serving: one scheduler process and a pool of web processes.
+
+The scheduler process is app.py on a loopback port: it alone holds the
+job queue, the agent registry and the background writers, and runs the
+builds. In front of it, gunicorn runs WEB_WORKERS processes of web.py,
+which serve the UI, task history, logs and downloads from the database
+on their own and forward the rest to the scheduler. Polling viewers and
+downloads thus use every core without competing with the build runner.
+"""
+import os
+import sys
+import time
+import signal
+import datetime
+import subprocess
+import urllib.request
+
+SCHEDULER_PORT = int(os.environ.get("SCHEDULER_PORT", "5001"))
+SCHEDULER_URL = f"http://127.0.0.1:{SCHEDULER_PORT}"
+WEB_BIND = os.environ.get("WEB_BIND", "0.0.0.0:5000")
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", str(os.cpu_count() or 1)))
+# Threads per web process; each open log stream holds one
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "16"))
+READY_TIMEOUT = 120
+
+
+def _log(msg):
+    print(f"[{datetime.datetime.utcnow().isoformat()}] {msg}", file=sys.stderr)
+
+
+def _wait_ready(scheduler):
+    """Wait until the scheduler answers: the schema then exists for the web tier."""
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if scheduler.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(SCHEDULER_URL + "/queue", timeout=5):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def _stop(proc):
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGTERM)
+    return proc.wait()
+
+
+def main():
+    scheduler = subprocess.Popen(
+        [sys.executable, "app.py"],
+        env=dict(os.environ, APP_ROLE="scheduler", APP_HOST="127.0.0.1",
+                 APP_PORT=str(SCHEDULER_PORT)),
+    )
+    if not _wait_ready(scheduler):
+        _log("Scheduler process did not start")
+        sys.exit(_stop(scheduler) or 1)
+
+    web = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "--bind", WEB_BIND,
+            "--workers", str(WEB_WORKERS),
+            "--worker-class", "gthread",
+            "--threads", str(WEB_THREADS),
+            "web:app",
+        ],
+        env=dict(os.environ, SCHEDULER_URL=SCHEDULER_URL),
+    )
+    _log(f"Serving on {WEB_BIND}: {WEB_WORKERS} web processes, scheduler on {SCHEDULER_URL}")
+
+    stopping = []
+
+    def _shutdown_handler(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGINT, _shutdown_handler)
+    signal.signal(signal.SIGTERM, _shutdown_handler)
+
+    while not stopping and web.poll() is None and scheduler.poll() is None:
+        time.sleep(0.5)
+    if not stopping:
+        _log("Scheduler or web process exited, stopping")
+    # Web tier first, so no request reaches a stopping scheduler; the
+    # scheduler then shuts the queue down as app.py does on its own
+    web_code = _stop(web)
+    scheduler_code = _stop(scheduler)
+    sys.exit(0 if stopping else (scheduler_code or web_code or 1))
+
+
+if __name__ == "__main__":
+    main()
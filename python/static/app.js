@@ -1,11 +1,45 @@
 $(document).ready(function () {
     const path = window.location.pathname;
   
+    // Pages are fetched one at a time. Each poll re-fetches every page
+    // shown, each from the previous one's cursor, so tasks added on top
+    // push rows down the list instead of opening a gap between pages
+    const PAGE_SIZE = 50;
+    let shownPages = 1;
+    let olderCursor = null;
+
+    function tasksQuery(extra) {
+      const query = { limit: PAGE_SIZE };
+      const status = $('#statusFilter').val();
+      if (status) query.status = status;
+      return Object.assign(query, extra);
+    }
+
+    // Fetch `pages` consecutive pages, then call done(tasks, nextCursor)
+    function fetchTaskPages(pages, cursor, tasks, done) {
+      $.getJSON(API.tasks, tasksQuery(cursor ? { cursor } : {}), page => {
+        tasks = tasks.concat(page.tasks);
+        if (pages > 1 && page.next_cursor) {
+          fetchTaskPages(pages - 1, page.next_cursor, tasks, done);
+        } else {
+          done(tasks, page.next_cursor);
+        }
+      });
+    }
+
+    function loadMoreTasks() {
+      if (!olderCursor) return;
+      shownPages += 1;
+      loadTasks();
+    }
+
     // Dashboard: tasks table
     function loadTasks() {
-      $.getJSON(API.tasks, data => {
+      fetchTaskPages(shownPages, null, [], (tasks, nextCursor) => {
+        olderCursor = nextCursor;
+        $('#loadMoreTasks').toggle(!!olderCursor);
         const $tbody = $('#tasksTable tbody').empty();
-        data.forEach(task => {
+        tasks.forEach(task => {
           const $tr = $('<tr>')
             .append($('<td>').text(task.id.substring(0, 8)))
             .append($('<td>').text(task.git_uri))
@@ -26,6 +60,9 @@ $(document).ready(function () {
             $actions.append(
               `<button class="btn btn-danger btn-sm mr-1 remove-btn" data-id="${task.id}">Remove</button>`
             );
+            $actions.append(
+              `<button class="btn btn-secondary btn-sm mr-1 bump-btn" data-id="${task.id}">Priority</button>`
+            );
           }
           $actions.append(
             `<button class="btn btn-primary btn-sm log-btn" data-id="${task.id}">Logs</button>`
@@ -41,12 +78,18 @@ $(document).ready(function () {
       });
     }
   
-    // Repositories: cards by repo
-    function loadRepos() {
-      $.getJSON(API.tasks, data => {
+    // Repositories: cards by repo, built from the pages loaded so far
+    let repoTasks = [];
+    let repoCursor = null;
+
+    function loadRepos(cursor) {
+      $.getJSON(API.tasks, { limit: PAGE_SIZE, cursor: cursor || '' }, page => {
+        repoTasks = repoTasks.concat(page.tasks);
+        repoCursor = page.next_cursor;
+        $('#loadMoreRepos').toggle(!!repoCursor);
         const $container = $('#reposContainer').empty();
         const groups = {};
-        data.forEach(t => (groups[t.git_uri] = groups[t.git_uri] || []).push(t));
+        repoTasks.forEach(t => (groups[t.git_uri] = groups[t.git_uri] || []).push(t));
   
         Object.entries(groups).forEach(([repo, tasks]) => {
           const $card = $('<div class="card mb-4">')
@@ -85,13 +128,25 @@ $(document).ready(function () {
       setInterval(loadTasks, 5000);
   
       $('#tasksTable')
-        .on('click', '.kill-btn',    e => $.post(API.kill,   { task_id:    $(e.currentTarget).data('id') }, loadTasks))
+        .on('click', '.kill-btn',    e => $.post(API.kill,   { job_id:      $(e.currentTarget).data('id') }, loadTasks))
         .on('click', '.remove-btn',  e => $.post(API.remove, { job_id:      $(e.currentTarget).data('id') }, loadTasks))
+        .on('click', '.bump-btn',    e => {
+          const priority = prompt('New priority (higher starts first):', '10');
+          if (priority !== null) $.post(API.bump, { job_id: $(e.currentTarget).data('id'), priority }, loadTasks);
+        })
         .on('click', '.log-btn',     e => startLogPolling($(e.currentTarget).data('id')))
         .on('click', '.download-btn',e => window.location = API.download($(e.currentTarget).data('id')));
+
+      $('#loadMoreTasks').on('click', loadMoreTasks);
+      $('#statusFilter').on('change', () => {
+        shownPages = 1;
+        olderCursor = null;
+        loadTasks();
+      });
     }
     else if (path === '/repos') {
       loadRepos();
+      $('#loadMoreRepos').on('click', () => loadRepos(repoCursor));
   
       $('#reposContainer')
         .on('click', '.repo-log-btn',      e => startLogPolling($(e.currentTarget).data('id')))
@@ -101,7 +156,7 @@ $(document).ready(function () {
     // Enqueue (common)
     $('#taskForm').submit(e => {
       e.preventDefault();
-      $.post(API.enqueue, { git_uri: $('#gitUri').val().trim() }, res => {
+      $.post(API.enqueue, { git_uri: $('#gitUri').val().trim(), weight: $('#jobWeight').val() || 1, priority: $('#jobPriority').val() || 0, labels: $('#jobLabels').val().trim(), clean_build: $('#cleanBuild').is(':checked') ? 1 : 0, force: $('#forceRebuild').is(':checked') ? 1 : 0, keep_progress: $('#keepProgress').is(':checked') ? 1 : 0 }, res => {
         alert(res.message);
         $('#gitUri').val('');
         if (path === '/' || path === '/tasks') loadTasks();
@@ -5,12 +5,18 @@ const API = {
   enqueue:  '/enqueue',
   kill:     '/kill',
   remove:   '/remove',
+  bump:     '/bump',
+  queue:    '/queue',
   logsJson: (id, after_id=0) => `/logs_json/${id}?after_id=${after_id}`,
+  logsStream: id => `/logs_stream/${id}`,
+  logsSearch: '/logs/search',
   download: id => `/tasks/${id}/download`,
   metrics: {
-    cpu:    '/metrics/cpu',
-    memory: '/metrics/memory',
-    disk:   '/metrics/disk'
+    cpu:     '/metrics/cpu',
+    memory:  '/metrics/memory',
+    disk:    '/metrics/disk',
+    latest:  '/metrics/latest',
+    history: window => `/metrics/history?window=${window}`
   }
 };
 
@@ -29,9 +35,11 @@ function getBadgeClass(status) {
 // Update job status widget
 function updateCurrentStatus() {
   $.getJSON(API.current, data => {
-    $('#currentStatus').text(
-      data.id ? `Running (${data.git_uri})` : 'Idle'
-    );
+    const jobs = data.jobs || [];
+    let text = 'Idle';
+    if (jobs.length === 1) text = `Running (${jobs[0].git_uri})`;
+    else if (jobs.length > 1) text = `Running ${jobs.length} jobs`;
+    $('#currentStatus').text(text);
   }).fail(() => {
     $('#currentStatus').text('Unknown');
   });
@@ -39,48 +47,104 @@ function updateCurrentStatus() {
 
 // Poll and display system metrics
 function loadMetrics() {
-  $.getJSON(API.metrics.cpu, data => {
-    $('#cpuUsage').text(data.cpu_percent.toFixed(1) + '%');
-  });
-  $.getJSON(API.metrics.memory, data => {
-    $('#memUsage').text(data.percent.toFixed(1) + '%');
-  });
-  $.getJSON(API.metrics.disk, data => {
-    $('#diskUsage').text(data.percent.toFixed(1) + '%');
+  $.getJSON(API.metrics.latest, data => {
+    $('#cpuUsage').text(data.cpu.cpu_percent.toFixed(1) + '%');
+    $('#memUsage').text(data.memory.percent.toFixed(1) + '%');
+    // Show the fullest volume, list all of them on hover
+    const disks = Object.entries(data.disks);
+    if (!disks.length) return;
+    const [, fullest] = disks.reduce((a, b) => (b[1].percent > a[1].percent ? b : a));
+    $('#diskUsage')
+      .text(fullest.percent.toFixed(1) + '%')
+      .attr('title', disks.map(([name, d]) => `${name} (${d.path}): ${d.percent.toFixed(1)}%`).join('\n'));
   });
 }
 
 // Shared log‐polling
 let logPollInterval = null;
+let logStream = null;
 let lastLogId = 0;
+let logTaskId = null;
+
+function appendLogRows($pre, rows) {
+  if (rows.length && $pre.text().startsWith('Loading')) {
+    $pre.text('');
+  }
+  if (!rows.length) return;
+  $pre.append(document.createTextNode(
+    rows.map(r => `[${r.timestamp}] ${r.line}\n`).join('')
+  ));
+  lastLogId = rows[rows.length - 1].id;
+  $pre[0].scrollTop = $pre[0].scrollHeight;
+}
 
 function startLogPolling(taskId) {
   const $pre = $('#logPre');
   lastLogId = 0;
+  logTaskId = taskId;
+  $('#logSearchInput').val('');
+  $('#logSearchResults').empty();
   $pre.text('Loading logs…');
   $('#logModal').modal('show');
 
-  logPollInterval = setInterval(() => {
-    $.getJSON(API.logsJson(taskId, lastLogId), rows => {
-      if (rows.length && $pre.text().startsWith('Loading')) {
-        $pre.text('');
-      }
-      rows.forEach(r => {
-        $pre.append(`[${r.timestamp}] ${r.line}\n`);
-        lastLogId = r.id;
-      });
-      $pre[0].scrollTop = $pre[0].scrollHeight;
+  // Prefer the pushed stream; the browser resumes it with Last-Event-ID
+  if (window.EventSource) {
+    logStream = new EventSource(API.logsStream(taskId));
+    logStream.onmessage = e => appendLogRows($pre, JSON.parse(e.data));
+    logStream.addEventListener('done', () => {
+      if ($pre.text().startsWith('Loading')) $pre.text('');
+      stopLogPolling();
     });
+    return;
+  }
+
+  logPollInterval = setInterval(() => {
+    $.getJSON(API.logsJson(taskId, lastLogId), rows => appendLogRows($pre, rows));
   }, 1000);
 }
 
 function stopLogPolling() {
+  if (logStream) {
+    logStream.close();
+    logStream = null;
+  }
   if (logPollInterval) {
     clearInterval(logPollInterval);
     logPollInterval = null;
   }
 }
 
+// Full-text search inside the open log; a hit reloads the log from its line
+function searchLogs(query) {
+  const $results = $('#logSearchResults').empty();
+  $.getJSON(API.logsSearch, { q: query, task_id: logTaskId, limit: 20 }, hits => {
+    if (!hits.length) {
+      $results.append($('<li class="list-group-item py-1">').text('No matches'));
+    }
+    hits.forEach(h => {
+      $results.append(
+        $('<li class="list-group-item list-group-item-action py-1 log-hit">')
+          .attr('data-id', h.id)
+          .text(`[${h.timestamp}] ${h.line}`)
+      );
+    });
+  }).fail(xhr => {
+    const msg = (xhr.responseJSON && xhr.responseJSON.error) || 'Search failed';
+    $results.append($('<li class="list-group-item py-1 text-danger">').text(msg));
+  });
+}
+
+function jumpToLogLine(logId) {
+  const $pre = $('#logPre');
+  stopLogPolling();
+  $pre.text('');
+  lastLogId = logId - 1;
+  $.getJSON(API.logsJson(logTaskId, lastLogId), rows => {
+    appendLogRows($pre, rows);
+    $pre[0].scrollTop = 0;
+  });
+}
+
 // Initialize shared bits
 $(document).ready(function() {
   updateCurrentStatus();
@@ -90,4 +154,12 @@ $(document).ready(function() {
   setInterval(loadMetrics, 5000);
 
   $('#logModal').on('hidden.bs.modal', stopLogPolling);
+  $('#logSearchForm').submit(e => {
+    e.preventDefault();
+    const query = $('#logSearchInput').val().trim();
+    if (query) searchLogs(query);
+  });
+  $('#logSearchResults').on('click', '.log-hit', e => {
+    jumpToLogLine($(e.currentTarget).data('id'));
+  });
 });
@@ -0,0 +1,232 @@
+# telemetry.py
+import sys
+import bisect
+import datetime
+import threading
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bucket plus +Inf; not cumulative until rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Unlabelled series are exposed from the start, at zero
+            self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Return the series for these label values, creating it once.
+        Hot paths should keep the returned object instead of calling
+        labels() on every update.
+        """
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self):
+        """Yield (suffix, label values, extra label, value)."""
+        raise NotImplementedError
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.documentation}")
+        out.append(f"# TYPE {self.name} {self.TYPE}")
+        for suffix, values, extra, value in self._samples():
+            labels = _format_labels(self.labelnames, values, extra)
+            out.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield "", values, None, child.value
+
+
+class Gauge(_Metric):
+    """
+    A gauge is either set directly or computed at scrape time by `fn`,
+    which returns a number, or {label values tuple: number} for a
+    labelled gauge.
+    """
+
+    TYPE = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), fn=None):
+        self.fn = fn
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def _samples(self):
+        if self.fn is None:
+            for values, child in list(self._children.items()):
+                yield "", values, None, child.value
+            return
+        result = self.fn()
+        if isinstance(result, dict):
+            for values, value in result.items():
+                yield "", tuple(str(v) for v in values), None, value
+        else:
+            yield "", (), None, result
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    # Seconds, from sub-millisecond DB calls to multi-hour builds
+    DEFAULT_BUCKETS = (
+        0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+        1, 2.5, 5, 10, 30, 60, 300, 900, 1800, 3600, 7200, 14400,
+    )
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total, count = child.sum, child.count
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield "_bucket", values, ("le", _format_value(float(bound))), cumulative
+            yield "_sum", values, None, total
+            yield "_count", values, None, count
+
+
+class Registry:
+    """Process-wide set of metrics, rendered in Prometheus text format."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), fn=None):
+        return self._register(Gauge(name, documentation, labelnames, fn))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        out = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            # A failing callback gauge must not break the whole scrape
+            lines = []
+            try:
+                metric.render(lines)
+            except Exception as e:
+                print(
+                    f"[{datetime.datetime.utcnow().isoformat()}] Rendering {metric.name} failed: {e}",
+                    file=sys.stderr,
+                )
+                continue
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+# Global instance
+registry = Registry()
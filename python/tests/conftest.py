@@ -0,0 +1,26 @@
+# conftest.py
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the db package opens ./sqlite and ./yocto-mirror and starts
+# its background threads: keep all of that in a scratch directory
+_scratch = tempfile.mkdtemp(prefix="buildos-tests-")
+os.chdir(_scratch)
+os.environ.setdefault("ARTIFACT_STORE", os.path.join(_scratch, "artifacts"))
+
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def task_db(tmp_path):
+    """A fresh SQLiteDB with its own content store."""
+    from content_store import ContentStore
+    from db.sqlite import SQLiteDB
+
+    db = SQLiteDB(str(tmp_path / "sqlite"), content_store=ContentStore(str(tmp_path / "artifacts")))
+    db.init_db()
+    return db
@@ -0,0 +1,185 @@
+# test_agents.py
+"""
+A local build server (app.py with JOB_WORKERS=0) and worker agent
+processes (agent.py) talking to it over HTTP.
+"""
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Waits for a marker file, so a test decides when the build ends
+PIPELINE = """\
+echo "building on $AGENT_NAME"
+for i in $(seq 1 50); do echo "line $i"; done
+while [ ! -e "$RELEASE" ]; do sleep 0.1; done
+mkdir -p .result
+echo "$AGENT_NAME" > .result/built-by.txt
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_repo(path):
+    os.makedirs(os.path.join(path, ".config"))
+    with open(os.path.join(path, ".config", "pipeline.sh"), "w") as f:
+        f.write(PIPELINE)
+    git = ["git", "-C", str(path), "-c", "user.name=t", "-c", "user.email=t@example.com"]
+    subprocess.run(git[:3] + ["init", "-q"], check=True)
+    subprocess.run(git + ["add", "."], check=True)
+    subprocess.run(git + ["commit", "-q", "-m", "pipeline"], check=True)
+
+
+def wait_for(predicate, timeout=30, interval=0.1):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(interval)
+    raise AssertionError("timed out")
+
+
+class Cluster:
+    def __init__(self, root):
+        self.root = root
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.release = root / "release"
+        self.env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(p for p in (ROOT, os.environ.get("PYTHONPATH")) if p),
+            RELEASE=str(self.release),
+            GIT_CACHE_DIR="",
+            ARTIFACT_STORE="yocto-mirror/artifacts",
+            JOB_MAX_CPU="100",
+            JOB_MAX_MEMORY="100",
+            JOB_MAX_DISK="100",
+        )
+        self.procs = []
+        self.agents = {}
+
+    def _spawn(self, name, script, **env):
+        workdir = self.root / name
+        workdir.mkdir()
+        log = open(workdir / "out.log", "w")
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, script)],
+            cwd=workdir, env=dict(self.env, **env), stdout=log, stderr=subprocess.STDOUT,
+        )
+        self.procs.append(proc)
+        return proc
+
+    def start_server(self):
+        self._spawn(
+            "server", "app.py",
+            APP_HOST="127.0.0.1", APP_PORT=str(self.port), JOB_WORKERS="0",
+            AGENT_HEARTBEAT_SECONDS="0.5", AGENT_LOST_SECONDS="5",
+        )
+        wait_for(lambda: self._reachable())
+
+    def _reachable(self):
+        try:
+            self.get("/queue")
+            return True
+        except OSError:
+            return False
+
+    def start_agent(self, name):
+        self.agents[name] = self._spawn(name, "agent.py", AGENT_SERVER=self.url, AGENT_NAME=name)
+        wait_for(lambda: name in {a["name"] for a in self.get("/agents")["agents"]})
+
+    def stop_agent(self, name):
+        proc = self.agents.pop(name)
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=30) == 0
+
+    def get(self, path):
+        with urllib.request.urlopen(self.url + path, timeout=10) as resp:
+            return json.load(resp)
+
+    def enqueue(self, repo):
+        data = urllib.parse.urlencode({"git_uri": str(repo), "force": "1"}).encode()
+        with urllib.request.urlopen(self.url + "/enqueue", data=data, timeout=30) as resp:
+            return json.load(resp)["job_id"]
+
+    def task(self, job_id):
+        conn = sqlite3.connect(f"file:{self.root / 'server' / 'sqlite'}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute(
+                "SELECT status, started_at, finished_at, agent FROM tasks WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            return dict(row)
+        finally:
+            conn.close()
+
+    def close(self):
+        for proc in reversed(self.procs):
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    make_repo(tmp_path / "repo")
+    c = Cluster(tmp_path)
+    c.start_server()
+    yield c
+    c.close()
+
+
+def test_jobs_run_on_several_agents(cluster):
+    for name in ("agent-1", "agent-2", "agent-3"):
+        cluster.start_agent(name)
+    jobs = [cluster.enqueue(cluster.root / "repo") for _ in range(3)]
+    # Each agent runs one build at a time, so all three are busy at once
+    running = wait_for(lambda: len(cluster.get("/current")["jobs"]) == 3 and cluster.get("/current"))
+    assert {j["id"] for j in running["jobs"]} == set(jobs)
+    cluster.release.touch()
+
+    wait_for(lambda: all(cluster.task(j)["status"] == "finished" for j in jobs))
+    agents = {cluster.task(j)["agent"] for j in jobs}
+    assert agents == {"agent-1", "agent-2", "agent-3"}
+    for job_id in jobs:
+        # The server commits log lines in batches, after the final status
+        line = f"building on {cluster.task(job_id)['agent']}"
+        wait_for(lambda: line in [row["line"] for row in cluster.get(f"/logs_json/{job_id}")])
+        with urllib.request.urlopen(f"{cluster.url}/tasks/{job_id}/download") as resp:
+            assert resp.status == 200
+
+
+def test_stopping_agent_hands_job_back(cluster):
+    cluster.start_agent("leaving")
+    job_id = cluster.enqueue(cluster.root / "repo")
+    wait_for(lambda: cluster.task(job_id)["status"] == "running")
+
+    cluster.stop_agent("leaving")
+    task = cluster.task(job_id)
+    # Queued again as if never started: no cancel reached the task
+    assert task["status"] == "queued"
+    assert task["finished_at"] is None
+    assert cluster.get(f"/jobs/{job_id}")["status"] == "queued"
+
+    cluster.release.touch()
+    cluster.start_agent("staying")
+    wait_for(lambda: cluster.task(job_id)["status"] == "finished")
+    task = cluster.task(job_id)
+    assert task["agent"] == "staying"
+    assert task["finished_at"] is not None
@@ -0,0 +1,83 @@
+# test_download.py
+import datetime
+
+import pytest
+from flask import Flask
+
+from endpoints import tasks
+
+PAYLOAD = bytes(range(256)) * 4096
+
+
+@pytest.fixture
+def client(task_db, monkeypatch):
+    monkeypatch.setattr(tasks, "db", task_db)
+    monkeypatch.delenv("ARTIFACT_ACCEL_PREFIX", raising=False)
+    task_db.create_task("job-1", "https://example.com/repo.git",
+                        datetime.datetime.utcnow().isoformat())
+    task_db.update_task_content("job-1", PAYLOAD)
+    app = Flask(__name__)
+    app.register_blueprint(tasks.tasks_bp)
+    return app.test_client()
+
+
+def digest(task_db):
+    return task_db.get_task_artifact("job-1")["digest"]
+
+
+def test_full_download_has_digest_etag(client, task_db):
+    resp = client.get("/tasks/job-1/download")
+    assert resp.status_code == 200
+    assert resp.data == PAYLOAD
+    assert resp.headers["ETag"] == f'"{digest(task_db)}"'
+    assert resp.headers["Accept-Ranges"] == "bytes"
+    assert int(resp.headers["Content-Length"]) == len(PAYLOAD)
+
+
+def test_missing_artifact(client):
+    assert client.get("/tasks/nope/download").status_code == 404
+
+
+def test_range(client):
+    resp = client.get("/tasks/job-1/download", headers={"Range": "bytes=1000-1009"})
+    assert resp.status_code == 206
+    assert resp.data == PAYLOAD[1000:1010]
+    assert resp.headers["Content-Range"] == f"bytes 1000-1009/{len(PAYLOAD)}"
+
+
+def test_if_range(client, task_db):
+    headers = {"Range": "bytes=5-9", "If-Range": f'"{digest(task_db)}"'}
+    resp = client.get("/tasks/job-1/download", headers=headers)
+    assert resp.status_code == 206
+    assert resp.data == PAYLOAD[5:10]
+
+    headers["If-Range"] = '"stale"'
+    resp = client.get("/tasks/job-1/download", headers=headers)
+    assert resp.status_code == 200
+    assert resp.data == PAYLOAD
+
+
+def test_if_none_match(client, task_db):
+    resp = client.get("/tasks/job-1/download",
+                      headers={"If-None-Match": f'"{digest(task_db)}"'})
+    assert resp.status_code == 304
+    assert resp.data == b""
+
+    resp = client.get("/tasks/job-1/download", headers={"If-None-Match": '"stale"'})
+    assert resp.status_code == 200
+
+
+def test_accel_redirect(client, task_db, monkeypatch):
+    monkeypatch.setenv("ARTIFACT_ACCEL_PREFIX", "/_artifacts/")
+    resp = client.get("/tasks/job-1/download")
+    assert resp.status_code == 200
+    assert resp.data == b""
+    relpath = task_db.get_task_artifact("job-1")["relpath"]
+    assert resp.headers["X-Accel-Redirect"] == "/_artifacts/" + relpath
+    assert resp.headers["ETag"] == f'"{digest(task_db)}"'
+
+    resp = client.get("/tasks/job-1/download",
+                      headers={"If-None-Match": f'"{digest(task_db)}"'})
+    assert resp.status_code == 304
+    assert "X-Accel-Redirect" not in resp.headers
+    assert resp.headers["ETag"] == f'"{digest(task_db)}"'
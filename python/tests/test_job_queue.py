@@ -0,0 +1,134 @@
+# test_job_queue.py
+import datetime
+import threading
+import time
+
+from flask import Flask
+
+from db import db
+import job_queue as job_queue_module
+from endpoints import pipeline
+from job import Job, JobSummary
+from job_queue import JobQueue
+from runner import CommandRunner
+
+
+class CrashingJob(Job):
+    def run(self):
+        self.status = Job.STATUS_RUNNING
+        raise OSError("No space left on device")
+
+
+class QuickJob(Job):
+    def run(self):
+        self.status = Job.STATUS_FINISHED
+        self.finished_at = datetime.datetime.utcnow().isoformat()
+        db.update_task_status(self.id, self.status, finished_at=self.finished_at)
+
+
+def test_history_is_bounded():
+    queue = JobQueue(workers=0, history_size=5)
+    jobs = [queue.add_job(Job(f"https://example.com/repo-{i}.git")) for i in range(20)]
+    with queue.lock:
+        for job in jobs:
+            queue.scheduler.remove(job.id)
+            job.status = Job.STATUS_FINISHED
+            queue._retire(job)
+
+    assert not queue.jobs
+    assert list(queue.history) == [job.id for job in jobs[-5:]]
+    assert all(isinstance(s, JobSummary) for s in queue.history.values())
+    # Older jobs are read back from the database
+    old = queue.get_job(jobs[0].id)
+    assert isinstance(old, JobSummary) and old.id == jobs[0].id
+
+
+def test_crashing_job_fails_and_the_worker_goes_on(capsys):
+    queue = JobQueue(workers=1, admission_interval=0.05)
+    try:
+        crashing = queue.add_job(CrashingJob("https://example.com/crash.git"))
+        quick = queue.add_job(QuickJob("https://example.com/quick.git"))
+        deadline = datetime.datetime.utcnow() + datetime.timedelta(seconds=10)
+        while queue.jobs and datetime.datetime.utcnow() < deadline:
+            threading.Event().wait(0.02)
+
+        assert db.get_task(crashing.id)["status"] == "failed"
+        assert db.get_task(crashing.id)["finished_at"]
+        assert queue.get_job(crashing.id).status == "failed"
+        assert db.get_task(quick.id)["status"] == "finished"
+        assert all(t.is_alive() for t in queue.worker_threads)
+        assert "crashed: OSError: No space left on device" in capsys.readouterr().err
+    finally:
+        queue.shutdown()
+
+
+def test_kill_after_the_command_exited():
+    job = Job("https://example.com/kill.git")
+    runner = CommandRunner(["true"], on_line=lambda *a: None,
+                           stop_event=threading.Event(), timeout=10)
+    runner.start()
+    runner.pump()
+    job._runner = runner
+    job.kill()
+    assert job.status == Job.STATUS_CANCELED
+
+
+def test_queue_actions_take_job_id(monkeypatch):
+    calls = []
+    for name in ("kill_job", "remove_job"):
+        monkeypatch.setattr(
+            pipeline.job_queue, name,
+            lambda job_id, name=name: calls.append((name, job_id)) or (True, "ok"),
+        )
+    monkeypatch.setattr(
+        pipeline.job_queue, "bump",
+        lambda job_id, priority: calls.append(("bump", job_id)) or (True, "ok"),
+    )
+    app = Flask(__name__)
+    app.register_blueprint(pipeline.pipeline_bp)
+    client = app.test_client()
+    for path in ("/kill", "/remove"):
+        assert client.post(path, data={"job_id": "j1"}).status_code == 200
+    assert client.post("/bump", data={"job_id": "j1", "priority": 5}).status_code == 200
+    assert calls == [("kill_job", "j1"), ("remove_job", "j1"), ("bump", "j1")]
+
+
+def test_concurrent_submits_of_one_commit_coalesce(monkeypatch):
+    monkeypatch.setattr(job_queue_module, "resolve_head", lambda *a, **kw: "a" * 40)
+    find_cached_build = db.find_cached_build
+
+    def slow_lookup(*args):
+        # Widen the window between lookup and insert
+        time.sleep(0.05)
+        return find_cached_build(*args)
+
+    monkeypatch.setattr(db, "find_cached_build", slow_lookup)
+    queue = JobQueue(workers=0)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def submit():
+        barrier.wait()
+        results.append(queue.submit("https://example.com/coalesce.git"))
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    outcomes = sorted(outcome for _, outcome in results)
+    assert outcomes == ["coalesced"] * 7 + ["queued"]
+    assert len({job_id for job_id, _ in results}) == 1
+    job = queue.get_job(results[0][0])
+    assert job.coalesced == 7
+    assert len(queue.scheduler) == 1
+
+    # Once that build is over, the commit is built again
+    with queue.lock:
+        queue.scheduler.remove(job.id)
+        job.status = Job.STATUS_FAILED
+        queue._retire(job)
+    assert not queue.building
+    job_id, outcome = queue.submit("https://example.com/coalesce.git/")
+    assert outcome == "queued" and job_id != job.id
@@ -0,0 +1,102 @@
+# test_log_follower.py
+import datetime
+import threading
+import time
+
+import pytest
+
+from db.log_follower import LogFollower
+from db.log_hub import LogHub
+
+
+def now():
+    return datetime.datetime.utcnow().isoformat()
+
+
+@pytest.fixture
+def hub():
+    return LogHub()
+
+
+@pytest.fixture
+def follower(task_db, hub):
+    f = LogFollower(task_db, hub, interval=0.05)
+    yield f
+    f.close()
+
+
+def read_all(hub, task_id, after_id, timeout=5):
+    """Rows a viewer gets from the hub until it is told the task is done."""
+    rows = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        res = hub.read(task_id, after_id, timeout=0.5)
+        assert res is not None
+        new, done = res
+        rows += new
+        if new:
+            after_id = new[-1]["id"]
+        if done:
+            return rows
+    raise AssertionError("stream did not end")
+
+
+def test_viewers_share_one_poll(task_db, hub, follower, monkeypatch):
+    task_db.create_task("t1", "https://example.com/repo.git", now())
+    task_db.update_task_status("t1", "running", started_at=now())
+    task_db.add_logs([("t1", now(), "before")])
+    last = task_db.get_logs_since("t1", 0)[-1]["id"]
+
+    polls = []
+    get_logs_since = task_db.get_logs_since
+    monkeypatch.setattr(
+        task_db, "get_logs_since", lambda *a: polls.append(a) or get_logs_since(*a)
+    )
+    results = [None] * 5
+
+    def viewer(n):
+        results[n] = read_all(hub, "t1", last)
+
+    start = time.monotonic()
+    for _ in results:
+        assert follower.follow("t1", last)
+    threads = [threading.Thread(target=viewer, args=(n,)) for n in range(len(results))]
+    for t in threads:
+        t.start()
+
+    task_db.add_logs([("t1", now(), f"line {i}") for i in range(3)])
+    time.sleep(0.2)
+    task_db.update_task_status("t1", "finished", finished_at=now())
+    # Written after the final status, as Job.run does
+    task_db.add_logs([("t1", now(), "late")])
+    for t in threads:
+        t.join()
+
+    for rows in results:
+        assert [r["line"] for r in rows] == ["line 0", "line 1", "line 2", "late"]
+    # One poll per interval, not one per viewer and interval
+    assert len(polls) <= (time.monotonic() - start) / follower.interval + 2
+    for _ in results:
+        follower.unfollow("t1")
+    assert hub.stats()["tasks"] == 0
+
+
+def test_ended_task_is_not_followed(task_db, follower):
+    task_db.create_task("t2", "https://example.com/repo.git", now())
+    task_db.update_task_status("t2", "failed", finished_at=now())
+    assert not follower.follow("t2", 0)
+    assert not follower.follow("missing", 0)
+
+
+def test_viewer_behind_the_tail_catches_up(task_db, hub, follower):
+    task_db.create_task("t3", "https://example.com/repo.git", now())
+    task_db.update_task_status("t3", "running", started_at=now())
+    task_db.add_logs([("t3", now(), f"old {i}") for i in range(3)])
+    last = task_db.get_logs_since("t3", 0)[-1]["id"]
+    assert follower.follow("t3", last)
+    assert follower.follow("t3", 0)
+    # Rows before the first viewer's position are not in the tail
+    assert hub.read("t3", 0, timeout=0) is None
+    follower.unfollow("t3")
+    follower.unfollow("t3")
+    assert hub.stats()["tasks"] == 0
@@ -0,0 +1,125 @@
+import datetime
+
+import pytest
+
+NOW = datetime.datetime.utcnow().isoformat()
+
+
+@pytest.fixture
+def search_db(task_db):
+    if not task_db.fts_enabled:
+        pytest.skip("SQLite built without FTS5")
+    for task_id in ("t1", "t2"):
+        task_db.create_task(task_id, "https://example.com/repo.git", NOW)
+    task_db.add_logs([
+        ("t1", NOW, "NOTE: recipe-1234 do_compile started"),
+        ("t1", NOW, "ERROR: recipe-1234 do_compile failed"),
+        ("t1", NOW, "NOTE: recipe-1299 do_fetch started for a fairly long line "
+                    "that mentions many other words around the term error once"),
+        ("t2", NOW, "ERROR: recipe-7 do_install failed"),
+        ("t2", NOW, "NOTE: linux-yocto do_configure"),
+    ])
+    task_db.index_logs()
+    return task_db
+
+
+def lines(hits):
+    return [h["line"] for h in hits]
+
+
+def test_rows_are_found_only_once_indexed(task_db):
+    if not task_db.fts_enabled:
+        pytest.skip("SQLite built without FTS5")
+    task_db.create_task("t1", "https://example.com/repo.git", NOW)
+    task_db.add_logs([("t1", NOW, "ERROR: late line")])
+    assert task_db.search_logs("late") == []
+    assert task_db.get_fts_lag() == 1
+    assert task_db.index_logs() == 1
+    assert lines(task_db.search_logs("late")) == ["ERROR: late line"]
+    assert task_db.get_fts_lag() == 0
+
+
+def test_every_word_must_match(search_db):
+    assert lines(search_db.search_logs("do_compile failed")) == [
+        "ERROR: recipe-1234 do_compile failed"
+    ]
+
+
+def test_task_filter(search_db):
+    hits = search_db.search_logs("ERROR:", task_id="t2")
+    assert lines(hits) == ["ERROR: recipe-7 do_install failed"]
+    assert {h["task_id"] for h in search_db.search_logs("ERROR:")} == {"t1", "t2"}
+
+
+def test_prefix_and_phrase(search_db):
+    assert len(search_db.search_logs("recipe-12*")) == 3
+    assert lines(search_db.search_logs("linux-yocto")) == ["NOTE: linux-yocto do_configure"]
+    # Quotes in the query are taken literally, not as FTS5 syntax
+    assert search_db.search_logs('"unbalanced') == []
+
+
+def test_hits_are_ranked_by_bm25(search_db):
+    hits = search_db.search_logs("error")
+    ranks = [h["rank"] for h in hits]
+    assert ranks == sorted(ranks)
+    # The long line mentioning the word once ranks last
+    assert hits[-1]["line"].startswith("NOTE: recipe-1299")
+    # Hit ids can be used as after_id to jump into the log
+    hit = hits[0]
+    assert search_db.get_logs_since(hit["task_id"], hit["id"] - 1)[0]["line"] == hit["line"]
+
+
+def test_limit(search_db):
+    assert len(search_db.search_logs("NOTE:", limit=2)) == 2
+
+
+def integrity_check(db):
+    with db._write_conn() as conn:
+        conn.execute("INSERT INTO logs_fts (logs_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_global_search_covers_archived_logs(search_db):
+    before = search_db.search_logs("ERROR:")
+    search_db.archive_task_logs("t1", block_lines=2)
+    after = search_db.search_logs("ERROR:")
+    assert after == before
+    hit = next(h for h in after if h["task_id"] == "t1")
+    assert hit["line"] == "ERROR: recipe-1234 do_compile failed"
+    assert hit["timestamp"] == NOW
+    # Within one task, archived lines are found too
+    assert lines(search_db.search_logs("do_compile failed", task_id="t1")) == [hit["line"]]
+    integrity_check(search_db)
+
+
+def test_archiving_indexes_lines_the_indexer_has_not_reached(search_db):
+    search_db.add_logs([("t1", NOW, "WARNING: written just before archiving")])
+    search_db.archive_task_logs("t1")
+    assert search_db.get_fts_lag() == 0
+    assert lines(search_db.search_logs("WARNING:")) == ["WARNING: written just before archiving"]
+    integrity_check(search_db)
+
+
+def test_purge_removes_archived_lines_from_the_index(search_db):
+    search_db.archive_task_logs("t1")
+    search_db.purge_task_logs("t1")
+    assert {h["task_id"] for h in search_db.search_logs("ERROR:")} == {"t2"}
+    integrity_check(search_db)
+
+
+def test_legacy_index_is_rebuilt_with_archived_segments(search_db):
+    search_db.archive_task_logs("t1")
+    # The external-content table of earlier versions, which lost archived lines
+    with search_db._write_conn() as conn:
+        conn.execute("DROP TABLE logs_fts")
+        conn.execute(
+            "CREATE VIRTUAL TABLE logs_fts USING fts5("
+            "line, task_id UNINDEXED, content='logs', content_rowid='id')"
+        )
+        conn.execute("UPDATE log_segments SET indexed = 0")
+    search_db.init_db()
+    assert search_db.search_logs("ERROR:") == []
+    assert search_db.get_fts_lag() == 5
+    while search_db.index_logs():
+        pass
+    assert {h["task_id"] for h in search_db.search_logs("ERROR:")} == {"t1", "t2"}
+    integrity_check(search_db)
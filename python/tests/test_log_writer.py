@@ -0,0 +1,131 @@
+# test_log_writer.py
+import datetime
+import threading
+import time
+
+import pytest
+
+from db.log_hub import LogHub
+from db.log_writer import LogWriter
+
+
+def now():
+    return datetime.datetime.utcnow().isoformat()
+
+
+class CountingDB:
+    """Wraps a database, counting add_logs calls and optionally holding them."""
+
+    def __init__(self, db):
+        self.db = db
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def add_logs(self, rows):
+        self.gate.wait()
+        self.batches.append(len(rows))
+        return self.db.add_logs(rows)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+@pytest.fixture
+def task(task_db):
+    task_db.create_task("t1", "https://example.com/repo.git", now())
+    return "t1"
+
+
+def lines(task_db, task_id):
+    return [r["line"] for r in task_db.get_logs_since(task_id, 0)]
+
+
+def test_group_commit(task_db, task):
+    db = CountingDB(task_db)
+    writer = LogWriter(db, batch_size=1000, flush_interval=0.05)
+    for i in range(2500):
+        writer.add(task, now(), f"line {i}")
+    writer.close()
+    assert lines(task_db, task) == [f"line {i}" for i in range(2500)]
+    # A few batches, not a commit per line
+    assert len(db.batches) <= 5
+    assert writer.stats()["lines_written"] == 2500
+
+
+def test_published_ids_are_the_committed_ones(task_db, task):
+    hub = LogHub()
+    hub.open(task)
+    task_db.add_logs([("other", now(), "written directly")])
+    writer = LogWriter(task_db, hub=hub, flush_interval=0.05)
+    for i in range(3):
+        writer.add(task, now(), f"line {i}")
+    assert writer.flush()
+    rows, _ = hub.read(task, 0, timeout=0)
+    assert rows == task_db.get_logs_since(task, 0)
+    writer.close()
+
+
+def test_backpressure(task_db, task):
+    db = CountingDB(task_db)
+    db.gate.clear()
+    writer = LogWriter(db, batch_size=5, flush_interval=0.01, max_pending=10)
+    added = []
+
+    def producer():
+        for i in range(30):
+            writer.add(task, now(), f"line {i}")
+            added.append(i)
+
+    t = threading.Thread(target=producer, daemon=True)
+    t.start()
+    time.sleep(0.3)
+    blocked, accepted = t.is_alive(), len(added)
+    db.gate.set()
+    t.join(timeout=5)
+    # The writer holds the buffer it took, the new buffer is full: add() blocked
+    assert blocked and accepted <= 2 * writer.max_pending
+    assert not t.is_alive()
+    writer.close()
+    assert lines(task_db, task) == [f"line {i}" for i in range(30)]
+
+
+def test_bad_row_is_dropped_and_reported(task_db, task, capsys):
+    task_db.create_task("t2", "https://example.com/repo.git", now())
+    writer = LogWriter(task_db, flush_interval=0.01, max_retries=2)
+    writer.add(task, now(), "good 1")
+    # NOT NULL violation: fails however often it is retried
+    writer.add("t2", None, "bad")
+    writer.add(task, now(), "good 2")
+    assert writer.flush() is False
+    assert lines(task_db, task) == ["good 1", "good 2"]
+    assert lines(task_db, "t2") == []
+    assert task_db.get_task("t2")["log_lines_dropped"] == 1
+    assert writer.stats()["lines_dropped"] == 1
+    assert writer.stats()["flush_errors"] == 2
+    assert "Dropped 1 log lines of t2" in capsys.readouterr().err
+
+    # The writer keeps going
+    writer.add(task, now(), "good 3")
+    assert writer.flush() is True
+    writer.close()
+    assert lines(task_db, task)[-1] == "good 3"
+
+
+def test_transient_failure_is_retried(task_db, task):
+    db = CountingDB(task_db)
+    failures = [RuntimeError("database is locked")]
+    add_logs = db.add_logs
+
+    def flaky(rows):
+        if failures:
+            raise failures.pop()
+        return add_logs(rows)
+
+    db.add_logs = flaky
+    writer = LogWriter(db, flush_interval=0.01)
+    writer.add(task, now(), "line")
+    assert writer.flush() is True
+    writer.close()
+    assert lines(task_db, task) == ["line"]
+    assert writer.stats()["lines_dropped"] == 0
@@ -0,0 +1,65 @@
+# test_metrics_sampler.py
+import pytest
+from flask import Flask
+
+from endpoints import metrics
+from metrics_sampler import MetricsSampler, RingBuffer
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(metrics.metrics_bp)
+    return app.test_client()
+
+
+def test_ring_buffer_keeps_the_newest_samples():
+    ring = RingBuffer(["t", "v"], capacity=4)
+    assert ring.latest() is None
+    for t in range(10):
+        ring.append([t, t * 10])
+    assert ring.latest() == {"t": 9, "v": 90}
+    assert ring.since(0) == {"t": [6, 7, 8, 9], "v": [60, 70, 80, 90]}
+    assert ring.since(8) == {"t": [8, 9], "v": [80, 90]}
+    assert ring.since(100) == {"t": [], "v": []}
+
+
+def test_sampler_measures_each_filesystem(tmp_path):
+    (tmp_path / "a").mkdir()
+    sampler = MetricsSampler(
+        {"a": str(tmp_path / "a"), "b": str(tmp_path), "gone": str(tmp_path / "gone")},
+        interval=3600, capacity=8,
+    )
+    try:
+        # Paths that do not exist are not sampled
+        assert set(sampler.disks) == {"a", "b"}
+        sampler.sample()
+        assert len(sampler.window(3600)["t"]) == 2
+        a, b = sampler.disk("a"), sampler.disk("b")
+        assert a["path"] == str(tmp_path / "a")
+        assert a["total"] == b["total"] > 0
+        assert 0 <= a["percent"] <= 100
+    finally:
+        sampler.close()
+
+
+def test_latest_and_disk(client):
+    latest = client.get("/metrics/latest").get_json()
+    assert set(latest) == {"cpu", "memory", "disks"}
+    assert "root" in latest["disks"]
+    assert 0 < latest["memory"]["available"] <= latest["memory"]["total"]
+
+    disk = client.get("/metrics/disk").get_json()
+    # The old top-level shape, for the fullest volume
+    assert disk["mount"] in disk["mounts"]
+    assert disk["percent"] == max(m["percent"] for m in disk["mounts"].values())
+    assert client.get("/metrics/cpu").get_json()["cpu_percent"] >= 0
+
+
+def test_history(client):
+    history = client.get("/metrics/history?window=60").get_json()
+    assert history["interval"] == metrics.metrics_sampler.interval
+    assert len(history["samples"]["t"]) >= 1
+    assert len(history["samples"]["cpu_percent"]) == len(history["samples"]["t"])
+    for window in ("0", "-5", "abc", str(metrics.MAX_HISTORY_WINDOW + 1)):
+        assert client.get(f"/metrics/history?window={window}").status_code == 400
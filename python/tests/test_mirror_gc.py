@@ -0,0 +1,175 @@
+# test_mirror_gc.py
+import datetime
+import fcntl
+import os
+import time
+
+import pytest
+
+import mirror_gc as mirror_gc_module
+from mirror_gc import MirrorGC
+
+DAY = 86400
+NOW = time.time()
+
+
+@pytest.fixture
+def mirror(tmp_path, task_db, monkeypatch):
+    monkeypatch.setattr(mirror_gc_module, "db", task_db)
+    (tmp_path / "downloads").mkdir()
+    (tmp_path / "sstate-cache" / "ab").mkdir(parents=True)
+    return tmp_path
+
+
+@pytest.fixture
+def make_gc(mirror):
+    """A GC past its first, dry, background pass: tests run passes themselves."""
+    gcs = []
+
+    def make(budget, **kwargs):
+        kwargs.setdefault("min_age", 3600)
+        gc = MirrorGC(str(mirror), budget, interval=3600, dry_run=True, atime_slack=0, **kwargs)
+        gcs.append(gc)
+        deadline = time.monotonic() + 10
+        while gc.last_report is None:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        gc.dry_run = False
+        return gc
+
+    yield make
+    for gc in gcs:
+        gc.close()
+
+
+def put(path, size, days_ago, atime_days_ago=None):
+    path.write_bytes(b"x" * size)
+    mtime = NOW - days_ago * DAY
+    atime = mtime if atime_days_ago is None else NOW - atime_days_ago * DAY
+    os.utime(path, (atime, mtime))
+    return path
+
+
+def evicted(report):
+    return [e["path"] for e in report["oldest_evicted"]]
+
+
+def test_evicts_oldest_first_until_within_budget(mirror, make_gc):
+    dl = mirror / "downloads"
+    for name, age in (("old.tar.gz", 30), ("mid.tar.gz", 20), ("new.tar.gz", 10)):
+        put(dl / name, 1000, age)
+    report = make_gc(2000).run_once()
+    assert evicted(report) == ["downloads/old.tar.gz"]
+    assert report["freed_bytes"] == 1000
+    assert report["over_budget_bytes"] == 0
+    assert sorted(os.listdir(dl)) == ["mid.tar.gz", "new.tar.gz"]
+
+    report = make_gc(0).run_once()
+    assert evicted(report) == ["downloads/mid.tar.gz", "downloads/new.tar.gz"]
+
+
+def test_recent_use_and_min_age_protect(mirror, make_gc):
+    dl = mirror / "downloads"
+    put(dl / "read-yesterday.tar.gz", 1000, 30, atime_days_ago=1)
+    put(dl / "fetched-now.tar.gz", 1000, 0)
+    put(dl / "unused.tar.gz", 1000, 30)
+    report = make_gc(0, min_age=2 * DAY).run_once()
+    assert evicted(report) == ["downloads/unused.tar.gz"]
+    assert report["protected_bytes"] == 2000
+    assert report["over_budget_bytes"] == 2000
+    assert sorted(os.listdir(dl)) == ["fetched-now.tar.gz", "read-yesterday.tar.gz"]
+
+
+def test_recent_builds_protect(mirror, make_gc, task_db):
+    dl = mirror / "downloads"
+    put(dl / "used-by-build.tar.gz", 1000, 30, atime_days_ago=5)
+    put(dl / "older.tar.gz", 1000, 30, atime_days_ago=7)
+    started = datetime.datetime.utcfromtimestamp(NOW - 6 * DAY).isoformat()
+    task_db.create_task("b1", "https://example.com/repo.git", started)
+    task_db.update_task_status("b1", "finished", started_at=started, finished_at=started)
+    report = make_gc(0, min_age=0, protect_builds=1).run_once()
+    assert evicted(report) == ["downloads/older.tar.gz"]
+    assert os.listdir(dl) == ["used-by-build.tar.gz"]
+
+
+def test_companions_go_together(mirror, make_gc):
+    dl = mirror / "downloads"
+    put(dl / "a.tar.gz", 1000, 30)
+    put(dl / "a.tar.gz.done", 0, 30)
+    sstate = mirror / "sstate-cache" / "ab"
+    obj = "sstate:busybox:core2-64:1.36:r0:core2-64:10:abcd_package.tar.zst"
+    put(sstate / obj, 2000, 20)
+    put(sstate / (obj + ".siginfo"), 100, 20)
+    # A recent read of one companion keeps the whole object
+    put(sstate / (obj + ".sig"), 10, 20, atime_days_ago=0)
+
+    report = make_gc(0).run_once()
+    assert report["objects"] == 2
+    assert evicted(report) == ["downloads/a.tar.gz"]
+    assert os.listdir(dl) == []
+    assert sorted(os.listdir(sstate)) == [obj, obj + ".sig", obj + ".siginfo"]
+
+    os.utime(sstate / (obj + ".sig"), (NOW - 20 * DAY, NOW - 20 * DAY))
+    report = make_gc(0).run_once()
+    assert report["oldest_evicted"][0]["size"] == 2110
+    assert os.listdir(sstate) == []
+
+
+def test_locked_object_is_skipped(mirror, make_gc):
+    dl = mirror / "downloads"
+    put(dl / "fetching.tar.gz", 1000, 30)
+    put(dl / "idle.tar.gz", 1000, 20)
+    # bitbake holds the lock of the oldest object
+    fd = os.open(dl / "fetching.tar.gz.lock", os.O_RDWR | os.O_CREAT)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        report = make_gc(1000).run_once()
+    finally:
+        os.close(fd)
+    assert report["skipped_locked"] == 1
+    assert evicted(report) == ["downloads/idle.tar.gz"]
+    assert sorted(os.listdir(dl)) == ["fetching.tar.gz", "fetching.tar.gz.lock"]
+
+
+def test_lock_is_taken_even_if_missing(mirror, make_gc, monkeypatch):
+    dl = mirror / "downloads"
+    put(dl / "a.tar.gz", 1000, 30)
+    held = []
+    remove = os.remove
+
+    def checking_remove(path):
+        if not str(path).endswith(".lock"):
+            # A fetch starting now finds the lock and waits
+            fd = os.open(dl / "a.tar.gz.lock", os.O_RDWR)
+            try:
+                with pytest.raises(BlockingIOError):
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                held.append(path)
+            finally:
+                os.close(fd)
+        remove(path)
+
+    monkeypatch.setattr(mirror_gc_module.os, "remove", checking_remove)
+    report = make_gc(0).run_once()
+    assert evicted(report) == ["downloads/a.tar.gz"]
+    assert held == [str(dl / "a.tar.gz")]
+    # The lock file goes with the object
+    assert os.listdir(dl) == []
+
+
+def test_dry_run_deletes_nothing(mirror, make_gc):
+    dl = mirror / "downloads"
+    put(dl / "a.tar.gz", 1000, 30)
+    put(dl / "a.tar.gz.done", 0, 30)
+    put(dl / "b.tar.gz", 1000, 20)
+    gc = make_gc(1000)
+    report = gc.run_once(dry_run=True)
+    assert report["dry_run"]
+    assert evicted(report) == ["downloads/a.tar.gz"]
+    assert report["freed_bytes"] == 1000
+    assert sorted(os.listdir(dl)) == ["a.tar.gz", "a.tar.gz.done", "b.tar.gz"]
+    assert gc.stats()["evicted_files"] == 0
+
+    gc.run_once()
+    assert gc.stats()["evicted_files"] == 2
+    assert gc.stats()["freed_bytes"] == 1000
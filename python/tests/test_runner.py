@@ -0,0 +1,81 @@
+import subprocess
+import threading
+
+import pytest
+
+from resource_monitor import ResourceMonitor
+from runner import CommandRunner, ProgressCollapser
+
+
+def run(cmd, timeout=30, monitor=None, stop_event=None):
+    lines = []
+    runner = CommandRunner(
+        cmd,
+        on_line=lambda line, overwritten: lines.append((line, overwritten)),
+        stop_event=stop_event or threading.Event(),
+        timeout=timeout,
+        monitor=monitor,
+    )
+    runner.start()
+    return runner, lines
+
+
+def test_pump_returns_lines_and_exit_code():
+    runner, lines = run(["sh", "-c", "printf 'a\\nb\\r\\nc\\rd'; exit 3"])
+    assert runner.pump() == 3
+    assert lines == [("a", False), ("b", False), ("c", True), ("d", False)]
+
+
+def test_timeout_reaps_and_untracks_the_command():
+    monitor = ResourceMonitor("test-timeout")
+    runner, _ = run(["sleep", "30"], timeout=0.3, monitor=monitor)
+    with pytest.raises(subprocess.TimeoutExpired):
+        runner.pump()
+    assert runner.process.returncode is not None
+    assert not monitor._roots
+
+
+def test_stop_event_terminates_the_command():
+    stop = threading.Event()
+    runner, _ = run(["sleep", "30"], stop_event=stop)
+    stop.set()
+    assert runner.pump() != 0
+    assert runner.stopped
+
+
+def test_terminate_after_exit_is_a_no_op():
+    runner, _ = run(["true"])
+    assert runner.pump() == 0
+    # Exited and reaped: nothing to signal, and no error
+    assert runner.terminate() is False
+
+
+def collapse(feeds, clock=None, snapshot_interval=30.0):
+    out = []
+    collapser = ProgressCollapser(
+        out.append, snapshot_interval=snapshot_interval, clock=clock or (lambda: 0.0)
+    )
+    for args in feeds:
+        collapser.feed(*args)
+    collapser.flush()
+    return out
+
+
+def test_progress_run_keeps_its_final_state():
+    assert collapse([("10%",), ("50%",), ("100%",), ("Done",)]) == ["100%", "Done"]
+
+
+def test_overwritten_line_replaced_by_plain_line_is_dropped():
+    assert collapse([("50%", True), ("Done",), ("more",)]) == ["Done", "more"]
+
+
+def test_overwritten_line_is_not_snapshotted_after_it_ends():
+    now = [0.0]
+    feeds = [("50%", True), ("Done",), ("more",), ("even more",)]
+    out = []
+    collapser = ProgressCollapser(out.append, snapshot_interval=1.0, clock=lambda: now[0])
+    for args in feeds:
+        now[0] += 5.0
+        collapser.feed(*args)
+    collapser.flush()
+    assert out == ["50%", "Done", "more", "even more"]
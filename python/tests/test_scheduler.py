@@ -0,0 +1,186 @@
+# test_scheduler.py
+import datetime
+
+from scheduler import FairScheduler
+
+
+class FakeJob:
+    def __init__(self, id, weight=1.0, priority=0, group="g", labels=()):
+        self.id = id
+        self.weight = weight
+        self.priority = priority
+        self.group = group
+        self.labels = frozenset(labels)
+        self.held_back = set()
+        self.created_at = datetime.datetime.utcnow().isoformat()
+
+
+def test_light_job_overtakes_heavy_ones():
+    sched = FairScheduler()
+    for i in range(3):
+        sched.push(FakeJob(f"heavy-{i}", weight=4.0))
+    sched.push(FakeJob("light", weight=0.5))
+    seen = []
+
+    def admit(job):
+        seen.append(job.id)
+        return (job.weight <= 1.0, "weight")
+
+    assert sched.pop(admit).id == "light"
+    assert seen == ["heavy-0", "heavy-1", "heavy-2", "light"]
+    assert [j.id for j in sched.ordered()] == ["heavy-0", "heavy-1", "heavy-2"]
+
+
+def test_pass_stops_at_scan_limit():
+    sched = FairScheduler(scan_limit=5)
+    for i in range(100):
+        sched.push(FakeJob(f"heavy-{i}", weight=4.0))
+    sched.push(FakeJob("light", weight=0.5))
+    seen = []
+
+    def admit(job):
+        seen.append(job.id)
+        return (job.weight <= 1.0, "weight")
+
+    assert sched.pop(admit) is None
+    assert len(seen) == 5
+    assert len(sched) == 101
+    # Refused jobs keep their place
+    assert [j.id for j in sched.ordered()][:5] == [f"heavy-{i}" for i in range(5)]
+
+
+def test_host_pressure_stops_the_pass():
+    sched = FairScheduler()
+    for i in range(10):
+        sched.push(FakeJob(f"job-{i}"))
+    seen = []
+
+    def admit(job):
+        seen.append(job.id)
+        return False, "cpu"
+
+    assert sched.pop(admit) is None
+    assert seen == ["job-0"]
+
+
+def test_rejections_counted_once_per_job_and_reason(monkeypatch):
+    import job_queue as jq
+
+    queue = jq.JobQueue(workers=0, max_weight=1.0)
+    job = FakeJob("waiting", weight=4.0)
+    reasons = iter([(False, "weight")] * 3 + [(False, "cpu")] * 2 + [(True, None)])
+    monkeypatch.setattr(queue, "_admissible", lambda job: next(reasons))
+    before = {r: jq.ADMISSION_REJECTIONS.labels(r).value for r in ("weight", "cpu")}
+
+    results = [queue._admit(job) for _ in range(6)]
+
+    assert results[-1] == (True, None)
+    assert jq.ADMISSION_REJECTIONS.labels("weight").value == before["weight"] + 1
+    assert jq.ADMISSION_REJECTIONS.labels("cpu").value == before["cpu"] + 1
+
+
+def admit_all(job):
+    return True, None
+
+
+def drain(sched):
+    order = []
+    while True:
+        job = sched.pop(admit_all)
+        if job is None:
+            return order
+        order.append(job.id)
+
+
+def test_interleaved_submitters_share_fairly():
+    sched = FairScheduler()
+    for i in range(5):
+        sched.push(FakeJob(f"a{i}", group="alice"))
+    for i in range(3):
+        sched.push(FakeJob(f"b{i}", group="bob"))
+    assert drain(sched) == ["a0", "b0", "a1", "b1", "a2", "b2", "a3", "a4"]
+
+
+def test_late_group_gets_no_credit_for_idle_time():
+    sched = FairScheduler()
+    for i in range(6):
+        sched.push(FakeJob(f"a{i}", group="alice"))
+    assert [sched.pop(admit_all).id for _ in range(3)] == ["a0", "a1", "a2"]
+    for i in range(2):
+        sched.push(FakeJob(f"b{i}", group="bob"))
+    # Bob starts from the current virtual time, not from zero
+    assert drain(sched) == ["b0", "a3", "b1", "a4", "a5"]
+
+
+def test_weight_counts_towards_the_share():
+    sched = FairScheduler()
+    for i in range(3):
+        sched.push(FakeJob(f"heavy{i}", weight=2.0, group="alice"))
+    for i in range(4):
+        sched.push(FakeJob(f"light{i}", weight=1.0, group="bob"))
+    assert drain(sched) == [
+        "heavy0", "light0", "light1", "heavy1", "light2", "light3", "heavy2",
+    ]
+
+
+def test_priority_comes_before_fair_share():
+    sched = FairScheduler()
+    for i in range(3):
+        sched.push(FakeJob(f"a{i}", group="alice"))
+    sched.push(FakeJob("urgent", priority=5, group="alice"))
+    sched.push(FakeJob("b0", group="bob"))
+    sched.push(FakeJob("low", priority=-1, group="bob"))
+    order = drain(sched)
+    assert order[0] == "urgent"
+    assert order[-1] == "low"
+    # Equal priority: still interleaved between groups
+    assert order[1:3] == ["a0", "b0"]
+
+
+def test_bump_keeps_the_fair_share_tag():
+    sched = FairScheduler()
+    for i in range(4):
+        sched.push(FakeJob(f"a{i}"))
+    assert sched.bump("a3", 10)
+    assert [j.id for j in sched.ordered()] == ["a3", "a0", "a1", "a2"]
+    assert sched.bump("a3", 0)
+    # Back in its original place, not at the end
+    assert [j.id for j in sched.ordered()] == ["a0", "a1", "a2", "a3"]
+    assert len(sched) == 4
+    assert not sched.bump("missing", 1)
+
+    assert sched.bump("a2", 1)
+    assert sched.pop(admit_all).priority == 1
+    # The stale entries of a3 and a2 are skipped, each job popped once
+    assert drain(sched) == ["a0", "a1", "a3"]
+    assert sched._dead == 0 and sched._heap == []
+
+
+def test_remove_is_lazy_and_rebuilds_the_heap():
+    sched = FairScheduler()
+    for i in range(200):
+        sched.push(FakeJob(f"j{i}"))
+    assert sched.remove("j0").id == "j0"
+    assert sched.remove("j0") is None
+    assert "j0" not in sched and "j1" in sched
+    for i in range(1, 150):
+        sched.remove(f"j{i}")
+    assert len(sched) == 50
+    # Rebuilt once dead entries outnumbered live ones, then 49 more died
+    assert sched._dead == 49
+    assert len(sched._heap) == 50 + 49
+    assert drain(sched) == [f"j{i}" for i in range(150, 200)]
+    assert sched._dead == 0
+
+
+def test_refused_jobs_keep_their_place_after_overtaking():
+    sched = FairScheduler()
+    sched.push(FakeJob("big", weight=4.0, group="alice"))
+    sched.push(FakeJob("small", weight=1.0, group="bob"))
+    job = sched.pop(lambda j: (j.weight <= 1.0, "weight"))
+    assert job.id == "small"
+    assert sched.decisions[-1]["job_id"] == "small"
+    assert sched.decisions[-1]["overtook"] == 1
+    assert [j.id for j in sched.ordered()] == ["big"]
+    assert sched.pop(admit_all).id == "big"
+    assert sched.decisions[-1]["overtook"] == 0
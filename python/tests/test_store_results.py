@@ -0,0 +1,85 @@
+# test_store_results.py
+import io
+import os
+import zipfile
+
+import pytest
+from flask import Flask
+
+import job as job_module
+from db.log_hub import LogHub
+from db.log_writer import LogWriter
+from endpoints import tasks
+from job import JOB_PHASE_SECONDS, Job
+
+
+@pytest.fixture
+def bound(task_db, monkeypatch):
+    """Point the job module at a fresh database, log writer and store."""
+    writer = LogWriter(task_db, flush_interval=0.01)
+    monkeypatch.setattr(job_module, "db", task_db)
+    monkeypatch.setattr(job_module, "log_writer", writer)
+    monkeypatch.setattr(job_module, "log_hub", LogHub())
+    monkeypatch.setattr(job_module, "content_store", task_db.content_store)
+    yield task_db
+    writer.close()
+
+
+def make_results(root):
+    os.makedirs(root / "images" / "empty")
+    (root / "images" / "rootfs.ext4").write_bytes(os.urandom(3 * 2**20))
+    (root / "manifest.txt").write_text("busybox 1.36\n")
+
+
+def test_results_are_zipped_into_the_store(bound, tmp_path):
+    make_results(tmp_path / ".result")
+    job = Job("https://example.com/repo.git", use_workspace=False)
+    ingests = JOB_PHASE_SECONDS.labels("ingest").count
+
+    job._store_results(str(tmp_path / ".result"))
+
+    artifact = bound.get_task_artifact(job.id)
+    assert artifact["size"] == os.path.getsize(artifact["path"])
+    assert artifact["ingest_seconds"] is not None
+    assert artifact["ingest_peak_rss"] >= 0
+    assert JOB_PHASE_SECONDS.labels("ingest").count == ingests + 1
+    # Nothing left behind in the store's spool directory
+    assert not os.listdir(bound.content_store.tmp_dir)
+
+    with zipfile.ZipFile(artifact["path"]) as zf:
+        assert sorted(zf.namelist()) == [
+            "images/", "images/empty/", "images/rootfs.ext4", "manifest.txt",
+        ]
+        assert zf.read("images/rootfs.ext4") == (
+            tmp_path / ".result" / "images" / "rootfs.ext4"
+        ).read_bytes()
+    job_module.log_writer.flush()
+    assert any(
+        r["line"].startswith("Stored artifact ") for r in bound.get_logs_since(job.id, 0)
+    )
+
+
+def test_same_results_share_one_blob(bound, tmp_path):
+    make_results(tmp_path / ".result")
+    first = Job("https://example.com/repo.git", use_workspace=False)
+    second = Job("https://example.com/repo.git", use_workspace=False)
+    first._store_results(str(tmp_path / ".result"))
+    second._store_results(str(tmp_path / ".result"))
+    a, b = bound.get_task_artifact(first.id), bound.get_task_artifact(second.id)
+    assert a["digest"] == b["digest"]
+    assert not os.listdir(bound.content_store.tmp_dir)
+
+
+def test_stored_artifact_downloads(bound, tmp_path, monkeypatch):
+    make_results(tmp_path / ".result")
+    job = Job("https://example.com/repo.git", use_workspace=False)
+    job._store_results(str(tmp_path / ".result"))
+
+    monkeypatch.setattr(tasks, "db", bound)
+    monkeypatch.delenv("ARTIFACT_ACCEL_PREFIX", raising=False)
+    app = Flask(__name__)
+    app.register_blueprint(tasks.tasks_bp)
+    resp = app.test_client().get(f"/tasks/{job.id}/download")
+    assert resp.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+        assert zf.read("manifest.txt") == b"busybox 1.36\n"
@@ -0,0 +1,86 @@
+# test_telemetry.py
+import pytest
+from flask import Flask
+
+from endpoints import metrics
+from telemetry import Registry
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(metrics.metrics_bp)
+    return app.test_client()
+
+
+def test_registry_render():
+    registry = Registry()
+    submitted = registry.counter("t_submitted_total", "Submissions", ["outcome"])
+    submitted.labels("queued").inc()
+    submitted.labels("queued").inc(2)
+    registry.gauge("t_depth", "Depth", fn=lambda: 7)
+    registry.gauge("t_disk", "Disk", ["disk"], fn=lambda: {("root",): 1.5})
+    registry.gauge("t_broken", "Broken", fn=lambda: 1 / 0)
+    latency = registry.histogram("t_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        latency.observe(value)
+
+    text = registry.render()
+    lines = text.splitlines()
+    assert "# TYPE t_submitted_total counter" in lines
+    assert 't_submitted_total{outcome="queued"} 3' in lines
+    assert "t_depth 7" in lines
+    assert 't_disk{disk="root"} 1.5' in lines
+    # A failing callback drops its own metric only
+    assert "t_broken" not in text
+    assert 't_seconds_bucket{le="0.1"} 1' in lines
+    assert 't_seconds_bucket{le="1"} 2' in lines
+    assert 't_seconds_bucket{le="+Inf"} 3' in lines
+    assert "t_seconds_count 3" in lines
+    assert "t_seconds_sum 5.55" in lines
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("t_total", "T", ["path"]).labels('a"b\\c\nd').inc()
+    assert 't_total{path="a\\"b\\\\c\\nd"} 1' in registry.render().splitlines()
+
+
+def test_prometheus_endpoint_counts_submissions_and_db_calls(client, monkeypatch):
+    import job_queue
+    from db import db
+
+    def samples():
+        resp = client.get("/metrics")
+        assert resp.status_code == 200
+        assert resp.content_type.startswith("text/plain; version=0.0.4")
+        return dict(
+            line.rsplit(" ", 1) for line in resp.get_data(as_text=True).splitlines()
+            if not line.startswith("#")
+        )
+
+    before = samples()
+    monkeypatch.setattr(job_queue, "resolve_head", lambda *a, **kw: None)
+    queue = job_queue.JobQueue(workers=0)
+    queue.submit("https://example.com/metrics.git")
+    db.get_task("missing")
+    after = samples()
+
+    def delta(key):
+        return float(after.get(key, 0)) - float(before.get(key, 0))
+
+    assert delta('buildos_jobs_submitted_total{outcome="queued"}') == 1
+    assert delta('buildos_db_call_seconds_count{method="get_task"}') >= 1
+    for name in ("buildos_queue_length", "buildos_running_jobs", "buildos_log_buffer_depth",
+                 "buildos_host_cpu_percent"):
+        assert name in after
+    assert any(k.startswith('buildos_disk_free_bytes{disk="root"') for k in after)
+
+
+def test_component_stats(client):
+    for path in ("/metrics/logs", "/metrics/db", "/metrics/cache",
+                 "/metrics/search", "/metrics/log_storage", "/metrics/mirror_gc"):
+        resp = client.get(path)
+        assert resp.status_code == 200, path
+        assert isinstance(resp.get_json(), dict), path
+    assert "lines_written" in client.get("/metrics/logs").get_json()
@@ -0,0 +1,117 @@
+# test_workspace_pool.py
+import os
+import time
+
+import pytest
+
+import workspace_pool as workspace_module
+from workspace_pool import WorkspacePool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """A pool whose trim thread is stopped: tests call trim() themselves."""
+    p = WorkspacePool(tmp_path / "ws", max_count=0, budget_bytes=0, trim_interval=3600)
+    p.close()
+    return p
+
+
+@pytest.fixture
+def walks(monkeypatch):
+    calls = []
+    dir_size = workspace_module.dir_size
+    monkeypatch.setattr(
+        workspace_module, "dir_size", lambda path: calls.append(path) or dir_size(path)
+    )
+    return calls
+
+
+def build(pool, uri, size):
+    """Lease the workspace of `uri`, leave a build tree of `size` bytes, release it."""
+    lease = pool.acquire(uri)
+    os.makedirs(os.path.join(lease.path, ".git"), exist_ok=True)
+    with open(os.path.join(lease.path, "tmp.bin"), "wb") as f:
+        f.write(b"x" * size)
+    pool.release(lease)
+    return lease.key
+
+
+def sizes(pool):
+    return {key: size for key, _, size in pool.entries()}
+
+
+def test_release_does_not_walk_the_tree(pool, walks):
+    key = build(pool, "https://example.com/a.git", 1000)
+    assert walks == []
+    assert sizes(pool) == {key: 0}
+
+    assert pool.measure() == [key]
+    assert len(walks) == 1
+    assert 1000 <= sizes(pool)[key] < 2000
+    # Unchanged since measured
+    assert pool.measure() == []
+    assert len(walks) == 1
+
+    lease = pool.acquire("https://example.com/a.git")
+    assert lease.warm
+    pool.release(lease)
+    # The previous size stands in until measured again
+    assert sizes(pool)[key] >= 1000
+    assert pool.measure() == [key]
+
+
+def test_leased_workspace_is_not_measured(pool, walks):
+    key = build(pool, "https://example.com/a.git", 10)
+    lease = pool.acquire("https://example.com/a.git")
+    assert pool.measure() == []
+    assert walks == []
+    pool.release(lease)
+    assert pool.measure() == [key]
+
+
+def test_trim_evicts_least_recently_used_over_budget(pool):
+    keys = [build(pool, f"https://example.com/r{i}.git", 10_000) for i in range(3)]
+    for age, key in enumerate(keys):
+        os.utime(os.path.join(pool.root, key + ".lock"), (100 + age, 100 + age))
+    pool.budget_bytes = 25_000
+    assert pool.trim() == [keys[0]]
+    assert sorted(sizes(pool)) == sorted(keys[1:])
+
+    pool.budget_bytes = 0
+    pool.max_count = 1
+    assert pool.trim() == [keys[1]]
+    assert list(sizes(pool)) == [keys[2]]
+
+
+def test_trim_skips_leased_workspaces(pool):
+    old = build(pool, "https://example.com/old.git", 10_000)
+    new = build(pool, "https://example.com/new.git", 10_000)
+    os.utime(os.path.join(pool.root, old + ".lock"), (1, 1))
+    pool.max_count = 1
+    lease = pool.acquire("https://example.com/old.git")
+    assert pool.trim() == [new]
+    pool.release(lease)
+
+
+def test_interrupted_build_is_discarded(pool):
+    build(pool, "https://example.com/a.git", 10)
+    lease = pool.acquire("https://example.com/a.git")
+    assert lease.warm
+    # The holder dies: the lock goes with it, the busy marker stays
+    os.close(lease._fd)
+    lease = pool.acquire("https://example.com/a.git")
+    assert not lease.warm
+    assert os.listdir(lease.path) == []
+    pool.release(lease)
+
+
+def test_release_wakes_the_trim_thread(tmp_path):
+    pool = WorkspacePool(tmp_path / "ws", trim_interval=3600)
+    try:
+        key = build(pool, "https://example.com/a.git", 1000)
+        deadline = time.monotonic() + 10
+        while sizes(pool)[key] < 1000:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+    finally:
+        pool.close()
@@ -0,0 +1,97 @@
+# web.py
+"""
+Web tier of the multi-process mode (see serve.py), run by gunicorn as
+`web:app`. Task history, logs, search and downloads are served here
+straight from the database and content store; everything else (queue
+control, live job state, agents, metrics) is forwarded over loopback
+HTTP to the single scheduler process, which alone holds the job queue.
+"""
+import os
+import time
+import threading
+import urllib.error
+import urllib.request
+
+# Before db is imported: this process only reads (see db/__init__.py)
+os.environ["APP_ROLE"] = "web"
+
+from flask import Flask, Response, jsonify, render_template, request
+from endpoints.tasks import tasks_bp
+
+SCHEDULER_URL = os.environ.get("SCHEDULER_URL", "http://127.0.0.1:5001")
+# Outlasts an agent's lease long-poll (30 s)
+FORWARD_TIMEOUT = 120
+COPY_CHUNK = 256 * 1024
+HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade",
+}
+# Live state the UI polls every few seconds: each web process asks the
+# scheduler at most once per POLL_CACHE_SECONDS, however many viewers
+POLL_CACHE_PATHS = ("/queue", "/current", "/metrics/latest")
+POLL_CACHE_SECONDS = float(os.environ.get("WEB_POLL_CACHE_SECONDS", "1"))
+
+app = Flask(__name__, template_folder="templates", static_folder="static")
+app.register_blueprint(tasks_bp)
+
+_poll_cache = {}
+_poll_lock = threading.Lock()
+
+@app.route("/")
+def index():
+    return render_template("index.html")
+
+@app.route("/repos")
+def repos():
+    return render_template("repos.html")
+
+def _open(url):
+    headers = {
+        k: v for k, v in request.headers.items()
+        if k.lower() not in HOP_HEADERS and k.lower() != "host"
+    }
+    # Request bodies (agent artifact uploads) are streamed, not buffered
+    data = request.stream if request.content_length else None
+    req = urllib.request.Request(url, data=data, headers=headers, method=request.method)
+    try:
+        return urllib.request.urlopen(req, timeout=FORWARD_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        return e
+
+def _relay(resp):
+    with resp:
+        while True:
+            block = resp.read(COPY_CHUNK)
+            if not block:
+                return
+            yield block
+
+def _response_headers(resp):
+    return [(k, v) for k, v in resp.headers.items() if k.lower() not in HOP_HEADERS]
+
+@app.route("/<path:path>", methods=["GET", "HEAD", "POST", "PUT", "DELETE"])
+def forward(path):
+    url = SCHEDULER_URL + request.path
+    if request.query_string:
+        url += "?" + request.query_string.decode()
+    cached = request.method == "GET" and request.path in POLL_CACHE_PATHS
+    if cached:
+        with _poll_lock:
+            hit = _poll_cache.get(url)
+        if hit and hit[0] > time.monotonic():
+            return Response(hit[2], status=hit[1], headers=hit[3])
+    try:
+        resp = _open(url)
+    except OSError as e:
+        return jsonify({"error": f"Scheduler unavailable: {e}"}), 503
+    if cached:
+        with resp:
+            body = resp.read()
+        headers = _response_headers(resp)
+        if resp.status == 200:
+            with _poll_lock:
+                _poll_cache[url] = (
+                    time.monotonic() + POLL_CACHE_SECONDS, resp.status, body, headers
+                )
+        return Response(body, status=resp.status, headers=headers)
+    return Response(_relay(resp), status=resp.status, headers=_response_headers(resp))
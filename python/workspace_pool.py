@@ -0,0 +1,258 @@
+# workspace_pool.py
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import hashlib
+import datetime
+import threading
+from git_cache import normalize_uri, dir_size
+
+
+class WorkspaceLease:
+    __slots__ = ("key", "path", "warm", "_fd")
+
+    def __init__(self, key, path, warm, fd):
+        self.key = key
+        self.path = path
+        self.warm = warm
+        self._fd = fd
+
+
+class WorkspacePool:
+    """
+    Build directories kept between jobs, one per repository, so
+    bitbake's TMPDIR, parse cache and local sstate survive.
+
+    A workspace is leased exclusively (flock) for a whole job. A lease
+    drops a `.busy` marker that is removed on a clean release; a marker
+    found on acquire means the previous holder died mid-build and the
+    workspace is discarded. Workspaces are evicted LRU once there are
+    more than `max_count` of them or their recorded sizes exceed
+    `budget_bytes`. Deletion renames first, so a half-deleted tree is
+    never handed out.
+
+    Measuring a build tree means walking millions of files, so release
+    only records the release time. A background thread (woken by each
+    release, and every `trim_interval` seconds) measures the idle
+    workspaces released since their last measurement and evicts; until
+    then the previous size stands in.
+    """
+
+    META = ".workspace.json"
+
+    def __init__(self, root, max_count=4, budget_bytes=0, trim_interval=600):
+        self.root = os.path.abspath(root)
+        self.max_count = max_count
+        self.budget_bytes = budget_bytes
+        self.trim_interval = trim_interval
+        os.makedirs(self.root, exist_ok=True)
+        self._purge_trash()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def key(self, git_uri):
+        norm = normalize_uri(git_uri)
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", norm.rsplit("/", 1)[-1])[:40]
+        return f"{slug}-{hashlib.sha1(norm.encode('utf-8')).hexdigest()[:16]}"
+
+    def _paths(self, key):
+        base = os.path.join(self.root, key)
+        return base, base + ".lock", base + ".busy"
+
+    def acquire(self, git_uri):
+        """
+        Lease the workspace for a repository. Returns None when another
+        job holds it, so the caller can fall back to a throwaway dir.
+        """
+        key = self.key(git_uri)
+        path, lock_path, busy_path = self._paths(key)
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+
+        if os.path.exists(busy_path):
+            # Previous job never released it: state cannot be trusted
+            self._discard(path)
+        warm = os.path.isdir(os.path.join(path, ".git"))
+        if not warm:
+            self._discard(path)
+        os.makedirs(path, exist_ok=True)
+        open(busy_path, "w").close()
+        os.utime(lock_path)
+        return WorkspaceLease(key, path, warm, fd)
+
+    def release(self, lease, healthy=True):
+        """
+        Return a workspace. An unhealthy one (e.g. its checkout could not
+        be updated) is discarded instead of kept. The size is measured
+        later by the trim thread, which this wakes.
+        """
+        path, lock_path, busy_path = self._paths(lease.key)
+        try:
+            if healthy:
+                meta = self._read_meta(path)
+                meta["released_at"] = time.time()
+                self._write_meta(path, meta)
+            else:
+                self._discard(path)
+            os.unlink(busy_path)
+        finally:
+            fcntl.flock(lease._fd, fcntl.LOCK_UN)
+            os.close(lease._fd)
+        self._wake.set()
+
+    def discard(self, lease):
+        """Wipe a leased workspace in place, keeping the lease."""
+        self._discard(lease.path)
+        os.makedirs(lease.path, exist_ok=True)
+        lease.warm = False
+
+    def entries(self):
+        """Return [(key, last_used, recorded_size)] for every workspace."""
+        result = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path) or ".trash-" in name:
+                continue
+            try:
+                last_used = os.path.getmtime(path + ".lock")
+            except OSError:
+                last_used = 0.0
+            result.append((name, last_used, self._read_meta(path).get("size", 0)))
+        return result
+
+    def _read_meta(self, path):
+        try:
+            with open(os.path.join(path, self.META)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, path, meta):
+        tmp = os.path.join(path, f"{self.META}.{uuid.uuid4().hex[:8]}")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(path, self.META))
+
+    def measure(self):
+        """
+        Record the size of every idle workspace released since it was
+        last measured. Leased workspaces are skipped. Returns the keys
+        measured.
+        """
+        measured = []
+        for key, _last_used, _size in self.entries():
+            path, lock_path, busy_path = self._paths(key)
+            meta = self._read_meta(path)
+            if meta.get("measured_at", 0) >= meta.get("released_at", 0) and "size" in meta:
+                continue
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            try:
+                if os.path.exists(busy_path) or not os.path.isdir(path):
+                    continue
+                meta = self._read_meta(path)
+                meta["measured_at"] = time.time()
+                meta["size"] = dir_size(path)
+                self._write_meta(path, meta)
+                measured.append(key)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+        return measured
+
+    def trim(self):
+        """Measure what changed, then evict. Returns the evicted keys."""
+        self.measure()
+        return self.evict()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.trim_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                for key in self.trim():
+                    print(
+                        f"[{datetime.datetime.utcnow().isoformat()}] Evicted workspace {key}",
+                        file=sys.stderr,
+                    )
+            except Exception as e:
+                print(
+                    f"[{datetime.datetime.utcnow().isoformat()}] Workspace trim failed: {e}",
+                    file=sys.stderr,
+                )
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+
+    def evict(self):
+        """Evict LRU idle workspaces over the count/size caps; returns keys."""
+        entries = sorted(self.entries(), key=lambda e: e[1])
+        count = len(entries)
+        total = sum(size for _, _, size in entries)
+        evicted = []
+        for key, _last_used, size in entries:
+            over_count = self.max_count and count > self.max_count
+            over_size = self.budget_bytes and total > self.budget_bytes
+            if not (over_count or over_size):
+                break
+            path, lock_path, _busy = self._paths(key)
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            try:
+                self._discard(path)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            count -= 1
+            total -= size
+            evicted.append(key)
+        return evicted
+
+    def _discard(self, path):
+        if not os.path.exists(path):
+            return
+        trash = f"{path}.trash-{uuid.uuid4().hex[:8]}"
+        os.rename(path, trash)
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def _purge_trash(self):
+        for name in os.listdir(self.root):
+            if ".trash-" in name:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+
+# Opt-in: set WORKSPACE_DIR to keep build directories between jobs
+_workspace_dir = os.environ.get("WORKSPACE_DIR", "")
+workspace_pool = (
+    WorkspacePool(
+        _workspace_dir,
+        max_count=int(os.environ.get("WORKSPACE_MAX_COUNT", "4")),
+        budget_bytes=int(float(os.environ.get("WORKSPACE_BUDGET_GB", "200")) * 1024**3),
+        trim_interval=float(os.environ.get("WORKSPACE_TRIM_INTERVAL_MINUTES", "10")) * 60,
+    )
+    if _workspace_dir
+    else None
+)
@@ -0,0 +1,211 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+class Listing:
+    """
+    One scanned directory: entries as (name, is_dir, size, mtime) tuples
+    plus the size of the files directly inside it. Sorted views are built
+    on first use and kept with the listing.
+    """
+
+    __slots__ = ('mtime_ns', 'entries', 'subdirs', 'files_size', 'file_count', '_sorted', '_lock')
+
+    def __init__(self, mtime_ns, entries, subdirs):
+        self.mtime_ns = mtime_ns
+        self.entries = entries
+        # Real (non-symlink) subdirectories, walked for total sizes
+        self.subdirs = subdirs
+        self.files_size = sum(e[2] for e in entries if not e[1])
+        self.file_count = sum(1 for e in entries if not e[1])
+        self._sorted = {}
+        self._lock = threading.Lock()
+
+    def sorted(self, key, reverse=False):
+        view = self._sorted.get((key, reverse))
+        if view is None:
+            idx = {'name': 0, 'size': 2, 'last_modified': 3}[key]
+            # Folders first whatever the order, like the file grid shows them
+            dirs = sorted((e for e in self.entries if e[1]), key=lambda e: e[idx], reverse=reverse)
+            files = sorted((e for e in self.entries if not e[1]), key=lambda e: e[idx], reverse=reverse)
+            view = dirs + files
+            with self._lock:
+                self._sorted[(key, reverse)] = view
+        return view
+
+
+class DirIndex:
+    """
+    Cache of directory listings built with os.scandir.
+
+    A cached listing is reused as long as the directory's own mtime is
+    unchanged, which covers entries being added, removed or renamed; a
+    listing check costs one stat() instead of one per entry. Files
+    rewritten in place do not touch the directory mtime, so the API
+    calls `invalidate` after each change it makes.
+
+    Up to `max_dirs` listings are kept, least recently used first out.
+
+    Recursive sizes are kept per directory too (see `total_size`).
+    """
+
+    SORT_KEYS = ('name', 'size', 'last_modified')
+    # mtime has coarse granularity: a directory changed this recently may
+    # change again without a new mtime, so its scan is not cached yet
+    RACY_NS = 2 * 10**9
+
+    def __init__(self, max_dirs=100000, size_ttl=60.0):
+        self.max_dirs = max_dirs
+        self.size_ttl = size_ttl
+        self._cache = OrderedDict()
+        # path -> (expires, bytes, files, directories including itself)
+        self._totals = OrderedDict()
+        # Paths whose expired totals are being recomputed in the background
+        self._refreshing = set()
+        # Bumped by invalidate: totals computed across it are not kept
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.scans = 0
+        self.refreshes = 0
+
+    def listing(self, path):
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached.mtime_ns == mtime_ns:
+                self._cache.move_to_end(path)
+                self.hits += 1
+                return cached
+
+        listing = self._scan(path, mtime_ns)
+        with self._lock:
+            self.scans += 1
+            if time.time_ns() - mtime_ns < self.RACY_NS:
+                return listing
+            self._cache[path] = listing
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.max_dirs:
+                self._cache.popitem(last=False)
+        return listing
+
+    @staticmethod
+    def _scan(path, mtime_ns):
+        entries = []
+        subdirs = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    st = entry.stat()
+                except OSError:
+                    # Dangling symlink or entry removed during the scan
+                    continue
+                entries.append((entry.name, is_dir, st.st_size, st.st_mtime))
+                if is_dir and not entry.is_symlink():
+                    subdirs.append(entry.name)
+        return Listing(mtime_ns, entries, subdirs)
+
+    def invalidate(self, path):
+        """
+        Forget `path` and its parent, whose entry for it changed, and the
+        recursive sizes of every directory above it.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            self._cache.pop(path, None)
+            self._cache.pop(os.path.dirname(path), None)
+            self._generation += 1
+            while True:
+                self._totals.pop(path, None)
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+
+    def page(self, path, offset=0, limit=200, sort='name', reverse=False, query=None,
+             hidden=()):
+        """
+        Return (entries, total matching, listing) for one page of `path`.
+        `query` keeps names containing it, case-insensitively; names in
+        `hidden` are left out.
+        """
+        listing = self.listing(path)
+        entries = listing.sorted(sort, reverse)
+        if hidden:
+            entries = [e for e in entries if e[0] not in hidden]
+        if query:
+            query = query.lower()
+            entries = [e for e in entries if query in e[0].lower()]
+        return entries[offset:offset + limit], len(entries), listing
+
+    def total_size(self, path):
+        """
+        Recursive size of `path`. Returns (bytes, files, directories).
+
+        Each directory's total is kept for `size_ttl` seconds, and changes
+        made through `invalidate` drop the totals above them at once, so
+        a repeated call only walks subtrees that changed. Once a total
+        has expired it is still returned, and a background thread
+        recomputes it from the cached listings: one stat() per directory,
+        with only the directories whose mtime changed scanned again. A
+        caller therefore only waits for a walk the first time it asks.
+
+        Outside of that, the limits are those of the listings: entries
+        added or removed by other processes show within about `size_ttl`,
+        but a file rewritten in place by another process keeps its old
+        size until its directory changes or its listing is evicted.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            cached = self._totals.get(path)
+        if cached is not None:
+            if cached[0] <= time.monotonic():
+                self._refresh_later(path)
+            size, files, dirs = cached[1:]
+        else:
+            size, files, dirs = self._subtree(path, time.monotonic())
+        return size, files, dirs - 1
+
+    def _refresh_later(self, path):
+        with self._lock:
+            if path in self._refreshing:
+                return
+            self._refreshing.add(path)
+        threading.Thread(target=self._refresh, args=(path,), daemon=True).start()
+
+    def _refresh(self, path):
+        try:
+            self._subtree(path, time.monotonic())
+        finally:
+            with self._lock:
+                self._refreshing.discard(path)
+                self.refreshes += 1
+
+    def _subtree(self, path, now):
+        with self._lock:
+            generation = self._generation
+            cached = self._totals.get(path)
+            if cached is not None and cached[0] > now:
+                self._totals.move_to_end(path)
+                return cached[1:]
+        try:
+            listing = self.listing(path)
+        except OSError:
+            return 0, 0, 0
+        size, files, dirs = listing.files_size, listing.file_count, 1
+        for name in listing.subdirs:
+            sub_size, sub_files, sub_dirs = self._subtree(os.path.join(path, name), now)
+            size += sub_size
+            files += sub_files
+            dirs += sub_dirs
+        with self._lock:
+            if generation != self._generation:
+                return size, files, dirs
+            self._totals[path] = (now + self.size_ttl, size, files, dirs)
+            self._totals.move_to_end(path)
+            while len(self._totals) > self.max_dirs:
+                self._totals.popitem(last=False)
+        return size, files, dirs
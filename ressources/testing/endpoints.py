@@ -2,9 +2,21 @@ import os
 from flask import Blueprint, request, send_from_directory, jsonify, current_app
 from werkzeug.utils import secure_filename
 import shutil
+from dir_index import DirIndex
+from uploads import UploadStore, UploadError
 
 def create_endpoints(app, base_dir):
     bp = Blueprint('api', __name__, url_prefix='/api')
+    index = DirIndex(
+        max_dirs=int(os.environ.get('INDEX_MAX_DIRS', '100000')),
+        size_ttl=float(os.environ.get('INDEX_SIZE_TTL', '60')),
+    )
+    # Staging area for chunked uploads, inside base_dir so commits are atomic
+    upload_dir = os.path.join(os.path.abspath(base_dir), '.uploads')
+    uploads = UploadStore(
+        upload_dir,
+        expire_seconds=float(os.environ.get('UPLOAD_EXPIRE_HOURS', '24')) * 3600,
+    )
 
     def success(data=None, message='Success'):
         return jsonify({'status': 'success', 'message': message, 'data': data})
@@ -24,19 +36,49 @@ def create_endpoints(app, base_dir):
     @bp.route('/list')
     def list_files():
         path = request.args.get('path', '')
+        sort = request.args.get('sort', 'name')
+        if sort not in DirIndex.SORT_KEYS:
+            return error(f'Invalid sort key "{sort}"')
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+            limit = min(max(1, int(request.args.get('limit', 200))), 1000)
+        except ValueError:
+            return error('Invalid offset or limit')
         try:
             full = resolve(path)
-            items = []
-            for name in os.listdir(full):
-                p = os.path.join(full, name)
-                st = os.stat(p)
-                items.append({
-                    'name': name,
-                    'is_dir': os.path.isdir(p),
-                    'size': st.st_size,
-                    'last_modified': st.st_mtime
-                })
-            return success(items)
+            entries, total, listing = index.page(
+                full, offset, limit, sort,
+                reverse=request.args.get('order') == 'desc',
+                query=request.args.get('q'),
+                hidden=('.uploads',) if full == os.path.dirname(upload_dir) else (),
+            )
+            items = [
+                {'name': name, 'is_dir': is_dir, 'size': size, 'last_modified': mtime}
+                for name, is_dir, size, mtime in entries
+            ]
+            return success({
+                'items': items,
+                'total': total,
+                'offset': offset,
+                'limit': limit,
+                'files_size': listing.files_size,
+            })
+        except PermissionError as e:
+            return error(str(e), 403)
+        except NotADirectoryError:
+            return error(f'"{path}" is not a directory', 400)
+        except FileNotFoundError:
+            return error(f'"{path}" not found', 404)
+        except Exception as e:
+            current_app.logger.exception(e)
+            return error(str(e), 500)
+
+    @bp.route('/size')
+    def dir_size():
+        path = request.args.get('path', '')
+        try:
+            size, files, dirs = index.total_size(resolve(path))
+            return success({'size': size, 'files': files, 'dirs': dirs})
         except PermissionError as e:
             return error(str(e), 403)
         except Exception as e:
@@ -71,6 +113,7 @@ def create_endpoints(app, base_dir):
                 os.rmdir(full)
             else:
                 os.remove(full)
+            index.invalidate(full)
             return success(message=f'"{name}" deleted')
         except PermissionError as e:
             return error(str(e), 403)
@@ -90,6 +133,7 @@ def create_endpoints(app, base_dir):
             folder = resolve(path)
             filename = secure_filename(file.filename)
             file.save(os.path.join(folder, filename))
+            index.invalidate(os.path.join(folder, filename))
             return success({'filename': filename}, f'"{filename}" uploaded')
         except PermissionError as e:
             return error(str(e), 403)
@@ -97,6 +141,83 @@ def create_endpoints(app, base_dir):
             current_app.logger.exception(e)
             return error(str(e), 500)
 
+    @bp.route('/uploads', methods=['POST'])
+    def upload_init():
+        data = request.get_json() or dict(request.form)
+        path = data.get('path', '')
+        name = secure_filename(data.get('name') or '')
+        if not name:
+            return error('Missing name')
+        try:
+            size = int(data.get('size'))
+        except (TypeError, ValueError):
+            return error('Missing or invalid size')
+        try:
+            folder = resolve(path)
+            if os.path.exists(os.path.join(folder, name)):
+                return error(f'"{name}" already exists', 409)
+            upload_id = uploads.init(
+                {'path': path, 'name': name}, size, data.get('checksum')
+            )
+            return success({'upload_id': upload_id, 'name': name, 'size': size})
+        except UploadError as e:
+            return error(str(e), e.code)
+        except PermissionError as e:
+            return error(str(e), 403)
+        except Exception as e:
+            current_app.logger.exception(e)
+            return error(str(e), 500)
+
+    @bp.route('/uploads/<upload_id>', methods=['GET'])
+    def upload_status(upload_id):
+        try:
+            return success(uploads.status(upload_id))
+        except UploadError as e:
+            return error(str(e), e.code)
+
+    @bp.route('/uploads/<upload_id>', methods=['PUT'])
+    def upload_chunk(upload_id):
+        # The raw body is copied to the part file as it arrives
+        length = request.content_length
+        if length is None:
+            return error('Content-Length required', 411)
+        try:
+            offset = int(request.args.get('offset', ''))
+        except ValueError:
+            return error('Missing or invalid offset')
+        try:
+            received = uploads.write(upload_id, offset, length, request.stream)
+            return success({'received': received})
+        except UploadError as e:
+            return error(str(e), e.code)
+        except Exception as e:
+            current_app.logger.exception(e)
+            return error(str(e), 500)
+
+    @bp.route('/uploads/<upload_id>/commit', methods=['POST'])
+    def upload_commit(upload_id):
+        try:
+            target = uploads.status(upload_id)['target']
+            dest = os.path.join(resolve(target['path']), target['name'])
+            uploads.commit(upload_id, dest)
+            index.invalidate(dest)
+            return success({'filename': target['name']}, f'"{target["name"]}" uploaded')
+        except UploadError as e:
+            return error(str(e), e.code)
+        except PermissionError as e:
+            return error(str(e), 403)
+        except Exception as e:
+            current_app.logger.exception(e)
+            return error(str(e), 500)
+
+    @bp.route('/uploads/<upload_id>', methods=['DELETE'])
+    def upload_abort(upload_id):
+        try:
+            uploads.abort(upload_id)
+            return success(message='Upload aborted')
+        except UploadError as e:
+            return error(str(e), e.code)
+
     @bp.route('/create-folder', methods=['POST'])
     def create_folder():
         data = request.get_json() or dict(request.form)
@@ -108,6 +229,7 @@ def create_endpoints(app, base_dir):
             folder = resolve(path)
             new_folder = os.path.join(folder, secure_filename(name))
             os.makedirs(new_folder)
+            index.invalidate(new_folder)
             return success(message=f'Folder "{name}" created')
         except FileExistsError:
             return error('Folder already exists', 409)
@@ -131,6 +253,7 @@ def create_endpoints(app, base_dir):
                 os.path.join(folder, old),
                 os.path.join(folder, secure_filename(new))
             )
+            index.invalidate(os.path.join(folder, old))
             return success(message=f'"{old}" → "{new}"')
         except PermissionError as e:
             return error(str(e), 403)
@@ -153,6 +276,8 @@ def create_endpoints(app, base_dir):
                 return error(f'"{target}" is not a directory', 400)
             dst = os.path.join(dest_dir, name)
             os.rename(src, dst)
+            index.invalidate(src)
+            index.invalidate(dst)
             return success(message=f'"{name}" moved to "{target}"')
         except PermissionError as e:
             return error(str(e), 403)
@@ -194,6 +319,7 @@ def create_endpoints(app, base_dir):
                         shutil.copy2(s_entry, d_entry)
             else:
                 shutil.copy2(raw_src, dst_path)
+            index.invalidate(dst_path)
 
             return success(message=f'"{name}" copied to "{target}"')
 
@@ -4,6 +4,12 @@ document.addEventListener('alpine:init', () => {
       // ── State ──
       path: '',
       items: [],
+      total: 0,
+      offset: 0,
+      limit: 200,
+      sort: 'name',
+      order: 'asc',
+      query: '',
       history: [],
       future: [],
       toasts: [],
@@ -39,10 +45,15 @@ document.addEventListener('alpine:init', () => {
   
       // ── Load directory ──
       load() {
-        this.fetchJSON(`/api/list?path=${encodeURIComponent(this.path)}`)
+        const params = new URLSearchParams({
+          path: this.path, offset: this.offset, limit: this.limit,
+          sort: this.sort, order: this.order, q: this.query
+        });
+        this.fetchJSON(`/api/list?${params}`)
           .then(r => {
             if (r.status === 'success') {
-              this.items = r.data.map(it => ({
+              this.total = r.data.total;
+              this.items = r.data.items.map(it => ({
                 ...it,
                 relativePath: this.path ? `${this.path}/${it.name}` : it.name
               }));
@@ -59,20 +70,43 @@ document.addEventListener('alpine:init', () => {
         this.future = [];
         this.path = p;
         this.hideMenu();
-        this.load();
+        this.reset();
       },
       back() {
         if (!this.history.length) return;
         this.future.push(this.path);
         this.path = this.history.pop();
-        this.load();
+        this.reset();
       },
       forward() {
         if (!this.future.length) return;
         this.history.push(this.path);
         this.path = this.future.pop();
+        this.reset();
+      },
+      reset() {
+        this.offset = 0;
+        this.query = '';
+        this.load();
+      },
+
+      // ── Paging / sorting / filtering ──
+      page(delta) {
+        const next = this.offset + delta * this.limit;
+        if (next < 0 || next >= this.total) return;
+        this.offset = next;
+        this.load();
+      },
+      refilter() {
+        this.offset = 0;
         this.load();
       },
+      showSize(it) {
+        this.fetchJSON(`/api/size?path=${encodeURIComponent(it.relativePath)}`)
+          .then(r => r.status === 'success'
+            ? this.toast(`"${it.name}": ${this.fmtSize(r.data.size)} in ${r.data.files} files`, 'info')
+            : this.toast(r.message, 'error'));
+      },
   
       // ── CRUD ──
       createFolder() {
@@ -174,25 +208,75 @@ document.addEventListener('alpine:init', () => {
       uploadFile(file) {
         const id = Date.now()+'-'+file.name;
         this.uploads.push({ id,name:file.name,progress:0 });
-        const xhr=new XMLHttpRequest();
-        xhr.open('POST','/api/upload');
-        xhr.upload.onprogress=ev=>{
+        const onProgress = p => {
           const u=this.uploads.find(x=>x.id===id);
-          if(u&&ev.lengthComputable) u.progress=Math.round(ev.loaded/ev.total*100);
+          if(u) u.progress=Math.round(p*100);
         };
-        xhr.onload=()=>{
-          this.uploads=this.uploads.filter(x=>x.id!==id);
-          this.load();
-          try{const r=JSON.parse(xhr.response);this.toast(r.message,r.status==='success'?'success':'error');}
-          catch{this.toast('Upload failed','error');}
+        this.sendChunks(file, this.path, onProgress)
+          .then(r => this.toast(r.message, r.status==='success'?'success':'error'))
+          .catch(e => this.toast(e.message || 'Upload error','error'))
+          .finally(() => {
+            this.uploads=this.uploads.filter(x=>x.id!==id);
+            this.load();
+          });
+      },
+
+      // Chunked, resumable upload: dropping the same file again after an
+      // interruption only sends the ranges the server is missing.
+      async sendChunks(file, path, onProgress) {
+        const CHUNK = 8*1024*1024, PARALLEL = 4, RETRIES = 3;
+        const key = `upload:${path}/${file.name}:${file.size}:${file.lastModified}`;
+        const json = (url, method, body) => fetch(url, {
+          method,
+          headers:{'Content-Type':'application/json'},
+          body: body && JSON.stringify(body)
+        }).then(r => r.json());
+
+        let uploadId = localStorage.getItem(key), missing = null;
+        if (uploadId) {
+          const r = await json(`/api/uploads/${uploadId}`, 'GET');
+          if (r.status === 'success') missing = r.data.missing;
+        }
+        if (!missing) {
+          const r = await json('/api/uploads', 'POST', { path, name:file.name, size:file.size });
+          if (r.status !== 'success') throw new Error(r.message);
+          uploadId = r.data.upload_id;
+          localStorage.setItem(key, uploadId);
+          missing = [[0, file.size]];
+        }
+
+        const chunks = [];
+        let done = file.size;
+        for (const [s, e] of missing) {
+          done -= e - s;
+          for (let o = s; o < e; o += CHUNK) chunks.push([o, Math.min(o + CHUNK, e)]);
+        }
+        onProgress(file.size ? done / file.size : 1);
+        const worker = async () => {
+          while (chunks.length) {
+            const [s, e] = chunks.shift();
+            for (let attempt = 1; ; attempt++) {
+              try {
+                const r = await fetch(`/api/uploads/${uploadId}?offset=${s}`, {
+                  method:'PUT', body:file.slice(s, e)
+                }).then(r => r.json());
+                if (r.status !== 'success') throw new Error(r.message);
+                break;
+              } catch (err) {
+                if (attempt >= RETRIES) throw err;
+              }
+            }
+            done += e - s;
+            onProgress(done / file.size);
+          }
         };
-        xhr.onerror=()=>this.toast('Upload error','error');
-        const fd=new FormData();
-        fd.append('path',this.path);
-        fd.append('file',file);
-        xhr.send(fd);
+        await Promise.all(Array.from({ length: PARALLEL }, worker));
+
+        const r = await json(`/api/uploads/${uploadId}/commit`, 'POST');
+        if (r.message !== 'Upload incomplete') localStorage.removeItem(key);
+        return r;
       },
-  
+
       // ── Formatters ──
       fmtSize(b){return(b/1024).toFixed(2)+' KB';},
       fmtTime(ts){return new Date(ts*1000).toLocaleString();}
@@ -0,0 +1,125 @@
+import os
+import time
+
+import pytest
+
+from dir_index import DirIndex
+
+PAST = time.time() - 60
+
+
+def settle(*dirs):
+    """Date directories in the past, so their listings can be cached."""
+    for d in dirs:
+        os.utime(d, (PAST, PAST))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    # root/a/b, 3 files of 100 + 200 + 300 bytes
+    root = tmp_path / 'root'
+    (root / 'a' / 'b').mkdir(parents=True)
+    (root / 'top.bin').write_bytes(b'x' * 100)
+    (root / 'a' / 'mid.bin').write_bytes(b'x' * 200)
+    (root / 'a' / 'b' / 'low.bin').write_bytes(b'x' * 300)
+    settle(root / 'a' / 'b', root / 'a', root)
+    return root
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_listing_is_cached_while_mtime_holds(tree):
+    index = DirIndex()
+    first = index.listing(str(tree))
+    assert index.listing(str(tree)) is first
+    assert (index.scans, index.hits) == (1, 1)
+    assert sorted(e[0] for e in first.entries) == ['a', 'top.bin']
+
+    (tree / 'new.bin').write_bytes(b'')
+    settle(tree)
+    os.utime(tree, (PAST + 1, PAST + 1))
+    assert 'new.bin' in [e[0] for e in index.listing(str(tree)).entries]
+    assert index.scans == 2
+
+
+def test_recently_changed_directory_is_not_cached(tree):
+    index = DirIndex()
+    (tree / 'new.bin').write_bytes(b'')
+    index.listing(str(tree))
+    index.listing(str(tree))
+    assert (index.scans, index.hits) == (2, 0)
+
+
+def test_page(tree):
+    index = DirIndex()
+    entries, total, _ = index.page(str(tree), sort='size', reverse=True)
+    # Folders first whatever the order
+    assert [e[0] for e in entries] == ['a', 'top.bin']
+    assert total == 2
+    entries, total, _ = index.page(str(tree), query='TOP')
+    assert [e[0] for e in entries] == ['top.bin'] and total == 1
+    assert index.page(str(tree), hidden=('a',))[1] == 1
+
+
+def test_total_size(tree):
+    index = DirIndex()
+    assert index.total_size(str(tree)) == (600, 3, 2)
+    assert index.total_size(str(tree / 'a')) == (500, 2, 1)
+    scans = index.scans
+    # Within the TTL nothing is walked again
+    assert index.total_size(str(tree)) == (600, 3, 2)
+    assert index.scans == scans
+
+
+def test_invalidate_updates_totals_above(tree):
+    index = DirIndex()
+    index.total_size(str(tree))
+    (tree / 'a' / 'b' / 'more.bin').write_bytes(b'x' * 50)
+    index.invalidate(str(tree / 'a' / 'b' / 'more.bin'))
+    assert index.total_size(str(tree)) == (650, 4, 2)
+    assert index.total_size(str(tree / 'a')) == (550, 3, 1)
+
+
+def test_expired_total_is_refreshed_in_the_background(tree):
+    index = DirIndex(size_ttl=0.05)
+    assert index.total_size(str(tree)) == (600, 3, 2)
+    scans = index.scans
+
+    # Changed by another process: no invalidate
+    (tree / 'a' / 'b' / 'more.bin').write_bytes(b'x' * 50)
+    settle(tree / 'a' / 'b')
+    os.utime(tree / 'a' / 'b', (PAST + 1, PAST + 1))
+    time.sleep(0.1)
+
+    # The expired total is answered at once, without a walk
+    assert index.total_size(str(tree)) == (600, 3, 2)
+    wait_for(lambda: index.total_size(str(tree)) == (650, 4, 2))
+    assert index.refreshes >= 1
+    # Only the changed directory was scanned again
+    assert index.scans == scans + 1
+
+
+def test_refresh_across_invalidate_is_not_kept(tree, monkeypatch):
+    index = DirIndex()
+    index.total_size(str(tree))
+    listing = index.listing
+
+    def invalidating(path):
+        # A change lands while the totals are being computed
+        result = listing(path)
+        if path == str(tree / 'a' / 'b'):
+            (tree / 'a' / 'b' / 'more.bin').write_bytes(b'x' * 50)
+            index.invalidate(str(tree / 'a' / 'b' / 'more.bin'))
+        return result
+
+    index.invalidate(str(tree / 'a' / 'b' / 'low.bin'))
+    monkeypatch.setattr(index, 'listing', invalidating)
+    index.total_size(str(tree))
+    monkeypatch.setattr(index, 'listing', listing)
+    assert index.total_size(str(tree)) == (650, 4, 2)
+
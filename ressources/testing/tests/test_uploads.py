@@ -0,0 +1,205 @@
+import hashlib
+import io
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from uploads import UploadError, UploadStore
+
+DATA = os.urandom(100_000)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / '.uploads'))
+
+
+def chunks(size, step):
+    return [(o, min(step, size - o)) for o in range(0, size, step)]
+
+
+def send(store, upload_id, offset, length, data=DATA):
+    return store.write(upload_id, offset, length, io.BytesIO(data[offset:offset + length]))
+
+
+class SlowStream:
+    """Hands out its bytes once released."""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def read(self, n):
+        self.started.set()
+        self.release.wait()
+        return self.data.read(n)
+
+
+def test_resume_after_restart(store, tmp_path):
+    upload_id = store.init('a.bin', len(DATA))
+    for offset, length in chunks(40_000, 10_000):
+        send(store, upload_id, offset, length)
+    # A new process picks the upload up from its state file
+    store = UploadStore(store.root)
+    status = store.status(upload_id)
+    assert status['received'] == [[0, 40_000]]
+    assert status['missing'] == [[40_000, len(DATA)]]
+    for start, end in status['missing']:
+        send(store, upload_id, start, end - start)
+    store.commit(upload_id, str(tmp_path / 'a.bin'))
+    assert (tmp_path / 'a.bin').read_bytes() == DATA
+
+
+def test_out_of_order_and_overlapping_chunks(store, tmp_path):
+    upload_id = store.init('a.bin', len(DATA))
+    parts = chunks(len(DATA), 7_000)
+    random.Random(4).shuffle(parts)
+    for offset, length in parts[:5]:
+        send(store, upload_id, offset, length)
+    received = store.status(upload_id)['received']
+    assert len(received) <= 5 and received == sorted(received)
+    # Resent and overlapping ranges merge
+    send(store, upload_id, 1000, 30_000)
+    for offset, length in parts[5:]:
+        send(store, upload_id, offset, length)
+    assert store.status(upload_id)['received'] == [[0, len(DATA)]]
+    store.commit(upload_id, str(tmp_path / 'a.bin'))
+    assert (tmp_path / 'a.bin').read_bytes() == DATA
+
+
+def test_truncated_chunk_keeps_what_arrived(store):
+    upload_id = store.init('a.bin', len(DATA))
+    with pytest.raises(UploadError, match='truncated'):
+        store.write(upload_id, 0, 10_000, io.BytesIO(DATA[:4_000]))
+    assert store.status(upload_id)['received'] == [[0, 4_000]]
+
+
+def test_chunk_outside_the_file(store):
+    upload_id = store.init('a.bin', 10)
+    with pytest.raises(UploadError) as e:
+        send(store, upload_id, 5, 10)
+    assert e.value.code == 416
+    with pytest.raises(UploadError) as e:
+        send(store, 'not-an-id', 0, 1)
+    assert e.value.code == 404
+
+
+def test_commit(store, tmp_path):
+    digest = 'sha256:' + hashlib.sha256(DATA).hexdigest()
+    upload_id = store.init('a.bin', len(DATA), checksum=digest)
+    send(store, upload_id, 0, 50_000)
+    with pytest.raises(UploadError) as e:
+        store.commit(upload_id, str(tmp_path / 'a.bin'))
+    assert e.value.code == 409
+    send(store, upload_id, 50_000, len(DATA) - 50_000)
+
+    (tmp_path / 'taken.bin').write_bytes(b'old')
+    with pytest.raises(UploadError) as e:
+        store.commit(upload_id, str(tmp_path / 'taken.bin'))
+    assert e.value.code == 409
+    assert (tmp_path / 'taken.bin').read_bytes() == b'old'
+
+    state = store.commit(upload_id, str(tmp_path / 'a.bin'))
+    assert state['target'] == 'a.bin'
+    assert (tmp_path / 'a.bin').read_bytes() == DATA
+    with pytest.raises(UploadError) as e:
+        store.status(upload_id)
+    assert e.value.code == 404
+    assert os.listdir(store.root) == []
+
+
+def test_checksum_mismatch_discards(store, tmp_path):
+    upload_id = store.init('a.bin', 10, checksum='sha256:' + '0' * 64)
+    send(store, upload_id, 0, 10)
+    with pytest.raises(UploadError) as e:
+        store.commit(upload_id, str(tmp_path / 'a.bin'))
+    assert e.value.code == 422
+    assert not (tmp_path / 'a.bin').exists()
+    with pytest.raises(UploadError):
+        store.status(upload_id)
+
+
+def test_commit_waits_for_writes_in_progress(store, tmp_path):
+    upload_id = store.init('a.bin', len(DATA))
+    send(store, upload_id, 0, len(DATA))
+    # The client resends the first chunk while committing
+    resent = b'y' * 1000
+    stream = SlowStream(resent)
+    errors = []
+    writer = threading.Thread(target=store.write, args=(upload_id, 0, 1000, stream))
+    writer.start()
+    stream.started.wait()
+
+    def commit():
+        try:
+            store.commit(upload_id, str(tmp_path / 'a.bin'))
+        except UploadError as e:
+            errors.append(e)
+
+    committer = threading.Thread(target=commit)
+    committer.start()
+    time.sleep(0.2)
+    assert committer.is_alive()
+    assert not (tmp_path / 'a.bin').exists()
+    stream.release.set()
+    writer.join()
+    committer.join()
+    assert not errors
+    assert (tmp_path / 'a.bin').read_bytes() == resent + DATA[1000:]
+
+    # Later writes find no upload and leave the committed file alone
+    with pytest.raises(UploadError) as e:
+        store.write(upload_id, 0, 1000, io.BytesIO(b'z' * 1000))
+    assert e.value.code == 404
+    assert (tmp_path / 'a.bin').read_bytes() == resent + DATA[1000:]
+
+
+def test_parallel_writers_in_several_processes(store):
+    # One store per process sharing the directory: only flock is shared
+    stores = [store, UploadStore(store.root), UploadStore(store.root)]
+    upload_id = store.init('a.bin', len(DATA))
+    parts = chunks(len(DATA), 1_000)
+    threads = [
+        threading.Thread(target=send, args=(stores[i % len(stores)], upload_id, o, n))
+        for i, (o, n) in enumerate(parts)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert store.status(upload_id)['missing'] == []
+
+
+def test_expire(store):
+    stale = store.init('stale.bin', 10)
+    live = store.init('live.bin', 10)
+    send(store, live, 0, 5)
+    state_path = os.path.join(store.root, stale + '.json')
+    with open(state_path) as f:
+        state = f.read()
+    with open(state_path, 'w') as f:
+        f.write(state.replace('"updated": ', '"updated": 1, "x": '))
+    store.expire()
+    with pytest.raises(UploadError):
+        store.status(stale)
+    assert store.status(live)['received'] == [[0, 5]]
+    assert not any(name.startswith(stale) for name in os.listdir(store.root))
+
+
+def test_expire_sweeps_lock_files_of_gone_uploads(store, tmp_path):
+    upload_id = store.init('a.bin', 10)
+    send(store, upload_id, 0, 10)
+    store.commit(upload_id, str(tmp_path / 'a.bin'))
+    # A late resend recreates a lock file for the committed upload
+    with pytest.raises(UploadError):
+        send(store, upload_id, 0, 10)
+    assert os.listdir(store.root) == [upload_id + '.lock']
+    store.expire()
+    assert os.listdir(store.root) == [upload_id + '.lock']
+    store.expire_seconds = -1
+    store.expire()
+    assert os.listdir(store.root) == []
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import hashlib
+from contextlib import contextmanager
+
+
+class UploadError(Exception):
+    def __init__(self, message, code=400):
+        super().__init__(message)
+        self.code = code
+
+
+class UploadStore:
+    """
+    Resumable chunked uploads.
+
+    Each upload has a part file preallocated to the final size and a JSON
+    state file listing the byte ranges received so far. Chunks are
+    written at their own offset with pwrite, so they may arrive in any
+    order and in parallel; the state is saved after every chunk, so an
+    interrupted upload (or a server restart) resumes with only the
+    missing ranges. `root` must be on the same filesystem as the served
+    tree, so that a committed file appears there atomically.
+
+    Several processes may serve the same uploads, so locking uses flock
+    on two lock files per upload. Chunk writes hold `<id>.lock` shared,
+    and commit, abort and expiry hold it exclusively, so a file is never
+    written once committed (the committed file is a hard link to the
+    part file). Updates of the state file hold `<id>.state.lock`.
+    """
+
+    BLOCK = 1024 * 1024
+
+    def __init__(self, root, expire_seconds=86400):
+        self.root = root
+        self.expire_seconds = expire_seconds
+        os.makedirs(self.root, exist_ok=True)
+
+    def _part(self, upload_id):
+        return os.path.join(self.root, upload_id + '.part')
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.root, upload_id + '.json')
+
+    def _lock_paths(self, upload_id):
+        base = os.path.join(self.root, upload_id)
+        return base + '.lock', base + '.state.lock'
+
+    @contextmanager
+    def _flock(self, path, mode):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, mode)
+            yield
+        finally:
+            os.close(fd)
+
+    def _locked(self, upload_id, mode=fcntl.LOCK_EX):
+        """Hold the upload's lock: LOCK_SH to write chunks, LOCK_EX to end it."""
+        try:
+            uuid.UUID(upload_id)
+        except ValueError:
+            raise UploadError('Unknown upload', 404)
+        return self._flock(self._lock_paths(upload_id)[0], mode)
+
+    def _load(self, upload_id):
+        try:
+            uuid.UUID(upload_id)
+            with open(self._state_path(upload_id)) as f:
+                return json.load(f)
+        except (ValueError, FileNotFoundError):
+            raise UploadError('Unknown upload', 404)
+
+    def _save(self, upload_id, state):
+        # Unique, as other processes may save the same upload
+        tmp = f'{self._state_path(upload_id)}.{uuid.uuid4().hex[:8]}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self._state_path(upload_id))
+
+    def init(self, target, size, checksum=None):
+        """Start an upload of `size` bytes to `target`; returns its id."""
+        if size < 0:
+            raise UploadError('Invalid size')
+        if checksum:
+            algo, _, digest = checksum.partition(':')
+            if algo not in hashlib.algorithms_guaranteed or not digest:
+                raise UploadError('Checksum must be "<algorithm>:<hex digest>"')
+        self.expire()
+        upload_id = str(uuid.uuid4())
+        with open(self._part(upload_id), 'wb') as f:
+            f.truncate(size)
+        self._save(upload_id, {
+            'target': target,
+            'size': size,
+            'checksum': checksum,
+            'received': [],
+            'updated': time.time(),
+        })
+        return upload_id
+
+    def status(self, upload_id):
+        state = self._load(upload_id)
+        return {
+            'upload_id': upload_id,
+            'target': state['target'],
+            'size': state['size'],
+            'received': state['received'],
+            'missing': _gaps(state['received'], state['size']),
+        }
+
+    def write(self, upload_id, offset, length, stream):
+        """Copy `length` bytes of `stream` to `offset` of the part file."""
+        # Shared: chunks are written in parallel, but not across a commit
+        with self._locked(upload_id, fcntl.LOCK_SH):
+            # Committed or aborted while this request waited: 404
+            state = self._load(upload_id)
+            if offset < 0 or length < 0 or offset + length > state['size']:
+                raise UploadError('Chunk outside the file', 416)
+            try:
+                fd = os.open(self._part(upload_id), os.O_WRONLY)
+            except FileNotFoundError:
+                raise UploadError('Unknown upload', 404)
+            try:
+                pos, end = offset, offset + length
+                while pos < end:
+                    data = stream.read(min(self.BLOCK, end - pos))
+                    if not data:
+                        break
+                    while data:
+                        written = os.pwrite(fd, data, pos)
+                        pos += written
+                        data = data[written:]
+            finally:
+                os.close(fd)
+            if pos < end:
+                # Keep what arrived; the client resends the rest
+                length = pos - offset
+            with self._flock(self._lock_paths(upload_id)[1], fcntl.LOCK_EX):
+                state = self._load(upload_id)
+                if length:
+                    state['received'] = _merge(state['received'], offset, offset + length)
+                state['updated'] = time.time()
+                self._save(upload_id, state)
+        if pos < end:
+            raise UploadError('Chunk truncated, resend the missing range')
+        return state['received']
+
+    def commit(self, upload_id, dest):
+        """
+        Verify the upload is complete (and its checksum, if one was
+        given) and atomically move it to `dest`. Returns the state.
+        """
+        # Waits for chunk writes in progress; later ones find no upload
+        with self._locked(upload_id):
+            state = self._load(upload_id)
+            if _gaps(state['received'], state['size']):
+                raise UploadError('Upload incomplete', 409)
+            part = self._part(upload_id)
+            if state['checksum']:
+                algo, _, expected = state['checksum'].partition(':')
+                h = hashlib.new(algo)
+                with open(part, 'rb') as f:
+                    for block in iter(lambda: f.read(self.BLOCK), b''):
+                        h.update(block)
+                if h.hexdigest() != expected.lower():
+                    # No way to tell which chunk is bad: start over
+                    self._discard(upload_id)
+                    raise UploadError(f'{algo} mismatch, upload discarded', 422)
+            with open(part, 'rb+') as f:
+                os.fsync(f.fileno())
+            # link() never replaces an existing file, unlike rename()
+            try:
+                os.link(part, dest)
+            except FileExistsError:
+                raise UploadError('Destination already exists', 409)
+            self._discard(upload_id)
+        return state
+
+    def _discard(self, upload_id):
+        """Remove the upload's files; called with its lock held exclusively."""
+        # The state file goes first: it is what marks the upload as live,
+        # so a request still waiting on a removed lock file finds none
+        paths = (self._state_path(upload_id), self._part(upload_id)) + self._lock_paths(upload_id)
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def abort(self, upload_id):
+        with self._locked(upload_id):
+            self._load(upload_id)
+            self._discard(upload_id)
+
+    def expire(self):
+        """
+        Drop uploads not written to for `expire_seconds`, and lock files
+        left by requests for uploads that were already gone.
+        """
+        cutoff = time.time() - self.expire_seconds
+        names = os.listdir(self.root)
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-5]
+            try:
+                # An upload being written to is not stale: skip, never wait
+                with self._locked(upload_id, fcntl.LOCK_EX | fcntl.LOCK_NB):
+                    if self._load(upload_id)['updated'] < cutoff:
+                        self._discard(upload_id)
+            except (UploadError, ValueError, KeyError, BlockingIOError):
+                continue
+        live = set(os.listdir(self.root))
+        for name in names:
+            if not name.endswith('.lock'):
+                continue
+            upload_id = name.split('.', 1)[0]
+            if upload_id + '.json' in live:
+                continue
+            # A request still holding it finds no upload and fails anyway
+            try:
+                if os.path.getmtime(os.path.join(self.root, name)) < cutoff:
+                    os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+
+
+def _merge(ranges, start, end):
+    """Insert [start, end) into sorted disjoint [start, end) ranges."""
+    merged = []
+    for s, e in ranges:
+        if e < start or s > end:
+            merged.append([s, e])
+        else:
+            start, end = min(s, start), max(e, end)
+    merged.append([start, end])
+    merged.sort()
+    return merged
+
+
+def _gaps(ranges, size):
+    gaps = []
+    pos = 0
+    for s, e in ranges:
+        if s > pos:
+            gaps.append([pos, s])
+        pos = max(pos, e)
+    if pos < size:
+        gaps.append([pos, size])
+    return gaps